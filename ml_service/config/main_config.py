@@ -1,3 +1,4 @@
+import os
 import pathlib
 
 # Base project directory
@@ -11,9 +12,13 @@ PROCESSED_DATA_DIR = DATA_DIR / "processed"
 # Original dataset file name (assuming CSV for now)
 # Please change this if your dataset has a different name or format
 RAW_DATASET_FILENAME = "smart_contracts_dataset.csv" # Пример
-PROCESSED_DATASET_FILENAME = "processed_contracts.csv"
-TRAIN_DATASET_FILENAME = "train_contracts.csv"
-TEST_DATASET_FILENAME = "test_contracts.csv"
+# Processed data and splits: "parquet" (column projection, pyarrow strings, resumable row groups),
+# "feather" or "csv"; src/data_processing/loader.py reads all three by extension
+PROCESSED_DATA_FORMAT = "parquet"
+PARQUET_ROW_GROUP_SIZE = 10000  # Rows per Parquet row group (unit of skipping when a stream is resumed)
+PROCESSED_DATASET_FILENAME = f"processed_contracts.{PROCESSED_DATA_FORMAT}"
+TRAIN_DATASET_FILENAME = f"train_contracts.{PROCESSED_DATA_FORMAT}"
+TEST_DATASET_FILENAME = f"test_contracts.{PROCESSED_DATA_FORMAT}"
 
 
 # Column names from the input data
@@ -48,16 +53,78 @@ LOGS_DIR = BASE_DIR / "logs"
 MLFLOW_TRACKING_URI = "sqlite:///" + str(BASE_DIR / "mlflow.db") # Example for local MLflow tracking
 EXPERIMENT_NAME = "SmartContractVulnerabilityDetection"
 
+# Full training checkpoints (model, optimizer, scheduler, RNG, sampler position) for resume
+CHECKPOINT_DIR = MODEL_DIR / "checkpoints"
+CHECKPOINT_EVERY_N_STEPS = 500  # Optimizer steps between periodic checkpoints (plus one at every epoch end)
+CHECKPOINT_KEEP_LAST = 3
+
+# Distillation (scripts/run_train.py --teacher-path ...): a truncated student of the same encoder
+STUDENT_NUM_HIDDEN_LAYERS = 6
+STUDENT_BASE_MODEL = None  # None - truncate the teacher's encoder; otherwise a smaller RoBERTa with the same vocabulary
+STUDENT_MODEL_PATH = MODEL_DIR / f"vuln_classifier_microsoft_codebert-base_chunks_student_l{STUDENT_NUM_HIDDEN_LAYERS}.pt"
+
 # Preprocessing parameters
 MAX_TOTAL_TOKENS = 4096  # Max total tokens from a contract to consider before chunking (was MAX_CODE_LENGTH)
 MODEL_CHUNK_SIZE = 512   # The size of chunks we'll feed into the base model (e.g., CodeBERT's limit)
 CHUNK_OVERLAP = 64       # Number of tokens to overlap between chunks (helps maintain context)
 
+# Chunked (tokenized) datasets built by scripts/run_build_chunks.py
+CHUNKED_DATA_DIR = PROCESSED_DATA_DIR / "chunked_data"
+CHUNK_SHARD_SIZE = 8192  # Chunks per shard file
+
+# Chunk -> contract aggregation, shared by validation (contract_* metrics) and the API response
+CHUNK_AGGREGATION = "max"      # "max", "mean", "topk_mean" or "noisy_or" (see src/modeling/aggregation.py)
+CHUNK_AGGREGATION_TOP_K = 3    # Chunks averaged by "topk_mean"
+CONTRACT_THRESHOLD = 0.5       # A vulnerability is reported when the aggregated probability exceeds this
+
 TEST_SET_SIZE = 0.2
 RANDOM_STATE = 42
+PREPROCESS_BATCH_SIZE = 10000  # Raw contracts per step of scripts/run_preprocess_data.py (bounds its memory)
+PREPROCESS_N_JOBS = 1               # Processes stripping comments in preprocess_dataframe (1 - in-process)
+PREPROCESS_CLEAN_CHUNK_SIZE = 1000  # Contracts per process-pool task when cleaning code
 
 # Add other configurations as needed:
 # - Tokenizer paths/names
 # - Embedding dimensions
 # - Model hyperparameters
-# - API settings 
\ No newline at end of file
+# - API settings
+
+# Inference service (src/api) settings
+INFERENCE_BACKEND = "torch"       # "torch" or "onnxruntime" (ONNX export from scripts/run_export_model.py)
+INFERENCE_SERVE_STUDENT = False   # Serve STUDENT_MODEL_PATH (and its variants) instead of the full model
+INFERENCE_MODEL_VARIANT = "fp32"  # "fp32", "int8", "torchscript" or "int8_torchscript" (scripts/run_export_model.py)
+INFERENCE_TORCH_COMPILE = False   # torch.compile the encoder on load (fp32/int8 only; slow first requests)
+# Encoder config + tokenizer saved by scripts/run_export_model.py --offline-assets; when the directory
+# exists the service builds the model and tokenizer from it and never contacts the Hugging Face hub
+INFERENCE_OFFLINE_ASSETS_DIR = MODEL_DIR / "offline_assets"
+INFERENCE_LOAD_IN_BACKGROUND = True  # Accept connections while the model loads (/api/health/ready says 503)
+INFERENCE_MAX_BATCH_SIZE = 32  # Max number of chunks the micro-batcher packs into one forward pass
+INFERENCE_MAX_WAIT_MS = 10.0   # Max time a request waits for co-travellers before a partial batch is run
+
+# Batch endpoint (POST /api/analyze/batch): chunks of many contracts packed into full model batches
+INFERENCE_BATCH_MAX_CONTRACTS = 5000   # Contracts per request; larger scans are split by the client
+INFERENCE_BATCH_TOKENIZE_GROUP = 64    # Contracts tokenized per call while earlier batches are scored
+INFERENCE_BATCH_MAX_IN_FLIGHT = 4      # Packed batches queued in the micro-batcher per request
+
+# Early exit: a contract's chunks are scored group by group and the rest is skipped once the
+# thresholded CHUNK_AGGREGATION result can no longer change (same response, fewer encoder passes)
+INFERENCE_EARLY_EXIT = False
+INFERENCE_EARLY_EXIT_GROUP_SIZE = 2        # Chunks per submit; smaller saves more compute, adds round trips
+INFERENCE_EARLY_EXIT_ORDER = "sequential"  # "sequential" or "longest_first"
+
+# Bounded worker pool behind the async analyze endpoint
+INFERENCE_WORKER_MODE = "thread"   # "thread" (shared model) or "process" (each worker holds its own model)
+INFERENCE_NUM_WORKERS = 2
+INFERENCE_THREADS_PER_WORKER = max(1, (os.cpu_count() or 1) // INFERENCE_NUM_WORKERS)  # torch/ONNX threads per worker process ("process" mode)
+INFERENCE_MAX_QUEUE_SIZE = 32      # Requests allowed to wait for a busy worker; beyond that the API answers 429
+
+# Content-addressed cache of analysis results
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024         # In-memory LRU tier size cap
+RESULT_CACHE_TTL_SECONDS = 24 * 60 * 60
+RESULT_CACHE_SQLITE_PATH = None                   # e.g. BASE_DIR / "cache" / "results.sqlite3" to survive restarts
+RESULT_CACHE_DISK_MAX_BYTES = 1024 * 1024 * 1024  # SQLite tier size cap
+
+# Per-chunk CLS embedding cache (reuses encoder work across near-duplicate contracts)
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_MAX_BYTES = 256 * 1024 * 1024  # ~85k CodeBERT-base chunks (768 x float32)
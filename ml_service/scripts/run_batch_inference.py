@@ -0,0 +1,237 @@
+import argparse
+import collections
+import multiprocessing
+import os
+import pathlib
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import torch
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.api.backends import BACKENDS, OnnxRuntimeBackend, TorchBackend
+from src.api.result_cache import checkpoint_fingerprint
+from src.data_processing.loader import dataset_columns, iter_dataset
+from src.feature_engineering.chunk_shards import read_manifest, write_manifest
+from src.feature_engineering.tokenization import get_tokenizer, tokenize_and_chunk_batch
+from src.modeling.aggregation import AGGREGATORS, aggregate_segments
+from src.modeling.export import MODEL_VARIANTS, load_inference_model, onnx_model_path, variant_path
+
+# Манифест с префиксом "_": pyarrow/pandas пропускают его при чтении каталога как датасета
+MANIFEST_FILENAME = "_manifest.json"
+
+# Токенизатор процесса-воркера
+_worker_tokenizer = None
+
+
+def _init_worker(tokenizer_name: str) -> None:
+    global _worker_tokenizer
+    # Параллелим процессами; внутренний пул потоков Rust-токенизатора только мешал бы
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _worker_tokenizer = get_tokenizer(tokenizer_name)
+
+
+def _tokenize_rows(codes, max_total_tokens: int, chunk_size: int, overlap: int):
+    """Chunks a block of contracts in a worker. Returns (input_ids int32, lengths, chunk counts per contract)."""
+    codes = [code if isinstance(code, str) else "" for code in codes]
+    batch = tokenize_and_chunk_batch(codes, _worker_tokenizer, max_total_tokens, chunk_size, overlap)
+    input_ids = batch['input_ids'].numpy().astype(np.int32)
+    lengths = batch['attention_mask'].sum(dim=1).numpy()
+    counts = np.diff(batch['offsets'].numpy())
+    return input_ids, lengths, counts
+
+
+def score_chunks(predict_fn, input_ids: np.ndarray, lengths: np.ndarray, batch_size: int) -> torch.Tensor:
+    """Scores chunks in batches of similar length (less padding); returns probabilities in input order."""
+    order = np.argsort(-lengths, kind="stable")
+    probs = None
+    for start in range(0, len(order), batch_size):
+        rows = order[start:start + batch_size]
+        width = max(int(lengths[rows].max()), 1)
+        ids = torch.from_numpy(input_ids[rows, :width].astype(np.int64))
+        mask = (torch.arange(width).unsqueeze(0) < torch.from_numpy(lengths[rows]).unsqueeze(1)).long()
+        batch_probs = predict_fn(ids, mask)
+        if probs is None:
+            probs = torch.empty((len(order), batch_probs.shape[1]), dtype=torch.float32)
+        probs[torch.from_numpy(rows)] = batch_probs.float()
+    return probs
+
+
+def build_part(row_start: int, addresses, results, predict_fn, args, label_names: List[str]) -> pa.Table:
+    """Per-contract probabilities of one row group: CHUNK_AGGREGATION over the chunks of every contract."""
+    input_ids = np.concatenate([r[0] for r in results])
+    lengths = np.concatenate([r[1] for r in results])
+    counts = np.concatenate([r[2] for r in results])
+    num_rows = len(counts)
+    offsets = torch.from_numpy(np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+
+    contract_probs = np.full((num_rows, len(label_names)), np.nan, dtype=np.float32)
+    if len(input_ids):
+        chunk_probs = score_chunks(predict_fn, input_ids, lengths, args.batch_size)
+        scores = aggregate_segments(chunk_probs, offsets, method=args.aggregation, top_k=args.top_k).numpy()
+        has_chunks = counts > 0
+        contract_probs[has_chunks] = scores[has_chunks]  # Контракты без чанков - NaN, а не 0
+
+    columns = {"row_index": pa.array(np.arange(row_start, row_start + num_rows, dtype=np.int64))}
+    if addresses is not None:
+        columns[main_config.ADDRESS_COLUMN] = pa.array(addresses, type=pa.string())
+    columns["num_chunks"] = pa.array(counts.astype(np.int32))
+    for i, name in enumerate(label_names):
+        columns[f"prob_{name}"] = pa.array(contract_probs[:, i])
+    for i, name in enumerate(label_names):
+        columns[f"pred_{name}"] = pa.array(contract_probs[:, i] > args.threshold)
+    return pa.table(columns)
+
+
+def write_part(output_dir: pathlib.Path, part_index: int, table: pa.Table) -> str:
+    name = f"part-{part_index:05d}.parquet"
+    tmp_path = output_dir / f".{name}.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, output_dir / name)
+    return name
+
+
+def create_predict_fn(args):
+    """Returns (predict_fn, artifact path) for the chosen backend and model variant."""
+    if args.backend == "onnxruntime":
+        backend = OnnxRuntimeBackend(onnx_model_path(args.model_path), num_threads=args.threads)
+    else:
+        device = torch.device(args.device)
+        model = load_inference_model(args.model_path, args.base_model, len(main_config.VULNERABILITY_COUNT_COLUMNS),
+                                     variant=args.variant, device=device)
+        backend = TorchBackend(model, device, artifact_path=variant_path(args.model_path, args.variant))
+    return backend.predict_probs, backend.artifact_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score a whole CSV/Parquet/Feather corpus of contracts offline. Results go to Parquet part files "
+                    "in --output-dir (one per row group); an interrupted run resumes after the last written part."
+    )
+    parser.add_argument("--input", required=True,
+                        help="CSV, Parquet or Feather file with the sourcecode (and address) columns.")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--base-model", default="microsoft/codebert-base")
+    parser.add_argument("--model-path",
+                        default=str(main_config.MODEL_DIR / "vuln_classifier_microsoft_codebert-base_chunks_best.pt"))
+    parser.add_argument("--backend", default="torch", choices=BACKENDS)
+    parser.add_argument("--variant", default="fp32", choices=MODEL_VARIANTS)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--rows-per-group", type=int, default=2048, help="Contracts per output row group / part file.")
+    parser.add_argument("--rows-per-task", type=int, default=256, help="Contracts tokenized per worker task.")
+    parser.add_argument("--prefetch-groups", type=int, default=1,
+                        help="Row groups tokenized ahead of the one being scored.")
+    parser.add_argument("--num-workers", type=int, default=max(1, (os.cpu_count() or 1) // 4),
+                        help="Tokenizer processes.")
+    parser.add_argument("--threads", type=int, default=None, help="torch/ONNX Runtime threads for the forward pass.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks per forward pass.")
+    parser.add_argument("--aggregation", default=main_config.CHUNK_AGGREGATION, choices=AGGREGATORS)
+    parser.add_argument("--top-k", type=int, default=main_config.CHUNK_AGGREGATION_TOP_K)
+    parser.add_argument("--threshold", type=float, default=main_config.CONTRACT_THRESHOLD)
+    parser.add_argument("--overwrite", action="store_true", help="Discard existing parts instead of resuming.")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    input_path = pathlib.Path(args.input)
+    output_dir = pathlib.Path(args.output_dir)
+    if args.overwrite and output_dir.exists():
+        shutil.rmtree(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    predict_fn, artifact_path = create_predict_fn(args)
+    available = dataset_columns(input_path.name, input_path.parent)
+    if main_config.SOURCE_CODE_COLUMN not in available:
+        print(f"ERROR: column '{main_config.SOURCE_CODE_COLUMN}' not found in {input_path}.")
+        sys.exit(1)
+    has_address = main_config.ADDRESS_COLUMN in available
+    columns = [main_config.SOURCE_CODE_COLUMN] + ([main_config.ADDRESS_COLUMN] if has_address else [])
+    label_names = [column.lower() for column in main_config.VULNERABILITY_COUNT_COLUMNS]
+
+    params = {
+        "input": str(input_path.resolve()),
+        "model": checkpoint_fingerprint(artifact_path),
+        "backend": args.backend,
+        "tokenizer": args.base_model,
+        "max_total_tokens": main_config.MAX_TOTAL_TOKENS,
+        "chunk_size": main_config.MODEL_CHUNK_SIZE,
+        "overlap": main_config.CHUNK_OVERLAP,
+        "aggregation": args.aggregation,
+        "top_k": args.top_k,
+        "threshold": args.threshold,
+    }
+    manifest = read_manifest(output_dir, MANIFEST_FILENAME)
+    if manifest is not None:
+        mismatched = [key for key, value in params.items() if manifest.get(key) != value]
+        if mismatched:
+            print(f"ERROR: existing results in {output_dir} were produced with different {mismatched}. "
+                  f"Use --overwrite to start over.")
+            sys.exit(1)
+        if manifest["complete"]:
+            print(f"Already complete: {manifest['next_row']} contracts in {len(manifest['parts'])} parts.")
+            return
+        print(f"Resuming from row {manifest['next_row']} ({len(manifest['parts'])} parts already written).")
+    else:
+        manifest = dict(params, parts=[], next_row=0, complete=False)
+
+    row_start = manifest["next_row"]
+    frames = iter_dataset(input_path.name, input_path.parent, columns_to_load=columns,
+                          batch_size=args.rows_per_group, skip_rows=row_start)
+    started = time.perf_counter()
+    scored = 0
+
+    def consume(group) -> None:
+        nonlocal scored
+        group_start, addresses, futures = group
+        table = build_part(group_start, addresses, [future.result() for future in futures],
+                           predict_fn, args, label_names)
+        manifest["parts"].append(write_part(output_dir, len(manifest["parts"]), table))
+        manifest["next_row"] = group_start + table.num_rows
+        # Манифест пишется после файла части: прерывание между ними лишь перезапишет ту же часть
+        write_manifest(output_dir, manifest, MANIFEST_FILENAME)
+        scored += table.num_rows
+        elapsed = time.perf_counter() - started
+        print(f"rows {group_start}-{manifest['next_row'] - 1}: {scored / elapsed:.1f} contracts/s")
+
+    print(f"--- Scoring {input_path} -> {output_dir} ({args.backend}, {args.variant}) ---")
+    with ProcessPoolExecutor(max_workers=args.num_workers,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(args.base_model,)) as executor:
+        # Конвейер: воркеры токенизируют следующие группы, пока основной процесс считает текущую
+        pending = collections.deque()
+        for frame in frames:
+            codes = frame[main_config.SOURCE_CODE_COLUMN].tolist()
+            futures = [
+                executor.submit(_tokenize_rows, codes[i:i + args.rows_per_task], main_config.MAX_TOTAL_TOKENS,
+                                main_config.MODEL_CHUNK_SIZE, main_config.CHUNK_OVERLAP)
+                for i in range(0, len(codes), args.rows_per_task)
+            ]
+            addresses = ([None if pd.isna(address) else str(address) for address in frame[main_config.ADDRESS_COLUMN]]
+                         if has_address else None)
+            pending.append((row_start, addresses, futures))
+            row_start += len(frame)
+            while len(pending) > args.prefetch_groups:
+                consume(pending.popleft())
+        while pending:
+            consume(pending.popleft())
+
+    manifest["complete"] = True
+    write_manifest(output_dir, manifest, MANIFEST_FILENAME)
+    print(f"Done: {manifest['next_row']} contracts in {len(manifest['parts'])} parts in {output_dir} "
+          f"(read with pd.read_parquet('{output_dir}')).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.feature_engineering.tokenization import (
+    get_tokenizer,
+    tokenize_and_chunk_batch,
+    tokenize_and_chunk_code,
+    _tokenize_and_chunk_code_reencode,
+)
+
+# Фрагмент "реального" Solidity-кода, из которого собираются синтетические контракты нужной длины
+SOLIDITY_SNIPPET = """
+    function transferFrom(address from, address to, uint256 value) public returns (bool) {
+        require(value <= balances[from], "insufficient balance");
+        require(value <= allowed[from][msg.sender], "insufficient allowance"); // check allowance
+        balances[from] = balances[from].sub(value);
+        balances[to] = balances[to].add(value);
+        allowed[from][msg.sender] = allowed[from][msg.sender].sub(value);
+        emit Transfer(from, to, value);
+        return true;
+    }
+"""
+
+
+def build_contracts(tokenizer, num_contracts: int, target_tokens: int):
+    """Builds `num_contracts` distinct synthetic contracts of at least `target_tokens` tokens each."""
+    snippet_tokens = len(tokenizer(SOLIDITY_SNIPPET, add_special_tokens=False)['input_ids'])
+    repeats = target_tokens // max(snippet_tokens, 1) + 1
+    contracts = []
+    for i in range(num_contracts):
+        body = SOLIDITY_SNIPPET.replace("transferFrom", f"transferFrom{i}") * repeats
+        contracts.append(f"pragma solidity ^0.4.24;\ncontract Token{i} {{\n{body}}}\n")
+    return contracts
+
+
+def check_parity(tokenizer, code: str, max_total_tokens: int, chunk_size: int, overlap: int) -> dict:
+    """
+    Checks the ID chunker against the source tokenization and compares it with the legacy chunker.
+
+    Returns a dict with chunk counts and the share of content positions where legacy and new chunks agree.
+    Raises RuntimeError if the new chunks do not reproduce the contract's token stream exactly.
+    """
+    expected = tokenizer(code, add_special_tokens=False, truncation=True,
+                         max_length=max_total_tokens - 2)['input_ids']
+    new_chunks = tokenize_and_chunk_code(code, tokenizer, max_total_tokens, chunk_size, overlap)
+    legacy_chunks = _tokenize_and_chunk_code_reencode(code, tokenizer, max_total_tokens, chunk_size, overlap)
+
+    stride = chunk_size - overlap
+    rebuilt = []
+    for k, chunk in enumerate(new_chunks):
+        length = int(chunk['attention_mask'].sum())
+        ids = chunk['input_ids'][:length].tolist()
+        if ids[0] != tokenizer.cls_token_id or ids[-1] != tokenizer.sep_token_id:
+            raise RuntimeError(f"chunk {k}: missing special tokens")
+        if any(t != tokenizer.pad_token_id for t in chunk['input_ids'][length:].tolist()):
+            raise RuntimeError(f"chunk {k}: bad padding")
+        content = ids[1:-1]
+        if content != expected[k * stride:k * stride + len(content)]:
+            raise RuntimeError(f"chunk {k} drifts from source tokens")
+        rebuilt = rebuilt[:k * stride] + content
+    if rebuilt != expected:
+        raise RuntimeError("chunks do not cover the source token stream")
+
+    matched, compared = 0, 0
+    for new, legacy in zip(new_chunks, legacy_chunks):
+        new_ids = new['input_ids'][new['attention_mask'].bool()].tolist()
+        legacy_ids = legacy['input_ids'][legacy['attention_mask'].bool()].tolist()
+        compared += max(len(new_ids), len(legacy_ids))
+        matched += sum(a == b for a, b in zip(new_ids, legacy_ids))
+    return {
+        "new_chunks": len(new_chunks),
+        "legacy_chunks": len(legacy_chunks),
+        "matched": matched,
+        "compared": compared,
+    }
+
+
+def time_chunker(chunker, contracts, tokenizer, repeats: int, **kwargs) -> float:
+    """Returns the best wall time (seconds) over `repeats` passes through all contracts."""
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for code in contracts:
+            chunker(code, tokenizer, **kwargs)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity check and microbenchmark of the ID-based chunker.")
+    parser.add_argument("--tokenizer", default="microsoft/codebert-base")
+    parser.add_argument("--num-contracts", type=int, default=100)
+    parser.add_argument("--target-tokens", type=int, default=main_config.MAX_TOTAL_TOKENS)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    tokenizer = get_tokenizer(args.tokenizer)
+    contracts = build_contracts(tokenizer, args.num_contracts, args.target_tokens)
+    params = dict(
+        max_total_tokens=main_config.MAX_TOTAL_TOKENS,
+        chunk_size=main_config.MODEL_CHUNK_SIZE,
+        overlap=main_config.CHUNK_OVERLAP,
+    )
+    print(f"Contracts: {len(contracts)}, ~{args.target_tokens} tokens each. Params: {params}")
+
+    print("\n--- Parity ---")
+    same_count, matched, compared = 0, 0, 0
+    for code in contracts:
+        result = check_parity(tokenizer, code, **params)
+        same_count += result["new_chunks"] == result["legacy_chunks"]
+        matched += result["matched"]
+        compared += result["compared"]
+    print("New chunks reproduce the source token stream exactly: OK")
+    print(f"Same number of chunks as legacy chunker: {same_count}/{len(contracts)}")
+    print(f"Token positions agreeing with legacy chunks: {matched / max(compared, 1):.2%} "
+          f"(legacy re-encoding shifts windows and re-tokenizes decoded text)")
+
+    batch = tokenize_and_chunk_batch(contracts, tokenizer, **params)
+    for i, code in enumerate(contracts):
+        single = tokenize_and_chunk_code(code, tokenizer, **params)
+        rows = slice(int(batch['offsets'][i]), int(batch['offsets'][i + 1]))
+        if not torch.equal(batch['input_ids'][rows], torch.stack([c['input_ids'] for c in single])):
+            raise RuntimeError(f"batched chunks differ from single-contract chunks for contract {i}")
+    print("Batched chunker matches the per-contract chunker: OK")
+
+    print("\n--- Timing (best of {}) ---".format(args.repeats))
+    legacy_s = time_chunker(_tokenize_and_chunk_code_reencode, contracts, tokenizer, args.repeats, **params)
+    new_s = time_chunker(tokenize_and_chunk_code, contracts, tokenizer, args.repeats, **params)
+    print(f"Legacy (decode -> re-encode): {legacy_s * 1000 / len(contracts):.2f} ms/contract")
+    print(f"ID chunker:                   {new_s * 1000 / len(contracts):.2f} ms/contract")
+    print(f"Speedup: {legacy_s / new_s:.1f}x")
+
+    batch_s = float("inf")
+    for _ in range(args.repeats):
+        started = time.perf_counter()
+        tokenize_and_chunk_batch(contracts, tokenizer, **params)
+        batch_s = min(batch_s, time.perf_counter() - started)
+    print(f"Batched ID chunker:           {batch_s * 1000 / len(contracts):.2f} ms/contract "
+          f"({legacy_s / batch_s:.1f}x vs legacy)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.data_processing.loader import load_dataset
+from src.data_processing.preprocessing import clean_code_column, clean_solidity_code
+
+_SINGLE_LINE = re.compile(r"//.*")
+_MULTI_LINE = re.compile(r"/\*.*?\*/", flags=re.DOTALL)
+_WHITESPACE = re.compile(r"\s+")
+
+# Фрагменты, на которых старая и новая очистка расходятся или которые дороги для regex
+_STATEMENTS = (
+    "balances[msg.sender] -= amount; // effects before interactions\n",
+    "(bool ok, ) = msg.sender.call{value: amount}(\"\");\n",
+    "require(block.timestamp > unlockTime, \"locked // until unlock\");\n",
+    "string public constant URI = \"https://example.com/metadata/\";\n",
+    "/* owner-only\n * see https://docs.soliditylang.org/ */ require(msg.sender == owner);\n",
+    "/// @notice Emits a transfer event\n    emit Transfer(from, to, value);\n",
+    "bytes memory path = abi.encodePacked('/*', name, '*/');\n",
+)
+
+
+def regex_clean_solidity_code(code: str) -> str:
+    """The previous three-pass cleaner (strips "//" inside string literals as well)."""
+    if not isinstance(code, str):
+        return ""
+    code = _SINGLE_LINE.sub("", code)
+    code = _MULTI_LINE.sub("", code)
+    code = _WHITESPACE.sub(" ", code)
+    return code.strip()
+
+
+def synthetic_contracts(num_contracts: int, code_bytes: int) -> list:
+    """Solidity-like contracts of about `code_bytes` characters with comments, URLs and string literals."""
+    rng = np.random.default_rng(main_config.RANDOM_STATE)
+    codes = []
+    for row in range(num_contracts):
+        body = []
+        size = 0
+        while size < code_bytes * rng.uniform(0.3, 1.7):
+            statement = f"    function f{len(body)}(uint amount) public {{\n        {rng.choice(_STATEMENTS)}    }}\n"
+            body.append(statement)
+            size += len(statement)
+        codes.append(f"// SPDX-License-Identifier: MIT\npragma solidity ^0.8.0;\n"
+                     f"/**\n * @title C{row}\n */\ncontract C{row} {{\n{''.join(body)}}}\n")
+    return codes
+
+
+def load_contracts(num_contracts: int, code_bytes: int) -> list:
+    """Raw contracts from RAW_DATASET_FILENAME when it exists, otherwise a synthetic corpus."""
+    try:
+        df = load_dataset(main_config.RAW_DATASET_FILENAME, main_config.RAW_DATA_DIR,
+                          columns_to_load=[main_config.SOURCE_CODE_COLUMN], nrows=num_contracts,
+                          pyarrow_strings=False)
+        codes = df[main_config.SOURCE_CODE_COLUMN].tolist()
+        print(f"Loaded {len(codes)} contracts from {main_config.RAW_DATA_DIR / main_config.RAW_DATASET_FILENAME}")
+        return codes
+    except FileNotFoundError:
+        codes = synthetic_contracts(num_contracts, code_bytes)
+        print(f"Raw dataset not found, generated {len(codes)} synthetic contracts")
+        return codes
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Throughput of Solidity comment stripping: the previous regex passes vs the single-pass "
+                    "lexer, in-process and across a process pool."
+    )
+    parser.add_argument("--num-contracts", type=int, default=10000)
+    parser.add_argument("--code-bytes", type=int, default=8000,
+                        help="Mean contract length for the synthetic corpus.")
+    parser.add_argument("--n-jobs", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1],
+                        help="Process pool sizes to measure the lexer with.")
+    parser.add_argument("--chunk-size", type=int, default=main_config.PREPROCESS_CLEAN_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    codes = load_contracts(args.num_contracts, args.code_bytes)
+    megabytes = sum(len(code) for code in codes if isinstance(code, str)) / 2**20
+    series = pd.Series(codes, dtype=object)
+    print(f"Corpus: {len(codes)} contracts, {megabytes:.1f} MB of source\n")
+
+    regex_seconds, regex_cleaned = timed(lambda: [regex_clean_solidity_code(code) for code in codes])
+    results = [("regex, 1 process", regex_seconds)]
+    lexer_seconds, lexer_cleaned = timed(lambda: [clean_solidity_code(code) for code in codes])
+    results.append(("lexer, 1 process", lexer_seconds))
+    for n_jobs in sorted(set(args.n_jobs)):
+        if n_jobs <= 1:
+            continue
+        # Время включает запуск пула: так его платит один вызов preprocess_dataframe
+        seconds, parallel = timed(lambda: clean_code_column(series, n_jobs=n_jobs, chunk_size=args.chunk_size))
+        if parallel.tolist() != lexer_cleaned:
+            print(f"ERROR: {n_jobs} processes produced a different result than the in-process lexer.")
+            sys.exit(1)
+        results.append((f"lexer, {n_jobs} processes", seconds))
+
+    print(f"{'cleaner':<22} {'seconds':>8} {'contracts/s':>12} {'MB/s':>8} {'speedup':>8}")
+    for name, seconds in results:
+        print(f"{name:<22} {seconds:>8.2f} {len(codes) / seconds:>12.0f} {megabytes / seconds:>8.1f} "
+              f"{regex_seconds / seconds:>7.1f}x")
+
+    # Расхождения: ожидаемы там, где "//" или "/*" стоят внутри строкового литерала
+    differing = [i for i, (old, new) in enumerate(zip(regex_cleaned, lexer_cleaned)) if old != new]
+    print(f"\nContracts cleaned differently by regex and lexer: {len(differing)} of {len(codes)}")
+    if differing:
+        old, new = regex_cleaned[differing[0]], lexer_cleaned[differing[0]]
+        at = next((i for i, (a, b) in enumerate(zip(old, new)) if a != b), min(len(old), len(new)))
+        print(f"First difference (contract {differing[0]}, char {at}):\n"
+              f"  regex: {old[max(0, at - 60):at + 60]!r}\n"
+              f"  lexer: {new[max(0, at - 60):at + 60]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+
+# Способы построить модель из fp32 чекпоинта, от прежнего к новому
+LOAD_MODES = ("pretrained", "from_config", "meta_mmap")
+
+
+def run_mode(args) -> None:
+    """Runs inside a fresh subprocess: import, model build and first forward pass of one load mode."""
+    started = time.perf_counter()
+    import torch
+    from src.modeling.export import build_model_from_checkpoint
+    from src.modeling.models import ContractVulnerabilityClassifier
+    imported = time.perf_counter()
+
+    num_labels = len(main_config.VULNERABILITY_COUNT_COLUMNS)
+    if args.mode == "meta_mmap":
+        model = build_model_from_checkpoint(args.model_path, args.base_model, num_labels)
+    else:
+        # Прежний путь: предобученные (или случайные) веса, затем полный torch.load и копирование
+        model = ContractVulnerabilityClassifier(base_model_name=args.base_model, num_labels=num_labels,
+                                                pretrained=args.mode == "pretrained")
+        model.load_state_dict(torch.load(args.model_path, map_location="cpu"))
+    model.eval()
+    loaded = time.perf_counter()
+
+    input_ids = torch.randint(3, 50000, (1, main_config.MODEL_CHUNK_SIZE))
+    with torch.no_grad():
+        model(input_ids, torch.ones_like(input_ids))
+    first_forward = time.perf_counter()
+
+    print(json.dumps({
+        "import_s": imported - started,
+        "load_s": loaded - imported,
+        "first_forward_s": first_forward - loaded,
+        "total_s": first_forward - started,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # ru_maxrss в КБ на Linux
+    }))
+
+
+def time_service_ready(port: int, timeout: float) -> dict:
+    """Starts the API under uvicorn and polls /api/health/live and /api/health/ready."""
+    command = [sys.executable, "-m", "uvicorn", "src.api.fastapi_service:app", "--port", str(port), "--log-level", "warning"]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=parent_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    result = {"live_s": None, "ready_s": None}
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                result["error"] = process.stderr.read().decode(errors="replace")[-2000:]
+                break
+            for name in ("live", "ready"):
+                if result[f"{name}_s"] is not None:
+                    continue
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health/{name}", timeout=1) as response:
+                        if response.status == 200:
+                            result[f"{name}_s"] = time.perf_counter() - started
+                except (urllib.error.URLError, ConnectionError, TimeoutError):
+                    pass
+            if result["ready_s"] is not None:
+                break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start time and peak RSS of the inference model load paths.")
+    parser.add_argument("--base-model", default="microsoft/codebert-base",
+                        help="Hub name or a local config dir (INFERENCE_OFFLINE_ASSETS_DIR).")
+    parser.add_argument("--model-path",
+                        default=str(main_config.MODEL_DIR / "vuln_classifier_microsoft_codebert-base_chunks_best.pt"))
+    parser.add_argument("--modes", nargs="+", default=list(LOAD_MODES), choices=LOAD_MODES)
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per mode (the page cache is warm after the first).")
+    parser.add_argument("--with-service", action="store_true", help="Also time the API until /api/health/ready.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    # Внутренний аргумент дочернего процесса
+    parser.add_argument("--child-mode", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_mode:
+        args.mode = args.child_mode
+        run_mode(args)
+        return
+
+    print(f"Checkpoint: {args.model_path} ({os.path.getsize(args.model_path) / 2**20:.0f} MB), base: {args.base_model}")
+    print(f"\n{'mode':<12} {'run':>4} {'import, s':>10} {'load, s':>8} {'1st fwd, s':>11} {'total, s':>9} {'peak RSS, MB':>13}")
+    for mode in args.modes:
+        for run in range(args.repeats):
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child-mode", mode,
+                 "--base-model", args.base_model, "--model-path", args.model_path],
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                print(f"{mode:<12} {run:>4} FAILED\n{completed.stderr[-2000:]}")
+                break
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(f"{mode:<12} {run:>4} {result['import_s']:>10.2f} {result['load_s']:>8.2f} "
+                  f"{result['first_forward_s']:>11.2f} {result['total_s']:>9.2f} {result['peak_rss_mb']:>13.0f}")
+
+    if args.with_service:
+        result = time_service_ready(args.port, args.timeout)
+        if "error" in result:
+            print(f"\nService exited before becoming ready:\n{result['error']}")
+        else:
+            live = f"{result['live_s']:.2f}s" if result["live_s"] is not None else "timeout"
+            ready = f"{result['ready_s']:.2f}s" if result["ready_s"] is not None else "timeout"
+            print(f"\nService ({main_config.INFERENCE_BACKEND}, {main_config.INFERENCE_MODEL_VARIANT}, "
+                  f"{main_config.INFERENCE_WORKER_MODE} workers): live after {live}, ready after {ready}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.feature_engineering.chunk_shards import convert_pt_to_memmap
+from src.modeling.dataset import ContractChunkDataset, MemmapChunkDataset, create_chunk_dataloader
+
+
+class LegacyCloneDataset(Dataset):
+    """Прежний путь: список словарей, clone() трех тензоров на элемент, затем stack в default_collate."""
+    def __init__(self, chunk_list_path: str, labels_path: str):
+        self.chunk_list = torch.load(chunk_list_path)
+        self.labels = torch.load(labels_path)
+
+    def __len__(self) -> int:
+        return len(self.chunk_list)
+
+    def __getitem__(self, idx: int):
+        item = self.chunk_list[idx]
+        return {
+            'input_ids': item['input_ids'].clone().detach(),
+            'attention_mask': item['attention_mask'].clone().detach(),
+            'labels': self.labels[idx].clone().detach()
+        }
+
+
+def write_synthetic_pt(directory: str, num_chunks: int, chunk_size: int, num_labels: int):
+    """Writes .pt files in the legacy layout: int64 chunks padded with pad ID 1 to a random length."""
+    generator = torch.Generator().manual_seed(main_config.RANDOM_STATE)
+    lengths = torch.randint(16, chunk_size + 1, (num_chunks,), generator=generator)
+    chunk_list = []
+    for length in lengths.tolist():
+        input_ids = torch.ones(chunk_size, dtype=torch.long)
+        input_ids[:length] = torch.randint(3, 50000, (length,), generator=generator)
+        attention_mask = torch.zeros(chunk_size, dtype=torch.long)
+        attention_mask[:length] = 1
+        chunk_list.append({'input_ids': input_ids, 'attention_mask': attention_mask})
+    labels = torch.randint(0, 2, (num_chunks, num_labels), generator=generator).float()
+
+    chunk_path = os.path.join(directory, "chunks.pt")
+    labels_path = os.path.join(directory, "labels.pt")
+    torch.save(chunk_list, chunk_path)
+    torch.save(labels, labels_path)
+    return chunk_path, labels_path
+
+
+def measure(dataloader: DataLoader, epochs: int) -> float:
+    """Returns samples/sec over `epochs` full passes (the first pass warms up workers and page cache)."""
+    for _ in dataloader:
+        pass
+    samples = 0
+    started = time.perf_counter()
+    for _ in range(epochs):
+        for batch in dataloader:
+            samples += batch['input_ids'].shape[0]
+    return samples / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DataLoader throughput: per-item clone + collate vs batched fetch.")
+    parser.add_argument("--num-chunks", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-workers", type=int, nargs="+", default=[0, 2])
+    parser.add_argument("--epochs", type=int, default=3)
+    args = parser.parse_args()
+
+    num_labels = len(main_config.VULNERABILITY_COUNT_COLUMNS)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        chunk_path, labels_path = write_synthetic_pt(
+            tmp_dir, args.num_chunks, main_config.MODEL_CHUNK_SIZE, num_labels
+        )
+        memmap_dir = convert_pt_to_memmap(chunk_path, labels_path, os.path.join(tmp_dir, "memmap"))
+
+        legacy = LegacyCloneDataset(chunk_path, labels_path)
+        stacked = ContractChunkDataset(chunk_path, labels_path)
+        memmap = MemmapChunkDataset(str(memmap_dir))
+
+        print(f"\nChunks: {args.num_chunks}, batch size: {args.batch_size}, epochs: {args.epochs}")
+        for num_workers in args.num_workers:
+            results = {
+                "before: clone per item + default collate": measure(
+                    DataLoader(legacy, batch_size=args.batch_size, shuffle=True, num_workers=num_workers),
+                    args.epochs),
+                "after: ContractChunkDataset batched fetch": measure(
+                    create_chunk_dataloader(stacked, args.batch_size, shuffle=True, num_workers=num_workers),
+                    args.epochs),
+                "after: MemmapChunkDataset batched fetch": measure(
+                    create_chunk_dataloader(memmap, args.batch_size, shuffle=True, num_workers=num_workers),
+                    args.epochs),
+            }
+            baseline = results["before: clone per item + default collate"]
+            print(f"\n--- num_workers={num_workers} ---")
+            for name, samples_per_sec in results.items():
+                print(f"{name:<45} {samples_per_sec:>10.0f} samples/sec ({samples_per_sec / baseline:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
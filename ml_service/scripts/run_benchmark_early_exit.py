@@ -0,0 +1,111 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.api.early_exit import CHUNK_ORDERS, chunk_order, score_chunks_early_exit
+from src.data_processing.loader import load_dataset
+from src.feature_engineering.tokenization import get_tokenizer, tokenize_and_chunk_batch, trim_padding
+from src.modeling.aggregation import AGGREGATORS, ContractScoreAccumulator, aggregate_chunk_probs
+from src.modeling.models import ContractVulnerabilityClassifier
+
+
+def chunks_needed(chunk_probs: torch.Tensor, attention_mask: torch.Tensor, method: str, order: str,
+                  group_size: int, top_k: int, threshold: float) -> int:
+    """Chunks score_chunks_early_exit would encode for a contract, replayed on precomputed probabilities."""
+    indices = chunk_order(attention_mask, order)
+    num_chunks = len(indices)
+    accumulator = ContractScoreAccumulator(1, chunk_probs.shape[1], method=method, top_k=top_k)
+    encoded = 0
+    while encoded < num_chunks:
+        group = indices[encoded:encoded + group_size]
+        accumulator.update(chunk_probs[group], torch.zeros(len(group), dtype=torch.long))
+        encoded += len(group)
+        if bool(accumulator.is_decided(torch.tensor([num_chunks - encoded]), threshold)[0]):
+            break
+    return encoded
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Chunks saved by early-exit inference on a corpus of contracts, per aggregation rule and order."
+    )
+    parser.add_argument("--base-model", default="microsoft/codebert-base")
+    parser.add_argument("--model-path",
+                        default=str(main_config.MODEL_DIR / "vuln_classifier_microsoft_codebert-base_chunks_best.pt"))
+    parser.add_argument("--dataset", default=main_config.TEST_DATASET_FILENAME,
+                        help="Contracts CSV in PROCESSED_DATA_DIR.")
+    parser.add_argument("--limit", type=int, default=200, help="Number of contracts to score.")
+    parser.add_argument("--group-size", type=int, default=main_config.INFERENCE_EARLY_EXIT_GROUP_SIZE)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    df = load_dataset(args.dataset, data_dir=main_config.PROCESSED_DATA_DIR,
+                      columns_to_load=[main_config.SOURCE_CODE_COLUMN], nrows=args.limit)
+    tokenizer = get_tokenizer(args.base_model)
+    model = ContractVulnerabilityClassifier(base_model_name=args.base_model,
+                                            num_labels=len(main_config.VULNERABILITY_COUNT_COLUMNS))
+    model.load_state_dict(torch.load(args.model_path, map_location="cpu"))
+    model.eval()
+
+    def predict(input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return torch.sigmoid(model(input_ids, attention_mask))
+
+    contracts = []
+    full_time = early_time = 0.0
+    mismatches = 0
+    for code in df[main_config.SOURCE_CODE_COLUMN]:
+        batch = tokenize_and_chunk_batch([code], tokenizer, max_total_tokens=main_config.MAX_TOTAL_TOKENS,
+                                         chunk_size=main_config.MODEL_CHUNK_SIZE, overlap=main_config.CHUNK_OVERLAP)
+        if batch['input_ids'].shape[0] == 0:
+            continue
+        input_ids, attention_mask = trim_padding(batch['input_ids'], batch['attention_mask'])
+
+        start = time.perf_counter()
+        chunk_probs = predict(input_ids, attention_mask)
+        full_time += time.perf_counter() - start
+
+        # Реальный прогон в настроенном режиме: время и совпадение ответа с полным прогоном
+        start = time.perf_counter()
+        early_probs, _ = score_chunks_early_exit(predict, input_ids, attention_mask, group_size=args.group_size)
+        early_time += time.perf_counter() - start
+        full_labels = aggregate_chunk_probs(chunk_probs, main_config.CHUNK_AGGREGATION,
+                                            main_config.CHUNK_AGGREGATION_TOP_K) > main_config.CONTRACT_THRESHOLD
+        early_labels = aggregate_chunk_probs(early_probs, main_config.CHUNK_AGGREGATION,
+                                             main_config.CHUNK_AGGREGATION_TOP_K) > main_config.CONTRACT_THRESHOLD
+        # Расхождение возможно только из-за округлений при другой ширине паддинга у вероятностей у самого порога
+        mismatches += int(not np.array_equal(full_labels, early_labels))
+        contracts.append((chunk_probs, attention_mask))
+
+    total_chunks = sum(len(probs) for probs, _ in contracts)
+    print(f"Contracts: {len(contracts)}, chunks: {total_chunks} "
+          f"({total_chunks / max(len(contracts), 1):.2f} per contract), group size {args.group_size}")
+    print(f"Configured mode ({main_config.CHUNK_AGGREGATION}, {main_config.INFERENCE_EARLY_EXIT_ORDER}): "
+          f"full {full_time:.2f}s, early exit {early_time:.2f}s, responses differing: {mismatches}")
+    print(f"{'aggregation':>12} {'order':>14} {'chunks/req':>11} {'saved/req':>10} {'saved %':>8} {'early exits %':>14}")
+    for method in AGGREGATORS:
+        for order in CHUNK_ORDERS:
+            needed = [chunks_needed(probs, mask, method, order, args.group_size,
+                                    main_config.CHUNK_AGGREGATION_TOP_K, main_config.CONTRACT_THRESHOLD)
+                      for probs, mask in contracts]
+            encoded = sum(needed)
+            exits = sum(n < len(probs) for n, (probs, _) in zip(needed, contracts))
+            print(f"{method:>12} {order:>14} {encoded / len(contracts):>11.2f} "
+                  f"{(total_chunks - encoded) / len(contracts):>10.2f} "
+                  f"{100.0 * (total_chunks - encoded) / total_chunks:>7.1f}% "
+                  f"{100.0 * exits / len(contracts):>13.1f}%")
+
+
+if __name__ == "__main__":
+    main()
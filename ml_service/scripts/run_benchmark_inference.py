@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.modeling.export import MODEL_VARIANTS, onnx_model_path, variant_path
+
+
+def run_mode(args) -> None:
+    """Runs inside a fresh subprocess so that peak RSS belongs to one variant only."""
+    from src.api.backends import OnnxRuntimeBackend
+    from src.modeling.export import load_inference_model
+
+    if args.variant == "onnx":
+        predict = OnnxRuntimeBackend(onnx_model_path(args.model_path), num_threads=args.threads).predict_logits
+    else:
+        model = load_inference_model(args.model_path, args.base_model, len(main_config.VULNERABILITY_COUNT_COLUMNS),
+                                     variant=args.variant, compile_model=args.compile)
+        predict = lambda ids, mask: model.classify_embeddings(model.encode_chunks(ids, mask))
+    rss_after_load = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    generator = torch.Generator().manual_seed(main_config.RANDOM_STATE)
+    # Один "запрос": все чанки контракта длиной MAX_TOTAL_TOKENS
+    input_ids = torch.randint(3, 50000, (args.chunks_per_request, args.chunk_size), generator=generator)
+    attention_mask = torch.ones_like(input_ids)
+
+    latencies = []
+    with torch.no_grad():
+        for i in range(args.warmup + args.iterations):
+            started = time.perf_counter()
+            predict(input_ids, attention_mask)
+            if i >= args.warmup:
+                latencies.append((time.perf_counter() - started) * 1000.0)
+
+    print(json.dumps({
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "rss_after_load_mb": rss_after_load,  # ru_maxrss в КБ на Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request latency and RSS of every exported inference variant.")
+    parser.add_argument("--base-model", default="microsoft/codebert-base")
+    parser.add_argument("--model-path",
+                        default=str(main_config.MODEL_DIR / "vuln_classifier_microsoft_codebert-base_chunks_best.pt"))
+    parser.add_argument("--chunks-per-request", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=main_config.MODEL_CHUNK_SIZE)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=main_config.INFERENCE_THREADS_PER_WORKER)
+    parser.add_argument("--with-compile", action="store_true", help="Also measure torch.compile for fp32 and int8.")
+    # Внутренние аргументы дочернего процесса
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--variant", default="fp32", help=argparse.SUPPRESS)
+    parser.add_argument("--compile", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    if args.child:
+        run_mode(args)
+        return
+
+    modes = [(variant, variant, False) for variant in MODEL_VARIANTS
+             if os.path.exists(variant_path(args.model_path, variant))]
+    if args.with_compile:
+        modes += [(f"{variant} + compile", variant, True) for variant, _, _ in list(modes)
+                  if not variant.endswith("torchscript")]
+    if os.path.exists(onnx_model_path(args.model_path)):
+        modes.append(("onnxruntime", "onnx", False))
+    print(f"Request: {args.chunks_per_request} chunks x {args.chunk_size} tokens, threads: {args.threads}, "
+          f"variants found: {', '.join(name for name, _, _ in modes) or 'none'}")
+    common = [sys.executable, os.path.abspath(__file__), "--child",
+              "--base-model", args.base_model,
+              "--model-path", args.model_path,
+              "--chunks-per-request", str(args.chunks_per_request),
+              "--chunk-size", str(args.chunk_size),
+              "--iterations", str(args.iterations),
+              "--warmup", str(args.warmup),
+              "--threads", str(args.threads)]
+    results = []
+    for name, variant, compile_model in modes:
+        completed = subprocess.run(
+            common + ["--variant", variant] + (["--compile"] if compile_model else []),
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(f"{name}: FAILED\n{completed.stderr[-2000:]}")
+            continue
+        results.append((name, json.loads(completed.stdout.strip().splitlines()[-1])))
+
+    if not results:
+        return
+    baseline = results[0][1]["p50_ms"]
+    print(f"\n{'variant':<26} {'p50, ms':>9} {'p95, ms':>9} {'speedup':>8} {'RSS load, MB':>13} {'peak RSS, MB':>13}")
+    for name, result in results:
+        print(f"{name:<26} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {baseline / result['p50_ms']:>7.2f}x "
+              f"{result['rss_after_load_mb']:>13.0f} {result['peak_rss_mb']:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import pathlib
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.data_processing.loader import iter_dataset, load_dataset
+
+CODE_COLUMN = main_config.SOURCE_CODE_COLUMN
+LABEL_COLUMNS = main_config.VULNERABILITY_COUNT_COLUMNS
+
+# Режим -> (файл, функция чтения, описание)
+MODES = {
+    "csv_full": ("csv", "load", "CSV, all columns, object strings (previous behaviour)"),
+    "csv_full_arrow": ("csv", "load_arrow", "CSV, all columns, pyarrow strings"),
+    "csv_iter": ("csv", "iter", "CSV, iterator of --batch-size rows"),
+    "parquet_full": ("parquet", "load", "Parquet, all columns, object strings"),
+    "parquet_full_arrow": ("parquet", "load_arrow", "Parquet, all columns, pyarrow strings"),
+    "parquet_labels": ("parquet", "labels", "Parquet, address + labels only (projection)"),
+    "parquet_filter": ("parquet", "filter", "Parquet, rows with reentrancy > 0 (pushdown)"),
+    "parquet_iter": ("parquet", "iter", "Parquet, iterator of --batch-size rows"),
+    "feather_full_arrow": ("feather", "load_arrow", "Feather, all columns, pyarrow strings"),
+}
+
+_STATEMENTS = (
+    "balances[msg.sender] -= amount;",
+    "(bool ok, ) = msg.sender.call{value: amount}(\"\");",
+    "require(block.timestamp > unlockTime, \"locked\");",
+    "for (uint i = 0; i < holders.length; i++) { total += shares[holders[i]]; }",
+    "emit Transfer(from, to, value); // event for indexers",
+    "/* owner-only */ require(msg.sender == owner);",
+)
+
+
+def synthetic_frame(num_rows: int, row_offset: int, rng: np.random.Generator, code_bytes: int) -> pd.DataFrame:
+    """Solidity-like contracts of about `code_bytes` characters with random label counts."""
+    codes = []
+    for row in range(num_rows):
+        body = []
+        size = 0
+        while size < code_bytes * rng.uniform(0.3, 1.7):
+            statement = f"    function f{len(body)}_{row_offset + row}(uint amount) public {{ {rng.choice(_STATEMENTS)} }}\n"
+            body.append(statement)
+            size += len(statement)
+        codes.append(f"pragma solidity ^0.8.0;\ncontract C{row_offset + row} {{\n{''.join(body)}}}\n")
+    frame = {
+        main_config.ADDRESS_COLUMN: [f"0x{row_offset + row:040x}" for row in range(num_rows)],
+        CODE_COLUMN: codes,
+    }
+    for column in LABEL_COLUMNS:
+        frame[column] = rng.poisson(0.3, num_rows).astype(np.int64)
+    return pd.DataFrame(frame)
+
+
+def generate_corpus(output_dir: pathlib.Path, size_mb: int, code_bytes: int, rows_per_write: int) -> None:
+    """Writes the same synthetic corpus as CSV, Parquet and Feather, streaming, so generation fits in memory."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(main_config.RANDOM_STATE)
+    target_bytes = size_mb * 2**20
+    parquet_writer = feather_writer = None
+    written_rows = 0
+    csv_path = output_dir / "corpus.csv"
+    if csv_path.exists():
+        csv_path.unlink()
+    while not csv_path.exists() or csv_path.stat().st_size < target_bytes:
+        df = synthetic_frame(rows_per_write, written_rows, rng, code_bytes)
+        df.to_csv(csv_path, mode="a", header=written_rows == 0, index=False)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if parquet_writer is None:
+            parquet_writer = pq.ParquetWriter(output_dir / "corpus.parquet", table.schema, compression="zstd")
+            feather_writer = pa.ipc.new_file(str(output_dir / "corpus.feather"), table.schema)
+        parquet_writer.write_table(table, row_group_size=main_config.PARQUET_ROW_GROUP_SIZE)
+        feather_writer.write_table(table)
+        written_rows += len(df)
+    parquet_writer.close()
+    feather_writer.close()
+    print(f"Generated {written_rows} contracts in {output_dir}:")
+    for suffix in ("csv", "parquet", "feather"):
+        path = output_dir / f"corpus.{suffix}"
+        print(f"  {path.name:<16} {path.stat().st_size / 2**20:>8.0f} MB")
+
+
+def run_mode(args) -> None:
+    """Runs inside a fresh subprocess so that peak RSS belongs to one mode only."""
+    file_format, reader, _ = MODES[args.mode]
+    filename, data_dir = f"corpus.{file_format}", pathlib.Path(args.data_dir)
+    started = time.perf_counter()
+    rows = 0
+    code_chars = 0
+    if reader == "iter":
+        for df in iter_dataset(filename, data_dir, columns_to_load=[CODE_COLUMN], batch_size=args.batch_size):
+            rows += len(df)
+            code_chars += int(df[CODE_COLUMN].str.len().sum())  # Касаемся данных, как это сделал бы потребитель
+    else:
+        columns, filters = None, None
+        if reader == "labels":
+            columns = [main_config.ADDRESS_COLUMN] + LABEL_COLUMNS
+        elif reader == "filter":
+            filters = [(LABEL_COLUMNS[0], ">", 0)]
+        df = load_dataset(filename, data_dir, columns_to_load=columns, filters=filters,
+                          pyarrow_strings=reader != "load")
+        rows = len(df)
+        if CODE_COLUMN in df.columns:
+            code_chars = int(df[CODE_COLUMN].str.len().sum())
+    print(json.dumps({
+        "seconds": time.perf_counter() - started,
+        "rows": rows,
+        "code_chars": code_chars,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # ru_maxrss в КБ на Linux
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load time and peak RSS of CSV vs Parquet/Feather datasets, full loads vs projection, "
+                    "filters and the iterator mode, on a synthetic corpus."
+    )
+    parser.add_argument("--data-dir", default=str(main_config.DATA_DIR / "benchmark_loader"))
+    parser.add_argument("--size-mb", type=int, default=1024, help="Approximate size of the CSV corpus.")
+    parser.add_argument("--code-bytes", type=int, default=8000, help="Mean source code length per contract.")
+    parser.add_argument("--regenerate", action="store_true")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows per batch in the iterator modes.")
+    # Внутренний аргумент дочернего процесса
+    parser.add_argument("--mode", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    data_dir = pathlib.Path(args.data_dir)
+    if args.regenerate or not all((data_dir / f"corpus.{s}").exists() for s in ("csv", "parquet", "feather")):
+        generate_corpus(data_dir, args.size_mb, args.code_bytes, rows_per_write=main_config.PARQUET_ROW_GROUP_SIZE)
+
+    print(f"\n{'mode':<20} {'seconds':>8} {'rows':>9} {'peak RSS, MB':>13}  description")
+    for mode in args.modes:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", mode, "--data-dir", args.data_dir,
+             "--batch-size", str(args.batch_size)],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(f"{mode:<20} FAILED\n{completed.stderr[-2000:]}")
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"{mode:<20} {result['seconds']:>8.2f} {result['rows']:>9} {result['peak_rss_mb']:>13.0f}  "
+              f"{MODES[mode][2]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import torch
+import torch.nn as nn
+from torch.optim import AdamW
+from torch.utils.data import DataLoader, Dataset
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+
+# (название, precision, grad_accum_steps); микро-батч везде одинаковый
+MODES = [
+    ("fp32", "fp32", 1),
+    ("fp32 + accum x4", "fp32", 4),
+    ("bf16 autocast", "bf16", 1),
+    ("bf16 autocast + accum x4", "bf16", 4),
+]
+
+
+class SyntheticChunkDataset(Dataset):
+    """Random chunks of realistic shape; lengths vary so dynamic padding is not a factor between modes."""
+    def __init__(self, num_chunks: int, chunk_size: int, num_labels: int, vocab_size: int):
+        generator = torch.Generator().manual_seed(main_config.RANDOM_STATE)
+        self.input_ids = torch.randint(3, vocab_size, (num_chunks, chunk_size), generator=generator)
+        self.attention_mask = torch.ones((num_chunks, chunk_size), dtype=torch.long)
+        self.labels = torch.randint(0, 2, (num_chunks, num_labels), generator=generator).float()
+
+    def __len__(self) -> int:
+        return self.input_ids.shape[0]
+
+    def __getitem__(self, idx: int):
+        return {
+            'input_ids': self.input_ids[idx],
+            'attention_mask': self.attention_mask[idx],
+            'labels': self.labels[idx],
+        }
+
+
+def run_mode(args) -> None:
+    """Runs inside a fresh subprocess so that peak RSS belongs to one mode only."""
+    from src.modeling.models import ContractVulnerabilityClassifier
+    from src.modeling.trainer import train_epoch
+
+    torch.manual_seed(main_config.RANDOM_STATE)
+    device = torch.device("cpu")
+    num_labels = len(main_config.VULNERABILITY_COUNT_COLUMNS)
+    model = ContractVulnerabilityClassifier(base_model_name=args.base_model, num_labels=num_labels).to(device)
+    dataset = SyntheticChunkDataset(args.num_chunks, args.chunk_size, num_labels, model.base_model.config.vocab_size)
+    dataloader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False)
+    optimizer = AdamW(model.parameters(), lr=1e-5)
+
+    started = time.perf_counter()
+    train_epoch(model, dataloader, optimizer, nn.BCEWithLogitsLoss(), device, 0, 1,
+                precision=args.precision, grad_accum_steps=args.grad_accum_steps, max_grad_norm=1.0)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "chunks_per_sec": len(dataset) / elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # ru_maxrss в КБ на Linux
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training throughput and peak RSS per precision/accumulation mode.")
+    parser.add_argument("--base-model", default="microsoft/codebert-base")
+    parser.add_argument("--num-chunks", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=main_config.MODEL_CHUNK_SIZE)
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    # Внутренние аргументы дочернего процесса
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--precision", default="fp32", help=argparse.SUPPRESS)
+    parser.add_argument("--grad-accum-steps", type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    if args.child:
+        run_mode(args)
+        return
+
+    print(f"Synthetic chunks: {args.num_chunks}, micro-batch: {args.batch_size}, "
+          f"chunk size: {args.chunk_size}, threads: {args.threads}")
+    common = [sys.executable, os.path.abspath(__file__), "--child",
+              "--base-model", args.base_model,
+              "--num-chunks", str(args.num_chunks),
+              "--batch-size", str(args.batch_size),
+              "--chunk-size", str(args.chunk_size),
+              "--threads", str(args.threads)]
+    results = []
+    for name, precision, grad_accum_steps in MODES:
+        completed = subprocess.run(
+            common + ["--precision", precision, "--grad-accum-steps", str(grad_accum_steps)],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(f"{name}: FAILED\n{completed.stderr[-2000:]}")
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append((name, result))
+
+    if not results:
+        return
+    baseline = results[0][1]["chunks_per_sec"]
+    print(f"\n{'mode':<28} {'chunks/sec':>12} {'speedup':>9} {'peak RSS, MB':>14}")
+    for name, result in results:
+        print(f"{name:<28} {result['chunks_per_sec']:>12.2f} {result['chunks_per_sec'] / baseline:>8.2f}x "
+              f"{result['peak_rss_mb']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
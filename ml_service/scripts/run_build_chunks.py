@@ -0,0 +1,183 @@
+import argparse
+import collections
+import multiprocessing
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.data_processing.loader import dataset_columns, iter_dataset
+from src.feature_engineering.tokenization import get_tokenizer, tokenize_and_chunk_batch
+from src.feature_engineering.chunk_shards import (
+    MEMMAP_DIRNAME,
+    MEMMAP_META_FILENAME,
+    ShardWriter,
+    chunked_split_dir,
+    consolidate_shards,
+    read_manifest,
+    token_dtype_for_vocab,
+)
+
+SPLIT_FILES = {
+    "train": main_config.TRAIN_DATASET_FILENAME,
+    "test": main_config.TEST_DATASET_FILENAME,
+}
+
+# Токенизатор процесса-воркера
+_worker_tokenizer = None
+
+
+def _init_worker(tokenizer_name: str) -> None:
+    global _worker_tokenizer
+    # Параллелим процессами; внутренний пул потоков Rust-токенизатора только мешал бы
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _worker_tokenizer = get_tokenizer(tokenizer_name)
+
+
+def _tokenize_rows(codes, max_total_tokens: int, chunk_size: int, overlap: int, token_dtype: str):
+    """Chunks a block of contracts in a worker. Returns (input_ids, lengths, chunk counts per contract)."""
+    codes = [code if isinstance(code, str) else "" for code in codes]
+    batch = tokenize_and_chunk_batch(codes, _worker_tokenizer, max_total_tokens, chunk_size, overlap)
+    input_ids = batch['input_ids'].numpy().astype(token_dtype)
+    lengths = batch['attention_mask'].sum(dim=1).numpy().astype(np.int16)
+    counts = np.diff(batch['offsets'].numpy())
+    return input_ids, lengths, counts
+
+
+def build_split(split: str, args) -> None:
+    source_path = main_config.PROCESSED_DATA_DIR / SPLIT_FILES[split]
+    if not source_path.exists():
+        print(f"ERROR: {source_path} not found. Run scripts/run_preprocess_data.py first.")
+        return
+
+    output_dir = chunked_split_dir(split, args.tokenizer, base_dir=args.output_dir)
+    if args.overwrite and output_dir.exists():
+        shutil.rmtree(output_dir)
+
+    header = dataset_columns(SPLIT_FILES[split], main_config.PROCESSED_DATA_DIR)
+    label_columns = [col for col in header if col.startswith(main_config.TARGET_COLUMN_PREFIX)]
+    tokenizer = get_tokenizer(args.tokenizer)
+    token_dtype = token_dtype_for_vocab(len(tokenizer))
+
+    params = {
+        "split": split,
+        "source": str(source_path),
+        "tokenizer": args.tokenizer,
+        "max_total_tokens": main_config.MAX_TOTAL_TOKENS,
+        "chunk_size": main_config.MODEL_CHUNK_SIZE,
+        "overlap": main_config.CHUNK_OVERLAP,
+        "pad_token_id": tokenizer.pad_token_id,
+        "token_dtype": token_dtype.name,
+        "label_columns": label_columns,
+        "shard_size": args.shard_size,
+    }
+    manifest = read_manifest(output_dir)
+    if manifest is not None:
+        mismatched = [key for key, value in params.items() if manifest.get(key) != value]
+        if mismatched:
+            print(f"ERROR: existing manifest in {output_dir} was built with different {mismatched}. "
+                  f"Use --overwrite to rebuild.")
+            return
+        if manifest.get("complete"):
+            print(f"{split}: already built ({manifest['num_chunks']} chunks in {len(manifest['shards'])} shards).")
+            if args.consolidate and not (output_dir / MEMMAP_DIRNAME / MEMMAP_META_FILENAME).exists():
+                consolidate_shards(output_dir)
+            return
+        print(f"{split}: resuming from row {manifest['next_row']} (+{manifest['skip_chunks']} chunks), "
+              f"{manifest['num_chunks']} chunks already written.")
+    else:
+        manifest = dict(params, shards=[], num_chunks=0, next_row=0, skip_chunks=0, complete=False)
+
+    writer = ShardWriter(output_dir, manifest)
+    row_start = manifest["next_row"]
+    skip_chunks = manifest["skip_chunks"]
+
+    # Parquet при возобновлении пропускает уже обработанные row group'ы целиком, не декодируя их
+    reader = iter_dataset(
+        SPLIT_FILES[split],
+        main_config.PROCESSED_DATA_DIR,
+        columns_to_load=[main_config.SOURCE_CODE_COLUMN] + label_columns,
+        batch_size=args.rows_per_task,
+        skip_rows=row_start,
+    )
+
+    def consume(task) -> None:
+        nonlocal skip_chunks
+        future, block_start, labels = task
+        input_ids, lengths, counts = future.result()
+        num_rows = counts.shape[0]
+        original_indices = np.repeat(np.arange(block_start, block_start + num_rows, dtype=np.int64), counts)
+        positions = np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        chunk_labels = np.repeat(labels, counts, axis=0)
+        if skip_chunks:
+            # Первая строка после возобновления уже частично записана в предыдущий шард
+            keep = slice(skip_chunks, None)
+            input_ids, lengths, chunk_labels = input_ids[keep], lengths[keep], chunk_labels[keep]
+            original_indices, positions = original_indices[keep], positions[keep]
+            skip_chunks = 0
+        writer.add(input_ids, lengths, chunk_labels, original_indices, positions,
+                   rows_consumed=block_start + num_rows)
+
+    print(f"\n--- Building {split} chunks from {source_path} -> {output_dir} ---")
+    max_pending = args.num_workers * 2
+    with ProcessPoolExecutor(max_workers=args.num_workers,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(args.tokenizer,)) as executor:
+        pending = collections.deque()
+        for frame in reader:
+            labels = frame[label_columns].fillna(0).to_numpy(dtype=np.uint8)
+            future = executor.submit(
+                _tokenize_rows,
+                frame[main_config.SOURCE_CODE_COLUMN].tolist(),
+                main_config.MAX_TOTAL_TOKENS,
+                main_config.MODEL_CHUNK_SIZE,
+                main_config.CHUNK_OVERLAP,
+                token_dtype.name,
+            )
+            pending.append((future, row_start, labels))
+            row_start += len(frame)
+            # Ограничиваем число задач в полете, чтобы не держать в памяти весь корпус
+            while len(pending) >= max_pending:
+                consume(pending.popleft())
+        while pending:
+            consume(pending.popleft())
+
+    writer.close()
+    print(f"{split}: done. {manifest['num_chunks']} chunks from {manifest['next_row']} rows "
+          f"in {len(manifest['shards'])} shards.")
+    if args.consolidate:
+        # Единый массив для MemmapChunkDataset; meta.json пишется последним и служит признаком готовности
+        consolidate_shards(output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Tokenize and chunk the processed train/test splits into resumable shards."
+    )
+    parser.add_argument("--splits", nargs="+", default=["train", "test"], choices=sorted(SPLIT_FILES))
+    parser.add_argument("--tokenizer", default="microsoft/codebert-base")
+    parser.add_argument("--num-workers", type=int, default=max(1, (os.cpu_count() or 1) - 1))
+    parser.add_argument("--rows-per-task", type=int, default=256, help="Contracts tokenized per worker task.")
+    parser.add_argument("--shard-size", type=int, default=main_config.CHUNK_SHARD_SIZE, help="Chunks per shard.")
+    parser.add_argument("--output-dir", default=str(main_config.CHUNKED_DATA_DIR))
+    parser.add_argument("--overwrite", action="store_true", help="Discard existing shards instead of resuming.")
+    parser.add_argument("--no-consolidate", dest="consolidate", action="store_false",
+                        help="Keep only the shards, do not build the contiguous memmap arrays.")
+    args = parser.parse_args()
+
+    print("--- Starting Chunk Building Script ---")
+    for split in args.splits:
+        build_split(split, args)
+    print("\n--- Chunk Building Script Finished ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import argparse
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.feature_engineering.chunk_shards import MEMMAP_DIRNAME, convert_pt_to_memmap
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert legacy .pt chunk files into the memory-mapped format read by MemmapChunkDataset."
+    )
+    parser.add_argument("--splits", nargs="+", default=["train", "test"])
+    parser.add_argument("--tokenizer", default="microsoft/codebert-base",
+                        help="Tokenizer the .pt files were built with (used in their file names).")
+    parser.add_argument("--pad-token-id", type=int, default=1, help="Pad ID of that tokenizer (1 for CodeBERT).")
+    parser.add_argument("--token-dtype", default="uint16", choices=["uint16", "int32"])
+    parser.add_argument("--input-dir", default=str(main_config.CHUNKED_DATA_DIR))
+    args = parser.parse_args()
+
+    file_suffix = (f"t{main_config.MAX_TOTAL_TOKENS}_c{main_config.MODEL_CHUNK_SIZE}"
+                   f"_o{main_config.CHUNK_OVERLAP}_{args.tokenizer.replace('/', '_')}")
+    print("--- Starting Chunk Conversion Script ---")
+    for split in args.splits:
+        chunk_path = os.path.join(args.input_dir, f"{split}_chunks_{file_suffix}.pt")
+        labels_path = os.path.join(args.input_dir, f"{split}_chunk_labels_{file_suffix}.pt")
+        indices_path = os.path.join(args.input_dir, f"{split}_original_indices_{file_suffix}.pt")
+        if not os.path.exists(chunk_path) or not os.path.exists(labels_path):
+            print(f"ERROR: {chunk_path} or {labels_path} not found, skipping {split}.")
+            continue
+        out_dir = os.path.join(args.input_dir, f"{split}_{file_suffix}", MEMMAP_DIRNAME)
+        convert_pt_to_memmap(chunk_path, labels_path, out_dir,
+                             original_indices_path=indices_path,
+                             pad_token_id=args.pad_token_id,
+                             token_dtype=args.token_dtype)
+    print("\n--- Chunk Conversion Script Finished ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import os
+import sys
+
+import torch
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.api.backends import OnnxRuntimeBackend
+from src.feature_engineering.chunk_shards import MEMMAP_DIRNAME, chunked_split_dir
+from src.modeling.aggregation import ContractScoreAccumulator
+from src.modeling.dataset import MemmapChunkDataset, create_chunk_dataloader
+from src.modeling.export import (MODEL_VARIANTS, check_onnx_parity, export_model, export_onnx, load_inference_model,
+                                 save_offline_assets)
+from src.modeling.metrics import StreamingMultiLabelMetrics
+from src.modeling.models import ContractVulnerabilityClassifier
+
+
+def compare_on_test_split(models: dict, dataset: MemmapChunkDataset, batch_size: int, max_batches: int) -> dict:
+    """
+    Runs every model over the same test chunks. Returns, per model name, chunk- and contract-level
+    metrics plus the max absolute probability difference and the share of flipped labels vs. "fp32".
+    """
+    dataloader = create_chunk_dataloader(dataset, batch_size=batch_size, bucket_by_length=True, shuffle=False)
+    num_labels = dataset.labels.shape[1]
+    num_contracts = int(dataset.original_indices.max()) + 1
+    threshold = main_config.CONTRACT_THRESHOLD
+    state = {
+        name: {
+            "metrics": StreamingMultiLabelMetrics(num_labels, "cpu", thresholds=(threshold,)),
+            "contracts": ContractScoreAccumulator(num_contracts, num_labels, method=main_config.CHUNK_AGGREGATION,
+                                                  top_k=main_config.CHUNK_AGGREGATION_TOP_K),
+            "max_abs_diff": 0.0,
+            "flipped": 0,
+        }
+        for name in models
+    }
+    num_values = 0
+    with torch.no_grad():
+        for batch_idx, batch in enumerate(dataloader):
+            if max_batches and batch_idx >= max_batches:
+                break
+            probs = {name: torch.sigmoid(model(batch['input_ids'], batch['attention_mask'])).float()
+                     for name, model in models.items()}
+            reference = probs["fp32"]
+            num_values += reference.numel()
+            for name, model_probs in probs.items():
+                entry = state[name]
+                entry["metrics"].update(model_probs, batch['labels'])
+                entry["contracts"].update(model_probs, batch['original_index'], batch['labels'])
+                entry["max_abs_diff"] = max(entry["max_abs_diff"], float((model_probs - reference).abs().max()))
+                entry["flipped"] += int(((model_probs > threshold) != (reference > threshold)).sum())
+
+    results = {}
+    for name, entry in state.items():
+        scores, labels, seen = entry["contracts"].compute()
+        contract_metrics = StreamingMultiLabelMetrics(num_labels, "cpu", thresholds=(threshold,))
+        contract_metrics.update(scores[seen], labels[seen])
+        chunk = entry["metrics"].compute(threshold)
+        contract = contract_metrics.compute(threshold)
+        results[name] = {
+            "f1_macro": chunk["f1_macro"],
+            "roc_auc_macro": chunk["roc_auc_macro"],
+            "contract_f1_macro": contract["f1_macro"],
+            "max_abs_diff": entry["max_abs_diff"],
+            "flipped_pct": 100.0 * entry["flipped"] / max(num_values, 1),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export optimized inference variants of the classifier and check their accuracy "
+                    "against the fp32 checkpoint on the test split."
+    )
+    parser.add_argument("--base-model", default="microsoft/codebert-base")
+    parser.add_argument("--model-path",
+                        default=str(main_config.MODEL_DIR / "vuln_classifier_microsoft_codebert-base_chunks_best.pt"))
+    parser.add_argument("--variants", nargs="+", default=["int8", "int8_torchscript"],
+                        choices=[v for v in MODEL_VARIANTS if v != "fp32"] + ["onnx"])
+    parser.add_argument("--onnx-atol", type=float, default=1e-4, help="Max |logit| difference allowed for ONNX.")
+    parser.add_argument("--test-dir", default=None, help="Memmap test dataset dir (default: built by run_build_chunks.py).")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-batches", type=int, default=0, help="Limit the check to N batches (0 = whole split).")
+    parser.add_argument("--max-f1-drop", type=float, default=0.01,
+                        help="Fail (exit code 1) if a variant's chunk or contract F1-macro drops more than this.")
+    parser.add_argument("--skip-check", action="store_true")
+    parser.add_argument("--offline-assets", action="store_true",
+                        help="Also save the encoder config and tokenizer to INFERENCE_OFFLINE_ASSETS_DIR "
+                             "so the service starts without the Hugging Face hub.")
+    args = parser.parse_args()
+
+    if args.offline_assets:
+        path = save_offline_assets(args.base_model, str(main_config.INFERENCE_OFFLINE_ASSETS_DIR))
+        print(f"offline assets: saved config and tokenizer of {args.base_model} to {path}")
+
+    dataset = None
+    if not args.skip_check:
+        test_dir = args.test_dir or chunked_split_dir("test", args.base_model) / MEMMAP_DIRNAME
+        dataset = MemmapChunkDataset(str(test_dir), pin_memory=False)
+    num_labels = dataset.labels.shape[1] if dataset is not None else len(main_config.VULNERABILITY_COUNT_COLUMNS)
+
+    model = ContractVulnerabilityClassifier(base_model_name=args.base_model, num_labels=num_labels)
+    model.load_state_dict(torch.load(args.model_path, map_location="cpu"))
+    model.eval()
+
+    models = {"fp32": model}
+    for variant in args.variants:
+        if variant == "onnx":
+            path = export_onnx(model, args.model_path)
+            # Паритет логитов с PyTorch на нескольких формах входа; RuntimeError, если выше допуска
+            max_diff = check_onnx_parity(model, path, atol=args.onnx_atol)
+            print(f"onnx: logits parity OK, max |diff| {max_diff:.2e}")
+            backend = OnnxRuntimeBackend(path)
+            models[variant] = lambda ids, mask, backend=backend: torch.from_numpy(backend.predict_logits(ids, mask))
+        else:
+            path = export_model(model, args.model_path, variant)
+            models[variant] = load_inference_model(args.model_path, args.base_model, num_labels, variant=variant)
+        size_mb = os.path.getsize(path) / 2**20
+        print(f"{variant}: saved {path} ({size_mb:.1f} MB, fp32 checkpoint {os.path.getsize(args.model_path) / 2**20:.1f} MB)")
+
+    if dataset is None:
+        return
+    results = compare_on_test_split(models, dataset, args.batch_size, args.max_batches)
+    reference = results["fp32"]
+    print(f"\n{'variant':<18} {'f1_macro':>9} {'delta':>8} {'contract_f1':>12} {'delta':>8} "
+          f"{'roc_auc':>8} {'max |dp|':>9} {'flipped %':>10}")
+    failed = []
+    for name, result in results.items():
+        chunk_delta = result["f1_macro"] - reference["f1_macro"]
+        contract_delta = result["contract_f1_macro"] - reference["contract_f1_macro"]
+        print(f"{name:<18} {result['f1_macro']:>9.4f} {chunk_delta:>+8.4f} {result['contract_f1_macro']:>12.4f} "
+              f"{contract_delta:>+8.4f} {result['roc_auc_macro']:>8.4f} {result['max_abs_diff']:>9.4f} "
+              f"{result['flipped_pct']:>9.3f}%")
+        if min(chunk_delta, contract_delta) < -args.max_f1_drop:
+            failed.append(name)
+    if failed:
+        print(f"\nF1-macro dropped by more than {args.max_f1_drop} for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
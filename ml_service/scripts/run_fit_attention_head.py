@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+
+import torch
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.feature_engineering.chunk_shards import MEMMAP_DIRNAME, chunked_split_dir
+from src.modeling.dataset import MemmapChunkDataset, create_chunk_dataloader
+from src.modeling.models import ContractVulnerabilityClassifier
+from src.modeling.trainer import DEVICE, evaluate_epoch, fit_attention_pooling_head
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fit the contract-level attention pooling head on top of a trained chunk classifier "
+                    "and compare it with the rule-based chunk aggregators."
+    )
+    parser.add_argument("--base-model", default="microsoft/codebert-base")
+    parser.add_argument("--model-path",
+                        default=str(main_config.MODEL_DIR / "vuln_classifier_microsoft_codebert-base_chunks_best.pt"))
+    parser.add_argument("--train-dir", default=None, help="Memmap dataset dir (default: built by run_build_chunks.py).")
+    parser.add_argument("--test-dir", default=None, help="Memmap dataset dir used for validation.")
+    parser.add_argument("--output", default=str(main_config.MODEL_DIR / "attention_pooling_head.pt"))
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--batch-size", type=int, default=32, help="Chunks per encoder batch.")
+    parser.add_argument("--precision", default="fp32", choices=["fp32", "bf16", "fp16"])
+    args = parser.parse_args()
+
+    datasets = {}
+    for split in ("train", "test"):
+        data_dir = getattr(args, f"{split}_dir") or chunked_split_dir(split, args.base_model) / MEMMAP_DIRNAME
+        datasets[split] = MemmapChunkDataset(str(data_dir), pin_memory=False)
+    train_dataloader = create_chunk_dataloader(datasets["train"], batch_size=args.batch_size, bucket_by_length=True,
+                                               shuffle=False)
+    val_dataloader = create_chunk_dataloader(datasets["test"], batch_size=args.batch_size, bucket_by_length=True,
+                                             shuffle=False)
+
+    model = ContractVulnerabilityClassifier(
+        base_model_name=args.base_model,
+        num_labels=datasets["train"].labels.shape[1]
+    )
+    model.load_state_dict(torch.load(args.model_path, map_location="cpu"))
+    model.to(DEVICE)
+
+    # Базовая линия: правила сведения вероятностей чанков на той же валидации
+    criterion = torch.nn.BCEWithLogitsLoss()
+    for method in ("max", "mean", "topk_mean", "noisy_or"):
+        _, val_metrics = evaluate_epoch(model, val_dataloader, criterion, DEVICE, 0, 1,
+                                        precision=args.precision, contract_aggregation=method)
+        print(f"{method:>10}: contract_f1_macro={val_metrics['contract_f1_macro']:.4f} "
+              f"contract_roc_auc_macro={val_metrics['contract_roc_auc_macro']:.4f}")
+
+    head, head_metrics = fit_attention_pooling_head(
+        model,
+        train_dataloader,
+        val_dataloader,
+        num_epochs=args.epochs,
+        learning_rate=args.learning_rate,
+        precision=args.precision,
+    )
+    print(f" attention: contract_f1_macro={head_metrics['contract_f1_macro']:.4f} "
+          f"contract_roc_auc_macro={head_metrics['contract_roc_auc_macro']:.4f}")
+    torch.save(head.state_dict(), args.output)
+    print(f"Attention pooling head saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
+import argparse
+import multiprocessing
 import sys
 import os
-from sklearn.model_selection import train_test_split
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 # Add src directory to Python path to allow direct imports
 # This is a common way to structure projects for script execution
@@ -9,122 +11,141 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
-from src.data_processing.loader import load_dataset
-from src.data_processing.preprocessing import preprocess_dataframe
+from src.data_processing.loader import DatasetWriter, dataset_columns, dataset_num_rows, iter_dataset
+from src.data_processing.preprocessing import exact_split_test_rows, hash_split_mask, preprocess_dataframe, split_keys
 from config import main_config
 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Label, optionally clean and split the raw dataset batch by batch; "
+                    "peak memory is one batch, whatever the corpus size."
+    )
+    parser.add_argument("--batch-size", type=int, default=main_config.PREPROCESS_BATCH_SIZE,
+                        help="Contracts read, processed and written per step.")
+    parser.add_argument("--split", default="hash", choices=["hash", "exact"],
+                        help="hash: seeded hash of the address (global row index for rows without one), one pass. "
+                             "exact: the same membership as sklearn train_test_split with --seed "
+                             "(one extra pass to count rows).")
+    parser.add_argument("--test-size", type=float, default=main_config.TEST_SET_SIZE)
+    parser.add_argument("--seed", type=int, default=main_config.RANDOM_STATE)
+    parser.add_argument("--clean-code", action="store_true", help="Strip comments and whitespace from the source.")
+    parser.add_argument("--n-jobs", type=int, default=main_config.PREPROCESS_N_JOBS,
+                        help="Processes for --clean-code (one pool for the whole run).")
+    parser.add_argument("--chunk-size", type=int, default=main_config.PREPROCESS_CLEAN_CHUNK_SIZE,
+                        help="Contracts per cleaning task sent to the pool.")
+    return parser.parse_args()
+
 def main():
     """
     Main script to load, preprocess, split, and save the dataset.
+
+    Raw data is streamed in batches; every batch is labelled in place, assigned to train/test
+    and appended to the processed, train and test outputs, so no full copy of the corpus is held.
     """
+    args = parse_args()
     print("--- Starting Data Preprocessing Script ---")
 
-    # 1. Load Raw Data
+    # 1. Open the raw data stream
+    raw_name, raw_dir = main_config.RAW_DATASET_FILENAME, main_config.RAW_DATA_DIR
     try:
-        print(f"Loading raw dataset: {main_config.RAW_DATASET_FILENAME} from {main_config.RAW_DATA_DIR}")
+        print(f"Streaming raw dataset: {raw_name} from {raw_dir} in batches of {args.batch_size}")
+        available = dataset_columns(raw_name, raw_dir)
         # Define columns to load based on config
         required_cols = [main_config.SOURCE_CODE_COLUMN, main_config.ADDRESS_COLUMN] + \
                         main_config.VULNERABILITY_COUNT_COLUMNS
-        
-        raw_df = load_dataset(
-            filename=main_config.RAW_DATASET_FILENAME,
-            data_dir=main_config.RAW_DATA_DIR,
-            columns_to_load=required_cols
-        )
-        print(f"Successfully loaded raw data. Shape: {raw_df.shape}")
+        missing_cols = [col for col in required_cols if col not in available]
+        if missing_cols:
+            print(f"ERROR: Raw dataset is missing columns {missing_cols}.")
+            print("Please check `VULNERABILITY_COUNT_COLUMNS`, `SOURCE_CODE_COLUMN` and `ADDRESS_COLUMN` in `config/main_config.py`.")
+            return
+        is_test_row = None
+        if args.split == "exact":
+            # Та же перестановка ShuffleSplit, что и у train_test_split в памяти: 1 байт на строку
+            is_test_row = exact_split_test_rows(dataset_num_rows(raw_name, raw_dir), args.test_size, args.seed)
+        batches = iter_dataset(raw_name, raw_dir, columns_to_load=required_cols, batch_size=args.batch_size)
     except FileNotFoundError:
-        print(f"ERROR: Raw dataset file '{main_config.RAW_DATASET_FILENAME}' not found in '{main_config.RAW_DATA_DIR}'.")
+        print(f"ERROR: Raw dataset file '{raw_name}' not found in '{raw_dir}'.")
         print("Please ensure the file exists and `RAW_DATASET_FILENAME` and `VULNERABILITY_COUNT_COLUMNS` in `config/main_config.py` are correct.")
         return
     except Exception as e:
         print(f"ERROR loading raw dataset: {e}")
         return
 
-    # 2. Preprocess Data
-    print("\n--- Preprocessing Data ---")
-    try:
-        processed_df = preprocess_dataframe(
-            raw_df,
-            source_code_col=main_config.SOURCE_CODE_COLUMN,
-            vulnerability_count_cols=main_config.VULNERABILITY_COUNT_COLUMNS,
-            target_prefix=main_config.TARGET_COLUMN_PREFIX,
-            skip_code_cleaning=True
-        )
-        print(f"Successfully preprocessed data. Shape: {processed_df.shape}")
-        # Display new target columns for verification
-        target_cols = [col for col in processed_df.columns if col.startswith(main_config.TARGET_COLUMN_PREFIX)]
-        print(f"Generated target columns: {target_cols}")
-        if not target_cols:
-            print("WARNING: No target columns were generated. Check VULNERABILITY_COUNT_COLUMNS in config and dataset.")
-            # return # Potentially exit if no targets are created
-        else:
-            print("Sample of target columns:")
-            print(processed_df[target_cols].head())
-
-    except Exception as e:
-        print(f"ERROR during preprocessing: {e}")
-        return
-
-    # 3. Save Processed Data (Optional, but good practice)
     if not main_config.PROCESSED_DATA_DIR.exists():
         main_config.PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
-    
-    processed_file_path = main_config.PROCESSED_DATA_DIR / main_config.PROCESSED_DATASET_FILENAME
-    try:
-        processed_df.to_csv(processed_file_path, index=False)
-        print(f"\nSuccessfully saved fully processed data to: {processed_file_path}")
-    except Exception as e:
-        print(f"ERROR saving processed data: {e}")
-        return
-
-    # 4. Split Data into Train and Test sets
-    print("\n--- Splitting Data into Train and Test Sets ---")
+    # Формат по расширению (PROCESSED_DATA_FORMAT); файлы появляются под итоговыми именами только в конце
+    writers = {
+        "processed": DatasetWriter(main_config.PROCESSED_DATASET_FILENAME, main_config.PROCESSED_DATA_DIR),
+        "train": DatasetWriter(main_config.TRAIN_DATASET_FILENAME, main_config.PROCESSED_DATA_DIR),
+        "test": DatasetWriter(main_config.TEST_DATASET_FILENAME, main_config.PROCESSED_DATA_DIR),
+    }
+
+    # 2. Preprocess, split and save batch by batch
+    print("\n--- Preprocessing, Splitting and Saving Data ---")
+    row_start = 0
+    target_cols = []
+    completed = False
+    cleaning_pool = None
+    if args.clean_code and args.n_jobs > 1:
+        # Один пул на весь прогон: процессы не пересоздаются на каждом батче
+        cleaning_pool = ProcessPoolExecutor(max_workers=args.n_jobs, mp_context=multiprocessing.get_context("spawn"))
+        print(f"Cleaning code in {args.n_jobs} processes, {args.chunk_size} contracts per task")
     try:
-        # Define target columns for stratification if possible and meaningful
-        # For multi-label, stratification can be complex.
-        # A simple approach is to stratify on a summary column if one exists (e.g., "has_any_vulnerability")
-        # Or, if one vulnerability type is dominant and critical, stratify on that.
-        # For now, let's do a simple random split.
-        # If you have many labels, consider using iterative splitting methods for multi-label data.
-        
-        # Create a unique list of target column names that were actually created
-        final_target_columns = [col for col in processed_df.columns if col.startswith(main_config.TARGET_COLUMN_PREFIX)]
-        
-        if not final_target_columns:
-            print("WARNING: No target columns found for splitting. Cannot proceed with train/test split.")
-            return
-
-        # For multi-label, simple train_test_split might not ensure label distribution.
-        # Consider scikit-multilearn's iterative_train_test_split if class imbalance is severe across labels.
-        # For now, a standard split:
-        X = processed_df.drop(columns=final_target_columns, errors='ignore')
-        y = processed_df[final_target_columns]
-
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y,
-            test_size=main_config.TEST_SET_SIZE,
-            random_state=main_config.RANDOM_STATE
-            # Add stratify=y_stratify_column if you have a suitable column for stratification
-        )
-        
-        train_df = pd.concat([X_train, y_train], axis=1)
-        test_df = pd.concat([X_test, y_test], axis=1)
-
-        print(f"Training set shape: {train_df.shape}")
-        print(f"Test set shape: {test_df.shape}")
-
-        # 5. Save Train and Test Sets
-        train_file_path = main_config.PROCESSED_DATA_DIR / main_config.TRAIN_DATASET_FILENAME
-        test_file_path = main_config.PROCESSED_DATA_DIR / main_config.TEST_DATASET_FILENAME
-
-        train_df.to_csv(train_file_path, index=False)
-        test_df.to_csv(test_file_path, index=False)
-        print(f"Successfully saved train data to: {train_file_path}")
-        print(f"Successfully saved test data to: {test_file_path}")
-
+        for batch in batches:
+            batch = preprocess_dataframe(
+                batch,
+                source_code_col=main_config.SOURCE_CODE_COLUMN,
+                vulnerability_count_cols=main_config.VULNERABILITY_COUNT_COLUMNS,
+                target_prefix=main_config.TARGET_COLUMN_PREFIX,
+                skip_code_cleaning=not args.clean_code,
+                copy=False, # Батч принадлежит только этому циклу: метки добавляются на месте
+                verbose=False,
+                chunk_size=args.chunk_size,
+                executor=cleaning_pool
+            )
+            if not target_cols:
+                target_cols = [col for col in batch.columns if col.startswith(main_config.TARGET_COLUMN_PREFIX)]
+                print(f"Generated target columns: {target_cols}")
+                if not target_cols:
+                    print("WARNING: No target columns were generated. Check VULNERABILITY_COUNT_COLUMNS in config and dataset.")
+                    print("WARNING: No target columns found for splitting. Cannot proceed with train/test split.")
+                    return
+
+            if is_test_row is not None:
+                is_test = is_test_row[row_start:row_start + len(batch)]
+            else:
+                # Ключ - адрес контракта: дубликаты одного адреса попадают в одну часть;
+                # строки без адреса распределяются по своему глобальному номеру
+                keys = split_keys(batch[main_config.ADDRESS_COLUMN], row_start)
+                is_test = hash_split_mask(keys, args.test_size, args.seed)
+
+            writers["processed"].write(batch)
+            writers["train"].write(batch[~is_test])
+            writers["test"].write(batch[is_test])
+            row_start += len(batch)
+            print(f"Processed {row_start} rows (train {writers['train'].num_rows}, test {writers['test'].num_rows})")
+
+        # 3. Finalize the outputs
+        processed_file_path = writers["processed"].close()
+        train_file_path = writers["train"].close()
+        test_file_path = writers["test"].close()
+        completed = True
     except Exception as e:
-        print(f"ERROR during data splitting or saving: {e}")
+        print(f"ERROR during preprocessing, splitting or saving: {e}")
         return
+    finally:
+        if cleaning_pool is not None:
+            cleaning_pool.shutdown()
+        if not completed:
+            # Ошибка или ранний выход: закрываем файлы и удаляем временные, итоговые имена не трогаем
+            for writer in writers.values():
+                writer.abort()
+
+    print(f"\nSuccessfully saved fully processed data to: {processed_file_path}")
+    print(f"Training set: {writers['train'].num_rows} rows, test set: {writers['test'].num_rows} rows "
+          f"({args.split} split, seed {args.seed})")
+    print(f"Successfully saved train data to: {train_file_path}")
+    print(f"Successfully saved test data to: {test_file_path}")
 
     print("\n--- Data Preprocessing Script Finished ---")
 
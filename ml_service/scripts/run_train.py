@@ -0,0 +1,120 @@
+import argparse
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from config import main_config
+from src.feature_engineering.chunk_shards import MEMMAP_DIRNAME, chunked_split_dir
+from src.modeling.dataset import ContractChunkDataset, MemmapChunkDataset, create_chunk_dataloader
+from src.modeling.distributed import cleanup_distributed, init_distributed
+from src.modeling.export import load_state_dict_file
+from src.modeling.models import ContractVulnerabilityClassifier, create_student
+from src.modeling.trainer import train_model
+
+
+def load_split(split: str, args):
+    """Memmap dataset built by run_build_chunks.py, or the legacy .pt files with --legacy-pt."""
+    if args.legacy_pt:
+        file_suffix = (f"t{main_config.MAX_TOTAL_TOKENS}_c{main_config.MODEL_CHUNK_SIZE}"
+                       f"_o{main_config.CHUNK_OVERLAP}_{args.base_model.replace('/', '_')}.pt")
+        chunk_dir = main_config.CHUNKED_DATA_DIR
+        return ContractChunkDataset(
+            chunk_list_path=str(chunk_dir / f"{split}_chunks_{file_suffix}"),
+            labels_path=str(chunk_dir / f"{split}_chunk_labels_{file_suffix}"),
+            original_indices_path=str(chunk_dir / f"{split}_original_indices_{file_suffix}"),
+            pin_memory=False,
+        )
+    data_dir = getattr(args, f"{split}_dir") or chunked_split_dir(split, args.base_model) / MEMMAP_DIRNAME
+    return MemmapChunkDataset(str(data_dir), pin_memory=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Train the chunk classifier. Single process: python scripts/run_train.py ...; "
+                    "data-parallel on one CPU box: torchrun --standalone --nproc_per_node=N scripts/run_train.py ..."
+    )
+    parser.add_argument("--base-model", default="microsoft/codebert-base")
+    parser.add_argument("--train-dir", default=None, help="Memmap dataset dir (default: built by run_build_chunks.py).")
+    parser.add_argument("--test-dir", default=None, help="Memmap dataset dir used for validation.")
+    parser.add_argument("--legacy-pt", action="store_true", help="Read the legacy .pt chunk files instead.")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=8, help="Micro-batch size per process.")
+    parser.add_argument("--learning-rate", type=float, default=2e-5)
+    parser.add_argument("--precision", default="fp32", choices=["fp32", "bf16", "fp16"])
+    parser.add_argument("--grad-accum-steps", type=int, default=1)
+    parser.add_argument("--max-grad-norm", type=float, default=1.0)
+    parser.add_argument("--lr-scheduler", default="linear")
+    parser.add_argument("--warmup-ratio", type=float, default=0.06)
+    parser.add_argument("--bucket-by-length", action="store_true")
+    parser.add_argument("--num-workers", type=int, default=0, help="DataLoader workers per process.")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch threads per process (default: CPU cores / processes on this node).")
+    parser.add_argument("--model-save-path",
+                        default=str(main_config.MODEL_DIR / "vuln_classifier_microsoft_codebert-base_chunks_best.pt"))
+    parser.add_argument("--checkpoint-dir", default=str(main_config.CHECKPOINT_DIR))
+    parser.add_argument("--checkpoint-every", type=int, default=main_config.CHECKPOINT_EVERY_N_STEPS)
+    parser.add_argument("--resume-from", default=None, help='Checkpoint path or "latest".')
+    # Дистилляция: --teacher-path включает обучение студента на мягких метках учителя
+    parser.add_argument("--teacher-path", default=None, help="fp32 checkpoint of the teacher (same --base-model).")
+    parser.add_argument("--student-layers", type=int, default=main_config.STUDENT_NUM_HIDDEN_LAYERS)
+    parser.add_argument("--student-base-model", default=main_config.STUDENT_BASE_MODEL,
+                        help="Smaller RoBERTa-family model with the teacher's vocabulary instead of a truncation.")
+    parser.add_argument("--distill-alpha", type=float, default=0.5, help="Weight of the teacher's soft labels.")
+    parser.add_argument("--distill-temperature", type=float, default=1.0)
+    args = parser.parse_args()
+    if args.teacher_path and args.model_save_path == parser.get_default("model_save_path"):
+        args.model_save_path = str(main_config.STUDENT_MODEL_PATH)
+
+    context = init_distributed(backend="gloo", num_threads=args.threads)
+    try:
+        train_dataset = load_split("train", args)
+        val_dataset = load_split("test", args)
+        loader_kwargs = dict(
+            batch_size=args.batch_size,
+            num_workers=args.num_workers,
+            bucket_by_length=args.bucket_by_length,
+            num_replicas=context.world_size,
+            rank=context.rank,
+        )
+        # Обучающие шарды выровнены по числу батчей (требование DDP), валидационные - без повторов
+        train_dataloader = create_chunk_dataloader(train_dataset, shuffle=True, even_shards=True, **loader_kwargs)
+        val_dataloader = create_chunk_dataloader(val_dataset, shuffle=False, even_shards=False, **loader_kwargs)
+
+        model = ContractVulnerabilityClassifier(
+            base_model_name=args.base_model,
+            num_labels=train_dataset.labels.shape[1]
+        )
+        teacher = None
+        if args.teacher_path:
+            teacher = model
+            teacher.load_state_dict(load_state_dict_file(args.teacher_path))
+            model = create_student(teacher, num_hidden_layers=args.student_layers,
+                                   base_model_name=args.student_base_model)
+        train_model(
+            model,
+            train_dataloader,
+            val_dataloader,
+            num_epochs=args.epochs,
+            learning_rate=args.learning_rate,
+            model_save_path=args.model_save_path,
+            precision=args.precision,
+            grad_accum_steps=args.grad_accum_steps,
+            max_grad_norm=args.max_grad_norm,
+            lr_scheduler_type=args.lr_scheduler,
+            warmup_ratio=args.warmup_ratio,
+            checkpoint_dir=args.checkpoint_dir,
+            checkpoint_every_n_steps=args.checkpoint_every,
+            resume_from=args.resume_from,
+            teacher=teacher,
+            distill_alpha=args.distill_alpha,
+            distill_temperature=args.distill_temperature,
+        )
+    finally:
+        cleanup_distributed()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+from abc import ABC, abstractmethod
+from typing import Optional, Union
+
+import numpy as np
+import torch
+
+from config import main_config
+from src.api.embedding_cache import ChunkEmbeddingCache
+from src.modeling.export import create_onnx_session, load_inference_model, onnx_model_path, variant_path
+
+# Движки инференса, между которыми переключается API (INFERENCE_BACKEND)
+BACKENDS = ("torch", "onnxruntime")
+
+
+class InferenceBackend(ABC):
+    """Scores a batch of chunks: (input_ids, attention_mask) -> probabilities (num_chunks, num_labels) on CPU."""
+    name = "base"
+    artifact_path: str
+
+    @abstractmethod
+    def predict_probs(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        ...
+
+
+class TorchBackend(InferenceBackend):
+    """PyTorch model (any INFERENCE_MODEL_VARIANT), optionally behind the chunk embedding cache."""
+    name = "torch"
+
+    def __init__(self,
+                 model: torch.nn.Module,
+                 device: torch.device,
+                 artifact_path: str,
+                 embedding_cache: Optional[ChunkEmbeddingCache] = None):
+        self.model = model
+        self.device = device
+        self.artifact_path = artifact_path
+        self.embedding_cache = embedding_cache
+
+    def predict_probs(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            if self.embedding_cache is not None:
+                # Энкодер прогоняется только на чанках, которых еще нет в кэше
+                embeddings = self.embedding_cache.encode(self.model.encode_chunks, input_ids, attention_mask, self.device)
+            else:
+                embeddings = self.model.encode_chunks(input_ids.to(self.device), attention_mask.to(self.device))
+            logits = self.model.classify_embeddings(embeddings)
+            return torch.sigmoid(logits).cpu()
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """
+    The classifier exported by export_onnx, run by ONNX Runtime on CPU. The whole graph
+    (encoder + head) runs in one session call, so the embedding cache is not used.
+    InferenceSession.run is thread-safe: one session serves every thread worker.
+    """
+    name = "onnxruntime"
+
+    def __init__(self, onnx_path: str, num_threads: Optional[int] = None):
+        self.artifact_path = onnx_path
+        self.session = create_onnx_session(onnx_path, num_threads=num_threads)
+
+    def predict_logits(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> np.ndarray:
+        return self.session.run(["logits"], {
+            "input_ids": input_ids.numpy().astype(np.int64, copy=False),
+            "attention_mask": attention_mask.numpy().astype(np.int64, copy=False),
+        })[0]
+
+    def predict_probs(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return torch.sigmoid(torch.from_numpy(self.predict_logits(input_ids, attention_mask)))
+
+
+def default_device(backend: str = main_config.INFERENCE_BACKEND,
+                   variant: str = main_config.INFERENCE_MODEL_VARIANT) -> torch.device:
+    """CUDA when available for the torch backend; int8 variants (dynamic quantization) and ONNX Runtime run on CPU."""
+    use_cuda = torch.cuda.is_available() and backend == "torch" and not variant.startswith("int8")
+    return torch.device("cuda" if use_cuda else "cpu")
+
+
+def create_backend(backend: str,
+                   model_path: str,
+                   base_model_name: str,
+                   num_labels: int,
+                   device: Union[str, torch.device] = "cpu",
+                   num_threads: Optional[int] = None,
+                   use_embedding_cache: bool = False,
+                   num_hidden_layers: Optional[int] = None) -> InferenceBackend:
+    """
+    Builds the configured backend. For "torch" the model variant comes from INFERENCE_MODEL_VARIANT;
+    "onnxruntime" loads onnx_model_path(model_path) (see scripts/run_export_model.py --variants onnx).
+    `num_hidden_layers` rebuilds a truncated (distilled student) encoder for the nn.Module variants.
+
+    Raises:
+        ValueError: For an unknown backend name.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Expected one of {BACKENDS}.")
+    if backend == "onnxruntime":
+        return OnnxRuntimeBackend(onnx_model_path(model_path), num_threads=num_threads)
+    device = torch.device(device)
+    model = load_inference_model(
+        model_path,
+        base_model_name,
+        num_labels=num_labels,
+        variant=main_config.INFERENCE_MODEL_VARIANT,
+        device=device,
+        compile_model=main_config.INFERENCE_TORCH_COMPILE,
+        num_hidden_layers=num_hidden_layers
+    )
+    return TorchBackend(
+        model,
+        device,
+        artifact_path=variant_path(model_path, main_config.INFERENCE_MODEL_VARIANT),
+        embedding_cache=ChunkEmbeddingCache() if use_embedding_cache else None
+    )
@@ -0,0 +1,135 @@
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from config import main_config
+from src.feature_engineering.tokenization import tokenize_and_chunk_batch, trim_padding
+
+# Кусок батча: (позиция контракта, номер первого чанка контракта, число чанков)
+Segment = Tuple[int, int, int]
+
+
+class _ChunkPacker:
+    """
+    Packs the chunks of consecutive contracts into batches of exactly `max_batch_size` rows;
+    a contract may be split across two batches. Only the final batch can be smaller.
+    """
+    def __init__(self, max_batch_size: int):
+        self.max_batch_size = max_batch_size
+        self._parts: Deque[Tuple[int, int, torch.Tensor, torch.Tensor]] = deque()
+        self._buffered = 0
+
+    def add(self, position: int, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> None:
+        self._parts.append((position, 0, input_ids, attention_mask))
+        self._buffered += input_ids.shape[0]
+
+    def pop_batches(self, flush: bool = False) -> List[Tuple[torch.Tensor, torch.Tensor, List[Segment]]]:
+        batches = []
+        while self._buffered >= self.max_batch_size or (flush and self._buffered > 0):
+            batches.append(self._pop_batch())
+        return batches
+
+    def _pop_batch(self) -> Tuple[torch.Tensor, torch.Tensor, List[Segment]]:
+        ids_parts, mask_parts, segments = [], [], []
+        free = self.max_batch_size
+        while free > 0 and self._parts:
+            position, start, input_ids, attention_mask = self._parts.popleft()
+            take = min(free, input_ids.shape[0])
+            ids_parts.append(input_ids[:take])
+            mask_parts.append(attention_mask[:take])
+            segments.append((position, start, take))
+            if take < input_ids.shape[0]:
+                # Остаток контракта открывает следующий батч
+                self._parts.appendleft((position, start + take, input_ids[take:], attention_mask[take:]))
+            free -= take
+            self._buffered -= take
+        # Все чанки одной ширины chunk_size: паддинг обрезается по самому длинному чанку батча
+        input_ids, attention_mask = trim_padding(torch.cat(ids_parts), torch.cat(mask_parts))
+        return input_ids, attention_mask, segments
+
+
+async def iter_packed_contract_probs(
+    codes: Sequence[str],
+    tokenizer,
+    submit_fn: Callable[[torch.Tensor, torch.Tensor], Future],
+    max_batch_size: int = main_config.INFERENCE_MAX_BATCH_SIZE,
+    max_in_flight: int = main_config.INFERENCE_BATCH_MAX_IN_FLIGHT,
+    tokenize_group_size: int = main_config.INFERENCE_BATCH_TOKENIZE_GROUP,
+) -> AsyncIterator[Tuple[int, Optional[np.ndarray]]]:
+    """
+    Scores many contracts with chunks packed across contract boundaries into full batches.
+
+    Contracts are tokenized `tokenize_group_size` at a time (off the event loop), their chunks
+    are packed into batches of `max_batch_size` rows and sent to `submit_fn` (the micro-batcher),
+    with at most `max_in_flight` batches outstanding. A contract is yielded as soon as its last
+    chunk is scored, so results arrive in roughly input order while later contracts still run.
+
+    If the consumer stops iterating (client disconnect cancels the generator), the batches that
+    have not started yet are cancelled and no further contracts are tokenized.
+
+    Yields:
+        Tuple[int, Optional[np.ndarray]]: Position of the contract in `codes` and its per-chunk
+            probabilities (num_chunks, num_labels), or None if the code produced no chunks.
+    """
+    loop = asyncio.get_running_loop()
+    packer = _ChunkPacker(max_batch_size)
+    in_flight: Deque[Tuple[Future, List[Segment]]] = deque()
+    remaining: Dict[int, int] = {}
+    pieces: Dict[int, List[Tuple[int, np.ndarray]]] = {}
+
+    def finish(batch_future: Future, segments: List[Segment]) -> List[Tuple[int, np.ndarray]]:
+        probs = batch_future.result().numpy()
+        done, offset = [], 0
+        for position, start, count in segments:
+            pieces[position].append((start, probs[offset:offset + count]))
+            offset += count
+            remaining[position] -= count
+            if remaining[position] == 0:
+                del remaining[position]
+                ordered = sorted(pieces.pop(position), key=lambda piece: piece[0])
+                done.append((position, np.concatenate([rows for _, rows in ordered])))
+        return done
+
+    try:
+        for group_start in range(0, len(codes), tokenize_group_size):
+            group = codes[group_start:group_start + tokenize_group_size]
+            batch = await loop.run_in_executor(None, lambda group=group: tokenize_and_chunk_batch(
+                group,
+                tokenizer,
+                max_total_tokens=main_config.MAX_TOTAL_TOKENS,
+                chunk_size=main_config.MODEL_CHUNK_SIZE,
+                overlap=main_config.CHUNK_OVERLAP
+            ))
+            offsets = batch['offsets'].tolist()
+            for i in range(len(group)):
+                position = group_start + i
+                start, end = offsets[i], offsets[i + 1]
+                if start == end:
+                    yield position, None
+                    continue
+                remaining[position] = end - start
+                pieces[position] = []
+                packer.add(position, batch['input_ids'][start:end], batch['attention_mask'][start:end])
+
+            is_last_group = group_start + tokenize_group_size >= len(codes)
+            for input_ids, attention_mask, segments in packer.pop_batches(flush=is_last_group):
+                in_flight.append((submit_fn(input_ids, attention_mask), segments))
+                while len(in_flight) >= max_in_flight:
+                    batch_future, segments_done = in_flight.popleft()
+                    await asyncio.wrap_future(batch_future)
+                    for result in finish(batch_future, segments_done):
+                        yield result
+
+        while in_flight:
+            batch_future, segments_done = in_flight.popleft()
+            await asyncio.wrap_future(batch_future)
+            for result in finish(batch_future, segments_done):
+                yield result
+    finally:
+        # Клиент отключился или произошла ошибка: батчи, которые еще ждут в очереди, не считаем
+        for batch_future, _ in in_flight:
+            batch_future.cancel()
@@ -0,0 +1,226 @@
+import bisect
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import torch
+import torch.nn.functional as F
+
+from config import main_config
+
+# Границы бакетов гистограмм (верхние границы, как `le` в Prometheus)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+WAIT_TIME_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    """
+    Thread-safe fixed-bucket histogram.
+    Observations larger than the last bucket bound land in the implicit +Inf bucket.
+    """
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns cumulative bucket counts plus count/sum/mean of all observations."""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        return {
+            "buckets": cumulative,
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+        }
+
+
+@dataclass
+class _PendingRequest:
+    input_ids: torch.Tensor
+    attention_mask: torch.Tensor
+    future: Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def num_chunks(self) -> int:
+        return self.input_ids.shape[0]
+
+
+class MicroBatcher:
+    """
+    Собирает чанки от конкурентных запросов в один прямой проход модели.
+
+    Фоновый поток берет первый запрос из очереди и добирает следующие, пока суммарное
+    число чанков не достигнет `max_batch_size` или не истечет `max_wait_ms` с момента
+    постановки первого запроса в очередь. Затем выполняется один вызов `infer_fn`
+    над объединенным батчем, и каждому запросу возвращаются его строки результата.
+    """
+    def __init__(self,
+                 infer_fn: Callable[[torch.Tensor, torch.Tensor], torch.Tensor],
+                 max_batch_size: int = main_config.INFERENCE_MAX_BATCH_SIZE,
+                 max_wait_ms: float = main_config.INFERENCE_MAX_WAIT_MS,
+                 pad_token_id: int = 1):
+        """
+        Args:
+            infer_fn: Callable taking (input_ids, attention_mask) of shape (num_chunks, chunk_size)
+                      and returning a tensor of shape (num_chunks, ...) with per-chunk outputs.
+            max_batch_size (int): Max number of chunks per forward pass. A single request larger
+                                  than this is still run, alone, as one batch.
+            max_wait_ms (float): Max time the oldest queued request waits before a partial batch is run.
+            pad_token_id (int): Pad ID used to bring requests of different widths (dynamic padding)
+                                to the width of the widest one in the batch.
+        """
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size must be positive.")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be non-negative.")
+
+        self._infer_fn = infer_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.pad_token_id = pad_token_id
+
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.wait_time_histogram = Histogram(WAIT_TIME_BUCKETS_MS)
+        self.batches_total = 0
+        self.requests_total = 0
+        self.real_tokens_total = 0
+        self.padded_tokens_total = 0
+
+        self._queue: "queue.Queue[Optional[_PendingRequest]]" = queue.Queue()
+        self._carry: Optional[_PendingRequest] = None  # запрос, не поместившийся в предыдущий батч
+        self._closed = False
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> Future:
+        """
+        Queues one request's chunks for inference.
+
+        Returns:
+            concurrent.futures.Future: Resolves to `infer_fn` output rows for these chunks.
+        """
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed.")
+        future = Future()
+        self._queue.put(_PendingRequest(input_ids, attention_mask, future))
+        return future
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stops the worker thread after already queued requests have been served."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_s * 1000.0,
+            "batches_total": self.batches_total,
+            "requests_total": self.requests_total,
+            "queue_depth": self._queue.qsize(),
+            "padding_waste_pct": (100.0 * (1.0 - self.real_tokens_total / self.padded_tokens_total)
+                                  if self.padded_tokens_total else 0.0),
+            "batch_size_chunks": self.batch_size_histogram.snapshot(),
+            "wait_time_ms": self.wait_time_histogram.snapshot(),
+        }
+
+    def _collect(self) -> Optional[List[_PendingRequest]]:
+        first = self._carry if self._carry is not None else self._queue.get()
+        self._carry = None
+        if first is None:
+            return None
+
+        batch = [first]
+        num_chunks = first.num_chunks
+        deadline = first.enqueued_at + self.max_wait_s
+        while num_chunks < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # После дедлайна все равно забираем то, что уже лежит в очереди
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopping = True
+                break
+            if num_chunks + item.num_chunks > self.max_batch_size:
+                self._carry = item
+                break
+            batch.append(item)
+            num_chunks += item.num_chunks
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+            self._run_batch(batch)
+            if self._stopping and self._carry is None:
+                break
+
+    def _run_batch(self, batch: List[_PendingRequest]) -> None:
+        # Отмененные до начала прохода запросы (клиент отключился) не считаются
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started_at = time.monotonic()
+        total_chunks = 0
+        for request in batch:
+            self.wait_time_histogram.observe((started_at - request.enqueued_at) * 1000.0)
+            total_chunks += request.num_chunks
+        self.batch_size_histogram.observe(total_chunks)
+        self.batches_total += 1
+        self.requests_total += len(batch)
+
+        try:
+            if len(batch) == 1:
+                input_ids, attention_mask = batch[0].input_ids, batch[0].attention_mask
+            else:
+                input_ids, attention_mask = self._concat(batch)
+            self.real_tokens_total += int(attention_mask.sum())
+            self.padded_tokens_total += attention_mask.numel()
+            outputs = self._infer_fn(input_ids, attention_mask)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        offset = 0
+        for request in batch:
+            request.future.set_result(outputs[offset:offset + request.num_chunks])
+            offset += request.num_chunks
+
+    def _concat(self, batch: List[_PendingRequest]):
+        """Concatenates the requests' chunks, right-padding each to the widest request in the batch."""
+        width = max(r.input_ids.shape[1] for r in batch)
+        input_ids = torch.cat([
+            F.pad(r.input_ids, (0, width - r.input_ids.shape[1]), value=self.pad_token_id) for r in batch
+        ], dim=0)
+        attention_mask = torch.cat([
+            F.pad(r.attention_mask, (0, width - r.attention_mask.shape[1]), value=0) for r in batch
+        ], dim=0)
+        return input_ids, attention_mask
@@ -0,0 +1,112 @@
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Tuple
+
+import torch
+
+from config import main_config
+from src.feature_engineering.tokenization import trim_padding
+from src.modeling.aggregation import ContractScoreAccumulator
+
+# Порядок, в котором чанки контракта отправляются в модель
+CHUNK_ORDERS = ("sequential", "longest_first")
+
+
+class EarlyExitStats:
+    """Thread-safe counters of chunks encoded vs. chunks skipped by early exit."""
+    def __init__(self):
+        self.requests_total = 0
+        self.early_exits_total = 0
+        self.chunks_total = 0
+        self.chunks_encoded_total = 0
+        self._lock = threading.Lock()
+
+    def record(self, num_chunks: int, num_encoded: int) -> None:
+        with self._lock:
+            self.requests_total += 1
+            self.early_exits_total += int(num_encoded < num_chunks)
+            self.chunks_total += num_chunks
+            self.chunks_encoded_total += num_encoded
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests, exits = self.requests_total, self.early_exits_total
+            total, encoded = self.chunks_total, self.chunks_encoded_total
+        return {
+            "requests_total": requests,
+            "early_exits_total": exits,
+            "chunks_total": total,
+            "chunks_encoded_total": encoded,
+            "chunks_saved_total": total - encoded,
+            "chunks_saved_per_request": (total - encoded) / requests if requests else 0.0,
+            "chunks_saved_pct": 100.0 * (total - encoded) / total if total else 0.0,
+        }
+
+
+def chunk_order(attention_mask: torch.Tensor, order: str) -> torch.Tensor:
+    """Indices of the chunks in the order they are scored."""
+    if order not in CHUNK_ORDERS:
+        raise ValueError(f"Unknown chunk order '{order}'. Expected one of {CHUNK_ORDERS}.")
+    if order == "longest_first":
+        # Последний чанк контракта обычно короткий и реже содержит искомый паттерн
+        return torch.argsort(attention_mask.sum(dim=1), descending=True, stable=True)
+    return torch.arange(attention_mask.shape[0])
+
+
+def score_chunks_early_exit(
+    predict_fn: Callable[[torch.Tensor, torch.Tensor], Any],
+    input_ids: torch.Tensor,
+    attention_mask: torch.Tensor,
+    method: str = main_config.CHUNK_AGGREGATION,
+    top_k: int = main_config.CHUNK_AGGREGATION_TOP_K,
+    threshold: float = main_config.CONTRACT_THRESHOLD,
+    group_size: int = main_config.INFERENCE_EARLY_EXIT_GROUP_SIZE,
+    order: str = main_config.INFERENCE_EARLY_EXIT_ORDER,
+    pipeline: bool = False
+) -> Tuple[torch.Tensor, int]:
+    """
+    Scores one contract's chunks `group_size` at a time and stops as soon as the thresholded
+    contract result can no longer change (ContractScoreAccumulator.is_decided), e.g. every label
+    is already positive under max aggregation.
+
+    The returned probabilities cover only the encoded chunks. Aggregating them gives the same
+    thresholded labels as aggregating all chunks, so they can go to the result cache as is.
+
+    Args:
+        predict_fn: (input_ids, attention_mask) -> chunk probabilities (num_chunks, num_labels) on CPU;
+            with `pipeline` it returns a concurrent.futures.Future of them (MicroBatcher.submit).
+        pipeline (bool): Submit the next group before waiting for the current one, so a queued
+            round trip (e.g. the micro-batcher's max wait) overlaps the current forward pass.
+            A prefetched group that turns out to be unneeded is cancelled and not counted.
+
+    Returns:
+        Tuple[torch.Tensor, int]: Probabilities of the encoded chunks (in scoring order) and their number.
+    """
+    if group_size <= 0:
+        raise ValueError("group_size must be positive.")
+    num_chunks = input_ids.shape[0]
+    indices = chunk_order(attention_mask, order)
+    groups = [indices[start:start + group_size] for start in range(0, num_chunks, group_size)]
+    lookahead = 1 if pipeline else 0
+    pending = deque()  # Запущенные группы по порядку: тензоры (синхронно) или Future (pipeline)
+
+    accumulator = None
+    outputs = []
+    encoded = 0
+    for position, group in enumerate(groups):
+        while len(pending) <= lookahead and position + len(pending) < len(groups):
+            launched = groups[position + len(pending)]
+            pending.append(predict_fn(*trim_padding(input_ids[launched], attention_mask[launched])))
+        probs = pending.popleft()
+        if pipeline:
+            probs = probs.result()
+        outputs.append(probs)
+        encoded += len(group)
+        if accumulator is None:
+            accumulator = ContractScoreAccumulator(1, probs.shape[1], method=method, top_k=top_k)
+        accumulator.update(probs, torch.zeros(len(group), dtype=torch.long))
+        if bool(accumulator.is_decided(torch.tensor([num_chunks - encoded]), threshold)[0]):
+            break
+    for future in pending:
+        future.cancel()  # Уже начатый проход батчера досчитается, но в ответ и статистику не попадет
+    return torch.cat(outputs, dim=0), encoded
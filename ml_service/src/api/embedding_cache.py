@@ -0,0 +1,113 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+
+from config import main_config
+
+
+class ChunkEmbeddingCache:
+    """
+    LRU-кэш CLS-эмбеддингов отдельных чанков.
+
+    Ключ — хэш значимой (без паддинга) части `input_ids` чанка, поэтому одинаковые куски
+    кода (вендорный SafeMath, базовый ERC20 и т.п.) в разных контрактах кодируются один раз.
+    Энкодер запускается только на чанках, которых нет в кэше; голову классификатора
+    вызывающий код прогоняет заново на полном батче эмбеддингов.
+    """
+    def __init__(self, max_bytes: int = main_config.EMBEDDING_CACHE_MAX_BYTES):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be positive.")
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[bytes, torch.Tensor]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def chunk_key(input_ids: torch.Tensor, attention_mask: torch.Tensor) -> bytes:
+        """Hash of one chunk's non-padding token IDs (independent of the padded width)."""
+        length = int(attention_mask.sum())
+        token_ids = input_ids[:length].to(device="cpu", dtype=torch.int64).contiguous()
+        return hashlib.blake2b(token_ids.numpy().tobytes(), digest_size=16).digest()
+
+    def encode(self,
+               encode_fn: Callable[[torch.Tensor, torch.Tensor], torch.Tensor],
+               input_ids: torch.Tensor,
+               attention_mask: torch.Tensor,
+               device: torch.device) -> torch.Tensor:
+        """
+        Returns CLS embeddings for a batch of chunks, running `encode_fn` only on cache misses.
+
+        Args:
+            encode_fn: Callable mapping (input_ids, attention_mask) on `device` to (n, hidden_size) embeddings,
+                       typically `ContractVulnerabilityClassifier.encode_chunks`.
+            input_ids (torch.Tensor): Tensor of shape (num_chunks, chunk_size).
+            attention_mask (torch.Tensor): Tensor of shape (num_chunks, chunk_size).
+            device (torch.device): Device the encoder runs on; the result is placed there too.
+
+        Returns:
+            torch.Tensor: Embeddings of shape (num_chunks, hidden_size).
+        """
+        keys = [self.chunk_key(input_ids[i], attention_mask[i]) for i in range(input_ids.shape[0])]
+
+        rows: List[Optional[torch.Tensor]] = [None] * len(keys)
+        missing: Dict[bytes, List[int]] = {}  # ключ -> строки батча (одинаковые чанки кодируем один раз)
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._entries.get(key)
+                if cached is not None:
+                    self._entries.move_to_end(key)
+                    rows[i] = cached
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    self.misses += 1
+
+        if missing:
+            first_rows = [positions[0] for positions in missing.values()]
+            fresh = encode_fn(input_ids[first_rows].to(device), attention_mask[first_rows].to(device))
+            fresh_cpu = fresh.detach().cpu()
+            with self._lock:
+                for j, (key, positions) in enumerate(missing.items()):
+                    # clone: строка не должна удерживать в памяти весь батч
+                    embedding = fresh_cpu[j].clone()
+                    self._insert(key, embedding)
+                    for i in positions:
+                        rows[i] = embedding
+
+        return torch.stack(rows).to(device)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _insert(self, key: bytes, embedding: torch.Tensor) -> None:
+        if key in self._entries:
+            return
+        size = embedding.numel() * embedding.element_size()
+        self._entries[key] = embedding
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.numel() * evicted.element_size()
+            self.evictions += 1
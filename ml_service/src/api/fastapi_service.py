@@ -1,17 +1,43 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
-import torch
+from typing import AsyncIterator, List, Optional
+import json
+import numpy as np
 import os
 import sys
-import re
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 from config import main_config
-from src.modeling.models import ContractVulnerabilityClassifier
-from src.feature_engineering.tokenization import get_tokenizer, tokenize_and_chunk_code
+from src.modeling.aggregation import aggregate_chunk_probs
+from src.feature_engineering.tokenization import get_tokenizer, tokenize_and_chunk_batch, trim_padding
+from src.api.batching import MicroBatcher
+from src.api.batch_analysis import iter_packed_contract_probs
+from src.api.worker_pool import InferenceWorkerPool, WorkerPoolSaturatedError, predict_code_probs_in_worker
+from src.api.result_cache import ResultCache, checkpoint_fingerprint, early_exit_variant, make_cache_key
+from src.api.backends import create_backend, default_device
+from src.api.early_exit import EarlyExitStats, score_chunks_early_exit
+from src.api.readiness import ModelLoadStatus
 
 MODEL_PATH = os.path.join(os.path.dirname(__file__), '../../models/vuln_classifier_microsoft_codebert-base_chunks_best.pt')
+BASE_MODEL_NAME = "microsoft/codebert-base"
+# Дистиллированный студент: тот же токенизатор, энкодер усечен до STUDENT_NUM_HIDDEN_LAYERS слоев
+# (или меньшая модель STUDENT_BASE_MODEL с тем же словарем)
+MODEL_BASE_NAME = BASE_MODEL_NAME
+MODEL_NUM_HIDDEN_LAYERS = None
+if main_config.INFERENCE_SERVE_STUDENT:
+    MODEL_PATH = str(main_config.STUDENT_MODEL_PATH)
+    MODEL_BASE_NAME = main_config.STUDENT_BASE_MODEL or BASE_MODEL_NAME
+    MODEL_NUM_HIDDEN_LAYERS = None if main_config.STUDENT_BASE_MODEL else main_config.STUDENT_NUM_HIDDEN_LAYERS
+# Без доступа к хабу: конфиг энкодера и токенизатор из локального каталога (save_offline_assets)
+TOKENIZER_NAME = BASE_MODEL_NAME
+if os.path.isdir(main_config.INFERENCE_OFFLINE_ASSETS_DIR):
+    TOKENIZER_NAME = str(main_config.INFERENCE_OFFLINE_ASSETS_DIR)
+    if MODEL_BASE_NAME == BASE_MODEL_NAME:
+        MODEL_BASE_NAME = TOKENIZER_NAME
 
 # Маппинг: label -> (name, description, severity, category, recommendation)
 VULN_INFO = [
@@ -81,58 +107,313 @@ class Vulnerability(BaseModel):
 class AnalyzeResponse(BaseModel):
     vulnerabilities: List[Vulnerability]
 
-app = FastAPI(title="Vulnerability Classifier API")
+class BatchContract(BaseModel):
+    code: str
+    id: Optional[str] = None
+
+class BatchAnalyzeRequest(BaseModel):
+    contracts: List[BatchContract]
+
+# int8-варианты (динамическая квантизация) и ONNX Runtime исполняются только на CPU
+device = default_device(main_config.INFERENCE_BACKEND, main_config.INFERENCE_MODEL_VARIANT)
+
+# Состояние инференса заполняет _load_inference() в lifespan-обработчике, а не импорт модуля
+backend = None
+tokenizer = None
+embedding_cache = None
+batcher = None
+result_cache = None
+_model_id = None
+worker_pool = None
+_pool_predict_fn = None
+# Счетчики сэкономленных чанков (в режиме process считаются внутри воркеров и здесь не видны)
+early_exit_stats = EarlyExitStats()
+load_status = ModelLoadStatus()
+
+def _load_inference() -> None:
+    """Модель, токенизатор, micro-batcher, кэши и пул воркеров. Ошибка оставляет сервис неготовым."""
+    global backend, tokenizer, embedding_cache, batcher, result_cache, _model_id, worker_pool, _pool_predict_fn
+    load_status.start()
+    try:
+        backend = create_backend(
+            main_config.INFERENCE_BACKEND,
+            MODEL_PATH,
+            MODEL_BASE_NAME,
+            num_labels=len(VULN_INFO),
+            device=device,
+            num_threads=None,  # Модель основного процесса гоняет один поток micro-batcher: все ядра ему
+            use_embedding_cache=main_config.EMBEDDING_CACHE_ENABLED,
+            num_hidden_layers=MODEL_NUM_HIDDEN_LAYERS
+        )
+        load_status.mark("model")
+        tokenizer = get_tokenizer(TOKENIZER_NAME)
+        load_status.mark("tokenizer")
+
+        # Энкодер прогоняется только на чанках, которых еще нет в кэше эмбеддингов (только torch-бэкенд)
+        embedding_cache = getattr(backend, "embedding_cache", None)
+
+        # Чанки конкурентных запросов объединяются в общие батчи фоновым потоком
+        batcher = MicroBatcher(
+            backend.predict_probs,
+            max_batch_size=main_config.INFERENCE_MAX_BATCH_SIZE,
+            max_wait_ms=main_config.INFERENCE_MAX_WAIT_MS,
+            pad_token_id=tokenizer.pad_token_id
+        )
+
+        # Повторные отправки одного и того же контракта отдаются из кэша без токенизации и инференса
+        if main_config.RESULT_CACHE_ENABLED:
+            result_cache = ResultCache()
+            _model_id = checkpoint_fingerprint(backend.artifact_path)
+
+        # Ограниченный пул для async-эндпоинта: токенизация и инференс не блокируют event loop
+        if main_config.INFERENCE_WORKER_MODE == "process":
+            worker_pool = InferenceWorkerPool(
+                mode="process",
+                process_initargs=(MODEL_PATH, MODEL_BASE_NAME, len(VULN_INFO), MODEL_NUM_HIDDEN_LAYERS, TOKENIZER_NAME)
+            )
+            _pool_predict_fn = predict_code_probs_in_worker
+        else:
+            worker_pool = InferenceWorkerPool(mode="thread")
+            _pool_predict_fn = _compute_chunk_probs
+        # Процессы-воркеры загружают свою копию модели сейчас, а не на первых запросах
+        worker_pool.warmup()
+        load_status.mark("workers")
+    except Exception as e:
+        print(f"Ошибка загрузки модели или токенизатора: {e}")
+        load_status.fail(e)
+        return
+    load_status.finish()
+
+def _shutdown_inference() -> None:
+    if worker_pool is not None:
+        worker_pool.shutdown(wait=False)
+    if batcher is not None:
+        batcher.close(timeout=5.0)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop = asyncio.get_running_loop()
+    if main_config.INFERENCE_LOAD_IN_BACKGROUND:
+        # Сервер сразу принимает соединения: liveness отвечает, readiness - 503 до конца загрузки
+        loading = loop.run_in_executor(None, _load_inference)
+    else:
+        await loop.run_in_executor(None, _load_inference)
+        loading = None
+    yield
+    if loading is not None:
+        await loading
+    _shutdown_inference()
+
+app = FastAPI(title="Vulnerability Classifier API", lifespan=lifespan)
+
+def _is_valid_code(code: str) -> bool:
+    return bool(code) and isinstance(code, str) and len(code) >= 5
+
+def _ensure_model_loaded() -> None:
+    if not load_status.is_ready():
+        if load_status.is_loading():
+            raise HTTPException(status_code=503, detail="Модель загружается, повторите запрос позже.")
+        raise HTTPException(status_code=500, detail="Модель или токенизатор не загружены.")
+
+def _validate_code(code: str) -> None:
+    if not _is_valid_code(code):
+        raise HTTPException(status_code=400, detail="Некорректный код для анализа.")
+    _ensure_model_loaded()
+
+def _compute_chunk_probs(code: str) -> Optional[np.ndarray]:
+    """Токенизация и инференс одного контракта. Возвращает (num_chunks, num_labels) или None, если чанков нет."""
+    # Токенизация и чанкинг
+    batch = tokenize_and_chunk_batch(
+        [code],
+        tokenizer,
+        max_total_tokens=main_config.MAX_TOTAL_TOKENS,
+        chunk_size=main_config.MODEL_CHUNK_SIZE,
+        overlap=main_config.CHUNK_OVERLAP
+    )
+    if batch['input_ids'].shape[0] == 0:
+        return None
+    # Паддинг только до самого длинного чанка запроса, а не до MODEL_CHUNK_SIZE
+    input_ids, attention_mask = trim_padding(batch['input_ids'], batch['attention_mask'])
+    # Прямой проход выполняет micro-batcher вместе с чанками других запросов
+    if main_config.INFERENCE_EARLY_EXIT:
+        # Следующая группа ставится в очередь батчера, пока считается текущая
+        probs, num_encoded = score_chunks_early_exit(batcher.submit, input_ids, attention_mask, pipeline=True)
+        early_exit_stats.record(input_ids.shape[0], num_encoded)
+        return probs.numpy()
+    return batcher.submit(input_ids, attention_mask).result().numpy()
+
+def _cache_key(code: str, early_exit: Optional[bool] = None) -> Optional[str]:
+    """`early_exit` - считает ли эндпоинт с ранним выходом (по умолчанию INFERENCE_EARLY_EXIT)."""
+    if result_cache is None:
+        return None
+    if early_exit is None:
+        early_exit = main_config.INFERENCE_EARLY_EXIT
+    # С ранним выходом в кэш попадают вероятности лишь части чанков: они верны только для той
+    # агрегации и порога, по которым обрезались, поэтому эти настройки входят в ключ.
+    # Batch-эндпоинт всегда считает все чанки и пишет под ключом "full"
+    result_variant = early_exit_variant(
+        main_config.CHUNK_AGGREGATION, main_config.CHUNK_AGGREGATION_TOP_K, main_config.CONTRACT_THRESHOLD
+    ) if early_exit else "full"
+    return make_cache_key(
+        code,
+        _model_id,
+        max_total_tokens=main_config.MAX_TOTAL_TOKENS,
+        chunk_size=main_config.MODEL_CHUNK_SIZE,
+        overlap=main_config.CHUNK_OVERLAP,
+        result_variant=result_variant
+    )
+
+def _cached_result(key: Optional[str]) -> Optional[np.ndarray]:
+    return result_cache.get(key) if key is not None else None
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+def _cached_results(keys: List[Optional[str]]) -> List[Optional[np.ndarray]]:
+    return [_cached_result(key) for key in keys]
 
-# Загрузка модели и токенизатора
-try:
-    model = ContractVulnerabilityClassifier(
-        base_model_name="microsoft/codebert-base",
-        num_labels=len(VULN_INFO)
+def _store_result(key: Optional[str], probs: Optional[np.ndarray]) -> None:
+    if key is None:
+        return
+    # Пустой массив (0, num_labels) кэширует и результат "чанков нет"
+    result_cache.put(key, probs if probs is not None else np.zeros((0, len(VULN_INFO)), dtype=np.float32))
+
+def _build_response(probs: Optional[np.ndarray]) -> dict:
+    if probs is None or len(probs) == 0:
+        return {"vulnerabilities": []}
+    # То же правило сведения чанков, что и в contract_* метриках валидации
+    contract_probs = aggregate_chunk_probs(
+        probs, method=main_config.CHUNK_AGGREGATION, top_k=main_config.CHUNK_AGGREGATION_TOP_K
     )
-    model.load_state_dict(torch.load(MODEL_PATH, map_location=device))
-    model.to(device)
-    model.eval()
-    tokenizer = get_tokenizer("microsoft/codebert-base")
-except Exception as e:
-    print(f"Ошибка загрузки модели или токенизатора: {e}")
-    model = None
-    tokenizer = None
+    found = contract_probs > main_config.CONTRACT_THRESHOLD  # (num_labels,)
+    vulnerabilities = []
+    for idx, present in enumerate(found):
+        if present:
+            vuln = VULN_INFO[idx].copy()
+            vulnerabilities.append(vuln)
+    return {"vulnerabilities": vulnerabilities}
 
 @app.post("/api/analyze", response_model=AnalyzeResponse)
 def analyze_code(request: AnalyzeRequest):
-    code = request.code
-    if not code or not isinstance(code, str) or len(code) < 5:
-        raise HTTPException(status_code=400, detail="Некорректный код для анализа.")
-    if model is None or tokenizer is None:
-        raise HTTPException(status_code=500, detail="Модель или токенизатор не загружены.")
+    _validate_code(request.code)
+    key = _cache_key(request.code)
+    probs = _cached_result(key)
+    if probs is not None:
+        return _build_response(probs)
     try:
-        # Токенизация и чанкинг
-        chunks = tokenize_and_chunk_code(
-            code,
-            tokenizer,
-            max_total_tokens=main_config.MAX_TOTAL_TOKENS,
-            chunk_size=main_config.MODEL_CHUNK_SIZE,
-            overlap=main_config.CHUNK_OVERLAP
-        )
-        if not chunks:
-            return {"vulnerabilities": []}
-        input_ids = torch.stack([c['input_ids'] for c in chunks]).to(device)
-        attention_mask = torch.stack([c['attention_mask'] for c in chunks]).to(device)
-        with torch.no_grad():
-            logits = model(input_ids, attention_mask)  # (num_chunks, num_labels)
-            probs = torch.sigmoid(logits).cpu().numpy()  # Вероятности для каждого класса
-        threshold = 0.5
-        found = (probs > threshold).max(axis=0)  # (num_labels,)
-        vulnerabilities = []
-        for idx, present in enumerate(found):
-            if present:
-                vuln = VULN_INFO[idx].copy()
-                vulnerabilities.append(vuln)
-        return {"vulnerabilities": vulnerabilities}
+        probs = _compute_chunk_probs(request.code)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка анализа: {str(e)}")
+    _store_result(key, probs)
+    return _build_response(probs)
+
+@app.post("/api/analyze/async", response_model=AnalyzeResponse)
+async def analyze_code_async(request: AnalyzeRequest):
+    """Тот же анализ, но работа уходит в ограниченный пул; при переполненной очереди отвечаем 429."""
+    _validate_code(request.code)
+    key = _cache_key(request.code)
+    # Дисковый уровень кэша (SQLite под общим локом) блокирует: обращения к кэшу - вне event loop
+    probs = await asyncio.to_thread(_cached_result, key)
+    if probs is not None:
+        return _build_response(probs)
+    try:
+        probs = await worker_pool.run(_pool_predict_fn, request.code)
+    except WorkerPoolSaturatedError as e:
+        raise HTTPException(status_code=429, detail=f"Сервис перегружен, повторите запрос позже. {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка анализа: {str(e)}")
+    await asyncio.to_thread(_store_result, key, probs)
+    return _build_response(probs)
+
+def _ndjson_line(index: int, contract_id: Optional[str], payload: dict) -> str:
+    return json.dumps({"index": index, "id": contract_id, **payload}, ensure_ascii=False) + "\n"
+
+async def _stream_batch_results(contracts: List[BatchContract]) -> AsyncIterator[str]:
+    """Результаты из кэша и некорректные контракты - сразу, остальные - по мере готовности их чанков."""
+    valid = [index for index, contract in enumerate(contracts) if _is_valid_code(contract.code)]
+    # Чанки упаковываются без раннего выхода: результаты полные и кэшируются под ключом "full"
+    valid_keys = [_cache_key(contracts[index].code, early_exit=False) for index in valid]
+    # Все обращения к кэшу одним заходом в поток: SQLite-уровень не должен блокировать event loop
+    cached = dict(zip(valid, await asyncio.to_thread(_cached_results, valid_keys)))
+    keys_by_index = dict(zip(valid, valid_keys))
+
+    positions, codes, keys = [], [], []
+    for index, contract in enumerate(contracts):
+        if index not in keys_by_index:
+            yield _ndjson_line(index, contract.id, {"error": "Некорректный код для анализа."})
+            continue
+        probs = cached[index]
+        if probs is not None:
+            yield _ndjson_line(index, contract.id, _build_response(probs))
+            continue
+        positions.append(index)
+        codes.append(contract.code)
+        keys.append(keys_by_index[index])
+
+    try:
+        async for position, probs in iter_packed_contract_probs(codes, tokenizer, batcher.submit):
+            await asyncio.to_thread(_store_result, keys[position], probs)
+            index = positions[position]
+            yield _ndjson_line(index, contracts[index].id, _build_response(probs))
+    except Exception as e:
+        # Статус 200 уже отправлен: ошибка - последняя строка потока, неотвеченные контракты остаются без строки
+        yield json.dumps({"error": f"Ошибка анализа: {str(e)}"}, ensure_ascii=False) + "\n"
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(request: BatchAnalyzeRequest):
+    """
+    Анализ многих контрактов одним запросом. Чанки всех контрактов упаковываются в полные батчи
+    модели; ответ - NDJSON, по строке {"index", "id", "vulnerabilities"} (или "error") на контракт
+    в порядке готовности. При отключении клиента оставшаяся работа отменяется.
+    """
+    _ensure_model_loaded()
+    if len(request.contracts) > main_config.INFERENCE_BATCH_MAX_CONTRACTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Не более {main_config.INFERENCE_BATCH_MAX_CONTRACTS} контрактов в одном запросе."
+        )
+    return StreamingResponse(_stream_batch_results(request.contracts), media_type="application/x-ndjson")
+
+@app.get("/api/metrics/batching")
+def batching_metrics():
+    """Гистограммы размера батча и времени ожидания micro-batcher'а для настройки throughput/p99."""
+    if batcher is None:
+        raise HTTPException(status_code=503, detail="Модель не загружена.")
+    return batcher.stats()
+
+@app.get("/api/metrics/workers")
+def worker_pool_metrics():
+    if worker_pool is None:
+        raise HTTPException(status_code=503, detail="Модель не загружена.")
+    return worker_pool.stats()
+
+@app.get("/api/metrics/cache")
+def result_cache_metrics():
+    if result_cache is None:
+        raise HTTPException(status_code=503, detail="Кэш результатов отключен.")
+    return result_cache.stats()
+
+@app.get("/api/metrics/embedding-cache")
+def embedding_cache_metrics():
+    if embedding_cache is None:
+        raise HTTPException(status_code=503, detail="Кэш эмбеддингов отключен.")
+    return embedding_cache.stats()
+
+@app.get("/api/metrics/early-exit")
+def early_exit_metrics():
+    if not main_config.INFERENCE_EARLY_EXIT:
+        raise HTTPException(status_code=503, detail="Ранний выход отключен.")
+    return early_exit_stats.stats()
+
+@app.get("/api/health/live")
+def liveness():
+    """Процесс жив и обслуживает event loop (загрузка модели может еще идти)."""
+    return {"status": "alive"}
+
+@app.get("/api/health/ready")
+def readiness():
+    """200, когда модель и воркеры загружены; иначе 503 со стадией загрузки или ошибкой."""
+    status = load_status.snapshot()
+    if status["state"] != "ready":
+        return JSONResponse(status_code=503, content=status)
+    return status
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,59 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class ModelLoadStatus:
+    """
+    Thread-safe state of the service's model loading for the readiness endpoint:
+    "pending" -> "loading" -> "ready" | "failed", with the time spent on every stage.
+    """
+    def __init__(self):
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self._stages: Dict[str, float] = {}
+        self._started: Optional[float] = None
+        self._last_mark: Optional[float] = None
+        self._finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            self.state = "loading"
+            self._started = self._last_mark = time.perf_counter()
+
+    def mark(self, stage: str) -> None:
+        """Records the time since the previous mark as the duration of `stage`."""
+        with self._lock:
+            now = time.perf_counter()
+            self._stages[stage] = now - self._last_mark
+            self._last_mark = now
+
+    def finish(self) -> None:
+        with self._lock:
+            self.state = "ready"
+            self._finished = time.perf_counter()
+
+    def fail(self, error: BaseException) -> None:
+        with self._lock:
+            self.state = "failed"
+            self.error = f"{type(error).__name__}: {error}"
+            self._finished = time.perf_counter()
+
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def is_loading(self) -> bool:
+        return self.state in ("pending", "loading")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = None
+            if self._started is not None:
+                elapsed = (self._finished or time.perf_counter()) - self._started
+            return {
+                "state": self.state,
+                "error": self.error,
+                "elapsed_s": elapsed,
+                "stages_s": dict(self._stages),
+            }
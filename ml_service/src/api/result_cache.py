@@ -0,0 +1,233 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from config import main_config
+
+# Примерные накладные расходы на одну запись в памяти (ключ, кортеж, узел OrderedDict)
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def checkpoint_fingerprint(model_path: str) -> str:
+    """Cheap identity of a checkpoint file (name, size, mtime) without reading its contents."""
+    stat = os.stat(model_path)
+    identity = f"{os.path.basename(model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:16]
+
+
+def make_cache_key(code: str,
+                   model_id: str,
+                   max_total_tokens: int = main_config.MAX_TOTAL_TOKENS,
+                   chunk_size: int = main_config.MODEL_CHUNK_SIZE,
+                   overlap: int = main_config.CHUNK_OVERLAP,
+                   result_variant: str = "full") -> str:
+    """
+    Content address of an analysis result: exact source + model identity + chunking parameters.
+
+    `result_variant` separates results that are only valid under some settings: "full" probabilities
+    of every chunk fit any aggregation, while early-exit results (a prefix of the chunks) only
+    reproduce the labels of the aggregation and threshold that pruned them (see early_exit_variant).
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f"{model_id}|t{max_total_tokens}|c{chunk_size}|o{overlap}|{result_variant}|".encode("utf-8"))
+    # Хэшируем ровно то, что увидит токенизатор: BPE кодирует и пробелы, и переводы строк,
+    # поэтому любая "нормализация" могла бы склеить входы с разными token ID
+    hasher.update(code.encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def early_exit_variant(method: str = main_config.CHUNK_AGGREGATION,
+                       top_k: int = main_config.CHUNK_AGGREGATION_TOP_K,
+                       threshold: float = main_config.CONTRACT_THRESHOLD) -> str:
+    """result_variant of early-exit results: the settings their skipped chunks were pruned for."""
+    return f"early_exit:{method}:k{top_k}:th{threshold!r}"
+
+
+class ResultCache:
+    """
+    LRU + TTL кэш результатов анализа (вероятности по чанкам, shape (num_chunks, num_labels)).
+
+    Память ограничена `max_bytes`; при переполнении вытесняются давно не использованные записи.
+    Опционально записи дублируются в SQLite (`sqlite_path`), чтобы кэш переживал рестарты;
+    дисковый уровень ограничен `disk_max_bytes` и вытесняет записи по времени последнего доступа.
+    """
+    def __init__(self,
+                 max_bytes: int = main_config.RESULT_CACHE_MAX_BYTES,
+                 ttl_seconds: float = main_config.RESULT_CACHE_TTL_SECONDS,
+                 sqlite_path: Optional[str] = main_config.RESULT_CACHE_SQLITE_PATH,
+                 disk_max_bytes: int = main_config.RESULT_CACHE_DISK_MAX_BYTES):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be positive.")
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_bytes = disk_max_bytes
+
+        # key -> (expires_at, probs)
+        self._entries: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.expirations = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        if sqlite_path:
+            self._open_disk_tier(str(sqlite_path))
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Returns the cached result or None on a miss. Disk hits are promoted into memory."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+                self.expirations += 1
+
+            if self._db is not None:
+                found = self._disk_get(key, now)
+                if found is not None:
+                    value, expires_at = found
+                    self.disk_hits += 1
+                    # Срок жизни - сохраненный в строке, а не новый TTL: иначе часто запрашиваемое
+                    # значение, перекочевывая между уровнями, жило бы бесконечно
+                    self._insert(key, value, expires_at)
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: np.ndarray) -> None:
+        """Stores a 2-D result array (an empty (0, num_labels) array marks "no chunks")."""
+        value = np.ascontiguousarray(value, dtype=np.float32)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._insert(key, value, expires_at)
+            if self._db is not None:
+                self._disk_put(key, value, expires_at)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+                self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_enabled": self._db is not None,
+                "disk_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "expirations": self.expirations,
+            }
+
+    # --- уровень в памяти (вызывается под self._lock) ---
+
+    @staticmethod
+    def _entry_size(value: np.ndarray) -> int:
+        return value.nbytes + _ENTRY_OVERHEAD_BYTES
+
+    def _insert(self, key: str, value: np.ndarray, expires_at: float) -> None:
+        if key in self._entries:
+            self._remove(key)
+        size = self._entry_size(value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (expires_at, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._bytes -= self._entry_size(value)
+
+    # --- уровень SQLite (вызывается под self._lock) ---
+
+    def _open_disk_tier(self, sqlite_path: str) -> None:
+        directory = os.path.dirname(sqlite_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, payload BLOB NOT NULL, num_rows INTEGER NOT NULL,"
+            " num_cols INTEGER NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_results_last_access ON results(last_access)")
+        self._db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        self._db.commit()
+        self._disk_bytes = self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM results"
+        ).fetchone()[0]
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[np.ndarray, float]]:
+        """(value, expires_at) of a live row, or None (an expired row is deleted)."""
+        row = self._db.execute(
+            "SELECT payload, num_rows, num_cols, expires_at FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        payload, num_rows, num_cols, expires_at = row
+        if expires_at <= now:
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._db.commit()
+            self._disk_bytes -= len(payload)
+            self.expirations += 1
+            return None
+        self._db.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        return np.frombuffer(payload, dtype=np.float32).reshape(num_rows, num_cols).copy(), expires_at
+
+    def _disk_put(self, key: str, value: np.ndarray, expires_at: float) -> None:
+        payload = value.tobytes()
+        previous = self._db.execute("SELECT LENGTH(payload) FROM results WHERE key = ?", (key,)).fetchone()
+        if previous is not None:
+            self._disk_bytes -= previous[0]
+        num_rows, num_cols = value.shape
+        self._db.execute(
+            "INSERT OR REPLACE INTO results (key, payload, num_rows, num_cols, expires_at, last_access)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (key, payload, num_rows, num_cols, expires_at, time.time())
+        )
+        self._disk_bytes += len(payload)
+        while self._disk_bytes > self.disk_max_bytes:
+            oldest = self._db.execute(
+                "SELECT key, LENGTH(payload) FROM results ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            if oldest is None:
+                break
+            self._db.execute("DELETE FROM results WHERE key = ?", (oldest[0],))
+            self._disk_bytes -= oldest[1]
+            self.disk_evictions += 1
+        self._db.commit()
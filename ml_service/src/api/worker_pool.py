@@ -0,0 +1,206 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from config import main_config
+from src.api.backends import InferenceBackend, create_backend
+from src.feature_engineering.tokenization import get_tokenizer, tokenize_and_chunk_batch, trim_padding
+from src.api.early_exit import score_chunks_early_exit
+
+
+class WorkerPoolSaturatedError(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+# Состояние процесса-воркера (режим "process"): у каждого процесса своя модель и токенизатор
+_worker_backend: Optional[InferenceBackend] = None
+_worker_tokenizer = None
+
+
+def _init_process_worker(model_path: str,
+                         base_model_name: str,
+                         num_labels: int,
+                         num_hidden_layers: Optional[int],
+                         tokenizer_name: str,
+                         num_threads: int) -> None:
+    global _worker_backend, _worker_tokenizer
+    torch.set_num_threads(num_threads)
+    _worker_backend = create_backend(
+        main_config.INFERENCE_BACKEND,
+        model_path,
+        base_model_name,
+        num_labels=num_labels,
+        num_threads=num_threads,
+        num_hidden_layers=num_hidden_layers
+    )
+    # Тот же токенизатор, что у основного процесса (в т.ч. офлайн-каталог): иначе чанки расходились бы
+    _worker_tokenizer = get_tokenizer(tokenizer_name)
+
+
+def _ping() -> bool:
+    return True
+
+
+def _wait_at_barrier(barrier, timeout: float) -> int:
+    """Задача прогрева: держит процесс, пока все воркеры не дойдут до барьера. Возвращает PID."""
+    barrier.wait(timeout)
+    return os.getpid()
+
+
+def predict_code_probs_in_worker(code: str) -> Optional[np.ndarray]:
+    """
+    Tokenizes and scores one contract inside a process worker.
+
+    Returns:
+        Optional[np.ndarray]: Per-chunk probabilities of shape (num_chunks, num_labels),
+                              or None if the code produced no chunks.
+    """
+    batch = tokenize_and_chunk_batch(
+        [code],
+        _worker_tokenizer,
+        max_total_tokens=main_config.MAX_TOTAL_TOKENS,
+        chunk_size=main_config.MODEL_CHUNK_SIZE,
+        overlap=main_config.CHUNK_OVERLAP
+    )
+    if batch['input_ids'].shape[0] == 0:
+        return None
+    input_ids, attention_mask = trim_padding(batch['input_ids'], batch['attention_mask'])
+    if main_config.INFERENCE_EARLY_EXIT:
+        probs, _ = score_chunks_early_exit(_worker_backend.predict_probs, input_ids, attention_mask)
+        return probs.numpy()
+    return _worker_backend.predict_probs(input_ids, attention_mask).numpy()
+
+
+class InferenceWorkerPool:
+    """
+    Ограниченный пул исполнителей для токенизации и инференса вне event loop.
+
+    Одновременно принимается не более `num_workers + max_queue_size` задач; сверх этого
+    `run` сразу бросает WorkerPoolSaturatedError, и API отвечает 429 вместо того, чтобы
+    копить очередь и раздувать хвост латентности.
+    """
+    def __init__(self,
+                 num_workers: int = main_config.INFERENCE_NUM_WORKERS,
+                 threads_per_worker: int = main_config.INFERENCE_THREADS_PER_WORKER,
+                 max_queue_size: int = main_config.INFERENCE_MAX_QUEUE_SIZE,
+                 mode: str = main_config.INFERENCE_WORKER_MODE,
+                 process_initargs: Optional[Tuple[str, str, int, Optional[int], str]] = None):
+        """
+        Args:
+            num_workers (int): Number of worker threads or processes.
+            threads_per_worker (int): `torch.set_num_threads` of every worker process ("process" mode only:
+                the setting is process-wide, and thread workers only wait for the micro-batcher).
+            max_queue_size (int): Number of tasks allowed to wait for a free worker.
+            mode (str): "thread" or "process".
+            process_initargs (Optional[Tuple[str, str, int, Optional[int], str]]): (model_path, base_model_name,
+                num_labels, num_hidden_layers, tokenizer_name), required in "process" mode; tokenizer_name
+                must be the tokenizer the service itself uses.
+        """
+        if num_workers <= 0:
+            raise ValueError("num_workers must be positive.")
+        if max_queue_size < 0:
+            raise ValueError("max_queue_size must be non-negative.")
+
+        self.mode = mode
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.capacity = num_workers + max_queue_size
+
+        if mode == "thread":
+            # Потоки только ждут micro-batcher (модель гоняет его поток), поэтому число потоков
+            # torch не трогаем: set_num_threads действует на весь процесс, в т.ч. на /api/analyze
+            self._executor: Executor = ThreadPoolExecutor(
+                max_workers=num_workers,
+                thread_name_prefix="inference-worker"
+            )
+        elif mode == "process":
+            if process_initargs is None:
+                raise ValueError("process_initargs are required in 'process' mode.")
+            # spawn: не наследуем от родителя состояние torch/tokenizers и открытые сокеты
+            self._executor = ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+                initargs=(*process_initargs, threads_per_worker)
+            )
+        else:
+            raise ValueError(f"Unknown worker mode: {mode}. Use 'thread' or 'process'.")
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed_total = 0
+        self.rejected_total = 0
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs `fn(*args)` on the pool and awaits the result.
+
+        Raises:
+            WorkerPoolSaturatedError: If the pool already holds `capacity` tasks.
+        """
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self.rejected_total += 1
+                raise WorkerPoolSaturatedError(
+                    f"Inference queue is full ({self._in_flight}/{self.capacity} tasks)."
+                )
+            self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.completed_total += 1
+
+    def warmup(self, timeout: float = 600.0) -> List[int]:
+        """
+        Starts the workers now instead of on the first requests.
+
+        In "process" mode one task per worker waits at a shared barrier: a process blocked there
+        cannot take a second task, so the barrier only opens once `num_workers` distinct processes
+        have each run _init_process_worker (loaded their model). Plain pings would not guarantee
+        that - ProcessPoolExecutor may hand several of them to the first process that is ready.
+
+        Returns:
+            List[int]: PIDs of the worker processes (empty in "thread" mode).
+
+        Raises:
+            RuntimeError: If fewer than `num_workers` processes came up within `timeout` seconds.
+        """
+        if self.mode == "thread":
+            self._executor.submit(_ping).result()
+            return []
+        with multiprocessing.get_context("spawn").Manager() as manager:
+            barrier = manager.Barrier(self.num_workers)
+            futures = [self._executor.submit(_wait_at_barrier, barrier, timeout) for _ in range(self.num_workers)]
+            try:
+                pids = [future.result() for future in futures]
+            except threading.BrokenBarrierError as e:
+                raise RuntimeError(f"Not all {self.num_workers} inference workers started within {timeout} s.") from e
+        if len(set(pids)) != self.num_workers:
+            raise RuntimeError(f"Expected {self.num_workers} worker processes, got {len(set(pids))}.")
+        return pids
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            "mode": self.mode,
+            "num_workers": self.num_workers,
+            "threads_per_worker": self.threads_per_worker,
+            "capacity": self.capacity,
+            "in_flight": in_flight,
+            "completed_total": self.completed_total,
+            "rejected_total": self.rejected_total,
+        }
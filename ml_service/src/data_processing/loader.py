@@ -1,43 +1,133 @@
 import pandas as pd
 import pathlib
-from typing import List, Optional
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
 
 from config import main_config # Assuming config is in the root or accessible via PYTHONPATH
 
+SUPPORTED_FORMATS = (".csv", ".parquet", ".feather")
+
+# Фильтры в DNF-форме pyarrow: [(column, op, value), ...] - условия объединяются через AND
+Filters = Sequence[Tuple[str, str, Any]]
+
+_FILTER_OPS = {
+    "==": lambda column, value: column == value,
+    "=": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "in": lambda column, value: column.isin(value),
+    "not in": lambda column, value: ~column.isin(value),
+}
+
+
+def _file_format(filename: str) -> str:
+    suffix = pathlib.Path(filename).suffix
+    if suffix not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported file format for {filename}. Please use one of {SUPPORTED_FORMATS}.")
+    return suffix
+
+
+def _arrow_string_dtype(arrow_type: pa.DataType):
+    """types_mapper for Table.to_pandas: строки остаются в буферах Arrow, а не в Python-объектах."""
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def _to_pandas(table: pa.Table, pyarrow_strings: bool) -> pd.DataFrame:
+    return table.to_pandas(types_mapper=_arrow_string_dtype if pyarrow_strings else None)
+
+
+def _to_pyarrow_strings(df: pd.DataFrame) -> pd.DataFrame:
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].astype(pd.StringDtype("pyarrow"))
+    return df
+
+
+def _filter_frame(df: pd.DataFrame, filters: Optional[Filters]) -> pd.DataFrame:
+    """Applies `filters` to an in-memory frame (CSV has no predicate pushdown)."""
+    if not filters:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        if op not in _FILTER_OPS:
+            raise ValueError(f"Unsupported filter operator '{op}'. Expected one of {list(_FILTER_OPS)}.")
+        mask &= _FILTER_OPS[op](df[column], value).fillna(False).astype(bool)
+    return df[mask].reset_index(drop=True)
+
+
+def _arrow_dataset(file_path: pathlib.Path) -> ds.Dataset:
+    return ds.dataset(file_path, format="parquet" if file_path.suffix == ".parquet" else "feather")
+
+
+def _resolve_path(filename: str, data_dir: pathlib.Path) -> pathlib.Path:
+    _file_format(filename)
+    file_path = pathlib.Path(data_dir) / filename
+    if not file_path.exists():
+        raise FileNotFoundError(f"Dataset file not found: {file_path}")
+    return file_path
+
+
+def dataset_columns(filename: str, data_dir: pathlib.Path = main_config.RAW_DATA_DIR) -> List[str]:
+    """Column names of a dataset file, read from the header / schema only."""
+    file_path = _resolve_path(filename, data_dir)
+    if file_path.suffix == ".csv":
+        return pd.read_csv(file_path, nrows=0).columns.tolist()
+    return _arrow_dataset(file_path).schema.names
+
+
 def load_dataset(
     filename: str,
     data_dir: pathlib.Path = main_config.RAW_DATA_DIR,
     columns_to_load: Optional[List[str]] = None,
-    nrows: Optional[int] = None
+    nrows: Optional[int] = None,
+    filters: Optional[Filters] = None,
+    pyarrow_strings: bool = True
 ) -> pd.DataFrame:
     """
-    Loads the dataset from a CSV file.
+    Loads the dataset from a CSV, Parquet or Feather file.
+
+    Для Parquet/Feather читаются только `columns_to_load`, а `filters` проверяются при чтении
+    (для Parquet - с пропуском row group'ов по статистике), так что огромная колонка sourcecode
+    не попадает в память, если она не нужна. CSV читается целиком, фильтры применяются после.
 
     Args:
-        filename (str): Name of the CSV file.
-        data_dir (pathlib.Path): Directory where the CSV file is located.
+        filename (str): Name of the .csv, .parquet or .feather file.
+        data_dir (pathlib.Path): Directory where the file is located.
         columns_to_load (Optional[List[str]]): Specific columns to load. Loads all if None.
-        nrows (Optional[int]): Number of rows to load. Loads all if None.
+        nrows (Optional[int]): Number of rows to load (after filtering for Parquet/Feather). Loads all if None.
+        filters (Optional[Filters]): Row predicates [(column, op, value), ...], combined with AND.
+        pyarrow_strings (bool): Store text columns as pyarrow-backed strings instead of Python objects.
 
     Returns:
         pd.DataFrame: Loaded data.
         
     Raises:
         FileNotFoundError: If the dataset file does not exist.
-        Exception: For other pandas-related read errors.
+        ValueError: For an unsupported file format or filter operator.
+        Exception: For other pandas/pyarrow read errors.
     """
-    file_path = data_dir / filename
-    if not file_path.exists():
-        raise FileNotFoundError(f"Dataset file not found: {file_path}")
-    
+    file_path = _resolve_path(filename, data_dir)
+
     try:
-        if filename.endswith(".csv"):
+        if file_path.suffix == ".csv":
             df = pd.read_csv(file_path, usecols=columns_to_load, nrows=nrows)
-        # Add support for other formats like .parquet if needed
-        # elif filename.endswith(".parquet"):
-        #     df = pd.read_parquet(file_path, columns=columns_to_load)
+            df = _filter_frame(df, filters)
+            if pyarrow_strings:
+                df = _to_pyarrow_strings(df)
         else:
-            raise ValueError(f"Unsupported file format for {filename}. Please use .csv.")
+            dataset = _arrow_dataset(file_path)
+            expression = pq.filters_to_expression(filters) if filters else None
+            if nrows is not None:
+                table = dataset.head(nrows, columns=columns_to_load, filter=expression)
+            else:
+                table = dataset.to_table(columns=columns_to_load, filter=expression)
+            df = _to_pandas(table, pyarrow_strings)
         
         print(f"Successfully loaded {len(df)} rows from {file_path}")
         if columns_to_load:
@@ -47,6 +137,190 @@ def load_dataset(
         print(f"Error loading dataset from {file_path}: {e}")
         raise
 
+
+def _rebatch(batches: Iterator[pa.RecordBatch], batch_size: int) -> Iterator[pa.Table]:
+    """Regroups record batches of arbitrary size (row group boundaries) into tables of exactly `batch_size` rows."""
+    pending: List[pa.RecordBatch] = []
+    buffered = 0
+    for batch in batches:
+        while batch.num_rows:
+            take = min(batch_size - buffered, batch.num_rows)
+            pending.append(batch.slice(0, take))
+            buffered += take
+            batch = batch.slice(take)
+            if buffered == batch_size:
+                yield pa.Table.from_batches(pending)
+                pending, buffered = [], 0
+    if buffered:
+        yield pa.Table.from_batches(pending)
+
+
+def _skip_batches(batches: Iterator[pa.RecordBatch], skip_rows: int) -> Iterator[pa.RecordBatch]:
+    """Drops the first `skip_rows` rows of a stream of record batches."""
+    for batch in batches:
+        if skip_rows >= batch.num_rows:
+            skip_rows -= batch.num_rows
+            continue
+        yield batch.slice(skip_rows)
+        skip_rows = 0
+
+
+def _iter_parquet_batches(file_path: pathlib.Path,
+                          columns: Optional[List[str]],
+                          batch_size: int,
+                          skip_rows: int) -> Iterator[pa.RecordBatch]:
+    """Record batches from row `skip_rows` on; whole row groups before it are not read at all."""
+    parquet_file = pq.ParquetFile(file_path)
+    first_group = 0
+    while first_group < parquet_file.num_row_groups:
+        group_rows = parquet_file.metadata.row_group(first_group).num_rows
+        if skip_rows < group_rows:
+            break
+        skip_rows -= group_rows
+        first_group += 1
+    row_groups = list(range(first_group, parquet_file.num_row_groups))
+    if not row_groups:
+        return iter(())
+    batches = parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=columns)
+    return _skip_batches(batches, skip_rows)
+
+
+def iter_dataset(
+    filename: str,
+    data_dir: pathlib.Path = main_config.RAW_DATA_DIR,
+    columns_to_load: Optional[List[str]] = None,
+    batch_size: int = 10000,
+    filters: Optional[Filters] = None,
+    skip_rows: int = 0,
+    pyarrow_strings: bool = True
+) -> Iterator[pd.DataFrame]:
+    """
+    Streams a CSV, Parquet or Feather file as DataFrames of `batch_size` rows (the last one may be
+    shorter), so only one batch is in memory at a time. Same projection/filter semantics as load_dataset.
+
+    Args:
+        skip_rows (int): Rows at the start of the file to skip (resuming a partially processed file).
+                         Parquet skips whole row groups without decoding them.
+
+    Raises:
+        FileNotFoundError: If the dataset file does not exist.
+        ValueError: For an unsupported format, or `skip_rows` together with `filters`
+                    (skipped rows are counted in the file, not in the filtered stream).
+    """
+    file_path = _resolve_path(filename, data_dir)
+    if batch_size <= 0:
+        raise ValueError("batch_size must be positive.")
+    if skip_rows and filters:
+        raise ValueError("skip_rows cannot be combined with filters.")
+
+    if file_path.suffix == ".csv":
+        reader = pd.read_csv(file_path, usecols=columns_to_load, chunksize=batch_size,
+                             skiprows=range(1, skip_rows + 1))  # Пропускаем строки, сохраняя заголовок
+        for df in reader:
+            df = _filter_frame(df, filters)
+            yield _to_pyarrow_strings(df) if pyarrow_strings else df
+        return
+
+    if file_path.suffix == ".parquet" and not filters:
+        batches = _iter_parquet_batches(file_path, columns_to_load, batch_size, skip_rows)
+    else:
+        expression = pq.filters_to_expression(filters) if filters else None
+        batches = _arrow_dataset(file_path).to_batches(columns=columns_to_load, filter=expression,
+                                                       batch_size=batch_size)
+        if skip_rows:
+            batches = _skip_batches(batches, skip_rows)
+    for table in _rebatch(batches, batch_size):
+        yield _to_pandas(table, pyarrow_strings)
+
+
+def dataset_num_rows(filename: str, data_dir: pathlib.Path = main_config.RAW_DATA_DIR) -> int:
+    """Number of rows: from the metadata for Parquet/Feather, by streaming one column for CSV."""
+    file_path = _resolve_path(filename, data_dir)
+    if file_path.suffix == ".parquet":
+        return pq.ParquetFile(file_path).metadata.num_rows
+    if file_path.suffix == ".feather":
+        return _arrow_dataset(file_path).count_rows()
+    first_column = dataset_columns(filename, data_dir)[:1]
+    return sum(len(df) for df in pd.read_csv(file_path, usecols=first_column, chunksize=100000))
+
+
+class DatasetWriter:
+    """
+    Appends DataFrame batches to one .csv, .parquet or .feather file (by extension), so a dataset
+    can be written without ever holding it in memory. Every batch must have the columns of the first;
+    Parquet/Feather batches are cast to the first batch's schema.
+
+    Файл пишется во временный и переименовывается в `close()`, так что прерванный прогон
+    не оставляет наполовину записанный датасет под итоговым именем.
+    """
+    def __init__(self, filename: str, data_dir: pathlib.Path = main_config.PROCESSED_DATA_DIR):
+        self.format = _file_format(filename)
+        self.path = pathlib.Path(data_dir) / filename
+        self._tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        self._writer = None
+        self._schema: Optional[pa.Schema] = None
+        self._csv_header_written = False
+        self.num_rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.format == ".csv":
+            df.to_csv(self._tmp_path, mode="a" if self._csv_header_written else "w",
+                      header=not self._csv_header_written, index=False)
+            self._csv_header_written = True
+        else:
+            if self._schema is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._schema = table.schema
+                if self.format == ".parquet":
+                    self._writer = pq.ParquetWriter(self._tmp_path, self._schema, compression="zstd")
+                else:
+                    self._writer = pa.ipc.new_file(str(self._tmp_path), self._schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self.format == ".parquet":
+                self._writer.write_table(table, row_group_size=main_config.PARQUET_ROW_GROUP_SIZE)
+            else:
+                self._writer.write_table(table)
+        self.num_rows += len(df)
+
+    def close(self) -> pathlib.Path:
+        """Finalizes the file and moves it to its final name. Returns the path."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._tmp_path.exists():
+            self._tmp_path.replace(self.path)
+        return self.path
+
+    def abort(self) -> None:
+        """Closes the writer and removes the temporary file; an existing file under the final name is kept."""
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            finally:
+                self._writer = None
+        self._tmp_path.unlink(missing_ok=True)
+
+
+def save_dataset(df: pd.DataFrame, filename: str, data_dir: pathlib.Path = main_config.PROCESSED_DATA_DIR) -> pathlib.Path:
+    """
+    Saves a DataFrame in the format given by the extension of `filename` (.csv, .parquet or .feather).
+    Parquet is written with zstd compression and row groups of PARQUET_ROW_GROUP_SIZE rows,
+    which is the unit iter_dataset can skip when resuming.
+
+    Returns:
+        pathlib.Path: Path of the written file.
+    """
+    suffix = _file_format(filename)
+    file_path = pathlib.Path(data_dir) / filename
+    if suffix == ".csv":
+        df.to_csv(file_path, index=False)
+    elif suffix == ".parquet":
+        df.to_parquet(file_path, index=False, compression="zstd", row_group_size=main_config.PARQUET_ROW_GROUP_SIZE)
+    else:
+        df.reset_index(drop=True).to_feather(file_path)
+    return file_path
+
 if __name__ == '__main__':
     # Example usage:
     try:
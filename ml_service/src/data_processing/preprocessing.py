@@ -1,32 +1,86 @@
+import multiprocessing
+import numpy as np
 import pandas as pd
 import re
-from typing import List, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
 
 from config import main_config # Assuming config is in the root or accessible via PYTHONPATH
 
+# Лексер Solidity в одном регулярном выражении: строковый литерал либо "промежуток" -
+# серия пробельных символов и комментариев (// до конца строки, /* */ или незакрытый /* до конца файла).
+# Поиск идет слева направо, поэтому // и /* внутри строки (URL, "a//b") поглощаются литералом.
+_SOLIDITY_LEXER = re.compile(
+    r"""(?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')"""
+    r"""|(?P<gap>(?:\s+|//[^\n]*|/\*.*?(?:\*/|\Z))+)""",
+    re.DOTALL
+)
+
+
+def _replace_token(match: "re.Match") -> str:
+    # Литерал - как есть; комментарии и пробелы - один пробел (не склеиваем соседние токены)
+    return match.group("string") or " "
+
+
 def clean_solidity_code(code: str) -> str:
     """
-    Basic cleaning of Solidity source code.
-    - Removes single-line comments (// ...)
-    - Removes multi-line comments (/* ... */)
-    - Normalizes multiple whitespaces to a single space
+    Basic cleaning of Solidity source code, in a single lexer-style pass:
+    - Removes single-line comments (// ..., /// NatSpec) and multi-line comments (/* ... */)
+    - Leaves string literals untouched, including "//" or "/*" inside them (URLs, paths)
+    - Replaces every run of whitespace and comments with a single space
     - Removes leading/trailing whitespace
     """
     if not isinstance(code, str):
         return "" # Or raise error, or return as is, depending on desired handling for non-str input
 
-    # Remove single-line comments
-    code = re.sub(r"//.*", "", code)
-    # Remove multi-line comments
-    code = re.sub(r"/\*.*?\*/", "", code, flags=re.DOTALL)
-    # Normalize whitespace
-    code = re.sub(r"\s+", " ", code)
-    return code.strip()
+    return _SOLIDITY_LEXER.sub(_replace_token, code).strip()
+
+
+def clean_solidity_code_batch(codes: Sequence[str]) -> List[str]:
+    """Cleans a block of contracts (one task of the process pool in clean_code_column)."""
+    return [clean_solidity_code(code) for code in codes]
+
+
+def clean_code_column(
+    codes: pd.Series,
+    n_jobs: int = main_config.PREPROCESS_N_JOBS,
+    chunk_size: int = main_config.PREPROCESS_CLEAN_CHUNK_SIZE,
+    executor: Optional[Executor] = None
+) -> pd.Series:
+    """
+    Applies clean_solidity_code to a column. With n_jobs > 1 (or an `executor`) blocks of
+    `chunk_size` contracts are cleaned in parallel processes; order is preserved.
+
+    Args:
+        codes (pd.Series): Source code column; non-string values become "".
+        n_jobs (int): Worker processes when no `executor` is given (1 - in this process).
+        chunk_size (int): Contracts per task. Larger blocks amortize pickling, smaller ones balance load.
+        executor (Optional[Executor]): Pool reused across calls (the streaming pipeline).
+
+    Returns:
+        pd.Series: Cleaned code with the index of `codes`.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive.")
+    values = codes.tolist()
+    if executor is None and n_jobs <= 1:
+        return pd.Series(clean_solidity_code_batch(values), index=codes.index, dtype=codes.dtype)
+
+    blocks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+    if executor is not None:
+        cleaned_blocks = list(executor.map(clean_solidity_code_batch, blocks))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+            cleaned_blocks = list(pool.map(clean_solidity_code_batch, blocks))
+    cleaned = [code for block in cleaned_blocks for code in block]
+    return pd.Series(cleaned, index=codes.index, dtype=codes.dtype)
 
 def create_binary_target_labels(
     df: pd.DataFrame,
     count_columns: List[str],
-    prefix: str = main_config.TARGET_COLUMN_PREFIX
+    prefix: str = main_config.TARGET_COLUMN_PREFIX,
+    copy: bool = True,
+    verbose: bool = True
 ) -> pd.DataFrame:
     """
     Converts vulnerability count columns to binary target labels.
@@ -36,15 +90,19 @@ def create_binary_target_labels(
         df (pd.DataFrame): DataFrame containing the vulnerability count columns.
         count_columns (List[str]): List of names of the vulnerability count columns.
         prefix (str): Prefix for the new binary target columns.
+        copy (bool): Work on a copy of `df`. False adds the columns to `df` itself
+                     (the streaming pipeline, where a full copy of the source code would double memory).
+        verbose (bool): Print the created columns (off for per-batch calls).
 
     Returns:
         pd.DataFrame: DataFrame with added binary target columns.
     """
-    df_processed = df.copy()
+    df_processed = df.copy() if copy else df
     new_target_columns = []
     for col_name in count_columns:
         if col_name not in df_processed.columns:
-            print(f"Warning: Count column '{col_name}' not found in DataFrame. Skipping.")
+            if verbose:
+                print(f"Warning: Count column '{col_name}' not found in DataFrame. Skipping.")
             continue
         
         # Sanitize column name for the new target column
@@ -57,9 +115,11 @@ def create_binary_target_labels(
         
         df_processed[target_col_name] = (df_processed[col_name] > 0).astype(int)
         new_target_columns.append(target_col_name)
-        print(f"Created target column: '{target_col_name}' from '{col_name}'")
-        
-    print(f"\nCreated binary target columns: {new_target_columns}")
+        if verbose:
+            print(f"Created target column: '{target_col_name}' from '{col_name}'")
+
+    if verbose:
+        print(f"\nCreated binary target columns: {new_target_columns}")
     return df_processed
 
 def preprocess_dataframe(
@@ -67,7 +127,12 @@ def preprocess_dataframe(
     source_code_col: str = main_config.SOURCE_CODE_COLUMN,
     vulnerability_count_cols: List[str] = main_config.VULNERABILITY_COUNT_COLUMNS,
     target_prefix: str = main_config.TARGET_COLUMN_PREFIX,
-    skip_code_cleaning: bool = True
+    skip_code_cleaning: bool = True,
+    copy: bool = True,
+    verbose: bool = True,
+    n_jobs: int = main_config.PREPROCESS_N_JOBS,
+    chunk_size: int = main_config.PREPROCESS_CLEAN_CHUNK_SIZE,
+    executor: Optional[Executor] = None
 ) -> pd.DataFrame:
     """
     Applies necessary transformations:
@@ -80,35 +145,97 @@ def preprocess_dataframe(
         vulnerability_count_cols (List[str]): Names of vulnerability count columns.
         target_prefix (str): Prefix for new binary target columns.
         skip_code_cleaning (bool): If True, skips the source code cleaning step.
+        copy (bool): Work on a copy of `df`; False modifies `df` in place (one batch of a stream).
+        verbose (bool): Print progress messages (off for per-batch calls).
+        n_jobs (int): Processes used for code cleaning (see clean_code_column).
+        chunk_size (int): Contracts per cleaning task.
+        executor (Optional[Executor]): Existing process pool for code cleaning.
 
     Returns:
         pd.DataFrame: Processed DataFrame.
     """
-    print("Starting preprocessing...")
-    df_processed = df.copy()
+    log = print if verbose else (lambda *args, **kwargs: None)
+    log("Starting preprocessing...")
+    df_processed = df.copy() if copy else df
 
     # Clean source code - conditionally skipped
     if not skip_code_cleaning:
         if source_code_col in df_processed.columns:
-            print(f"Cleaning source code in column: '{source_code_col}'...")
-            df_processed[source_code_col] = df_processed[source_code_col].astype(str).apply(clean_solidity_code)
-            print("Source code cleaning complete.")
+            log(f"Cleaning source code in column: '{source_code_col}'...")
+            df_processed[source_code_col] = clean_code_column(
+                df_processed[source_code_col], n_jobs=n_jobs, chunk_size=chunk_size, executor=executor
+            )
+            log("Source code cleaning complete.")
         else:
-            print(f"Warning: Source code column '{source_code_col}' not found. Skipping cleaning.")
+            log(f"Warning: Source code column '{source_code_col}' not found. Skipping cleaning.")
     else:
-        print("Skipping source code cleaning as per configuration.")
+        log("Skipping source code cleaning as per configuration.")
 
     # Create binary target labels (this step is essential)
+    # Копия уже сделана выше (или не нужна): метки добавляются в df_processed на месте
     df_processed = create_binary_target_labels(
         df_processed, # Pass the potentially modified df_processed
         count_columns=vulnerability_count_cols,
-        prefix=target_prefix
+        prefix=target_prefix,
+        copy=False,
+        verbose=verbose
     )
     
-    print("Preprocessing (target label creation) complete.")
+    log("Preprocessing (target label creation) complete.")
     return df_processed
 
 
+def hash_split_mask(
+    keys: pd.Series,
+    test_size: float = main_config.TEST_SET_SIZE,
+    seed: int = main_config.RANDOM_STATE
+) -> np.ndarray:
+    """
+    Deterministic train/test assignment of one batch: a row goes to test when the seeded 64-bit
+    hash of its key, scaled to [0, 1), is below `test_size`. The result depends only on the key
+    and the seed, not on batch boundaries or row order, so a streamed corpus is split the same way
+    as a fully loaded one, and duplicates of a key (e.g. the same address) never straddle the split.
+
+    Returns:
+        np.ndarray: Boolean mask, True for test rows.
+    """
+    hash_key = f"{seed:016d}"[-16:]  # hash_pandas_object принимает ключ ровно из 16 символов
+    hashes = pd.util.hash_pandas_object(keys, index=False, hash_key=hash_key).to_numpy()
+    return (hashes / 2.0**64) < test_size
+
+
+def split_keys(keys: pd.Series, row_start: int = 0) -> pd.Series:
+    """
+    Keys for hash_split_mask: the given values, with missing ones replaced by the global row
+    index ("row:<n>", counted from `row_start` for this batch). Without the fallback every row
+    with a missing address would hash to the same value and land in the same split.
+    """
+    row_keys = pd.Series(np.arange(row_start, row_start + len(keys)), index=keys.index).map("row:{}".format)
+    return keys.astype(object).where(keys.notna(), row_keys)
+
+
+def exact_split_test_rows(
+    num_rows: int,
+    test_size: float = main_config.TEST_SET_SIZE,
+    seed: int = main_config.RANDOM_STATE
+) -> np.ndarray:
+    """
+    Test-row mask of sklearn's train_test_split(test_size=test_size, random_state=seed) over
+    `num_rows` rows (the same ShuffleSplit permutation), so streamed output has exactly the same
+    train/test membership as the in-memory split. Takes one byte per row, not the data itself.
+
+    Returns:
+        np.ndarray: Boolean mask of length `num_rows`, True for test rows.
+    """
+    from sklearn.model_selection import ShuffleSplit
+
+    splitter = ShuffleSplit(n_splits=1, test_size=test_size, random_state=seed)
+    _, test_index = next(splitter.split(np.empty((num_rows, 1))))
+    is_test = np.zeros(num_rows, dtype=bool)
+    is_test[test_index] = True
+    return is_test
+
+
 if __name__ == '__main__':
     # Example Usage (assuming you have a sample CSV or can create one)
     
@@ -0,0 +1,274 @@
+import json
+import os
+import pathlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import main_config
+
+MANIFEST_FILENAME = "manifest.json"
+# Массивы одного шарда: <shard>.<name>.npy
+SHARD_ARRAYS = ("input_ids", "lengths", "labels", "original_indices")
+
+
+def token_dtype_for_vocab(vocab_size: int) -> np.dtype:
+    """uint16 covers CodeBERT/RoBERTa (50265 tokens); larger vocabularies fall back to int32."""
+    return np.dtype(np.uint16) if vocab_size <= np.iinfo(np.uint16).max + 1 else np.dtype(np.int32)
+
+
+def chunked_split_dir(split: str,
+                      tokenizer_name: str,
+                      base_dir: pathlib.Path = main_config.CHUNKED_DATA_DIR,
+                      max_total_tokens: int = main_config.MAX_TOTAL_TOKENS,
+                      chunk_size: int = main_config.MODEL_CHUNK_SIZE,
+                      overlap: int = main_config.CHUNK_OVERLAP) -> pathlib.Path:
+    """Directory of one split, named like the legacy .pt files: train_t4096_c512_o64_microsoft_codebert-base."""
+    suffix = f"t{max_total_tokens}_c{chunk_size}_o{overlap}_{tokenizer_name.replace('/', '_')}"
+    return pathlib.Path(base_dir) / f"{split}_{suffix}"
+
+
+def _atomic_save_npy(path: pathlib.Path, array: np.ndarray) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_manifest(directory: pathlib.Path, manifest: Dict[str, Any], filename: str = MANIFEST_FILENAME) -> None:
+    path = pathlib.Path(directory) / filename
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_manifest(directory: pathlib.Path, filename: str = MANIFEST_FILENAME) -> Optional[Dict[str, Any]]:
+    path = pathlib.Path(directory) / filename
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_shard(directory: pathlib.Path, shard_name: str, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """Loads the arrays of one shard (memory-mapped by default)."""
+    mmap_mode = "r" if mmap else None
+    return {
+        name: np.load(pathlib.Path(directory) / f"{shard_name}.{name}.npy", mmap_mode=mmap_mode)
+        for name in SHARD_ARRAYS
+    }
+
+
+class ShardWriter:
+    """
+    Накапливает чанки и пишет их шардами ровно по `shard_size` штук (последний шард может быть меньше).
+
+    После каждого шарда атомарно обновляется manifest.json: в нем, кроме списка шардов,
+    хранится позиция возобновления - первая строка источника (`next_row`), чанки которой
+    записаны не полностью, и сколько ее чанков уже записано (`skip_chunks`).
+    """
+    def __init__(self, directory: pathlib.Path, manifest: Dict[str, Any]):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.manifest = manifest
+        self.shard_size = manifest["shard_size"]
+        self._buffers: Dict[str, List[np.ndarray]] = {name: [] for name in SHARD_ARRAYS + ("positions",)}
+        self._buffered = 0
+        self._rows_consumed = manifest["next_row"]
+
+    def add(self,
+            input_ids: np.ndarray,
+            lengths: np.ndarray,
+            labels: np.ndarray,
+            original_indices: np.ndarray,
+            positions: np.ndarray,
+            rows_consumed: int) -> None:
+        """
+        Adds the chunks of a contiguous block of source rows.
+
+        Args:
+            positions (np.ndarray): Index of every chunk within its contract.
+            rows_consumed (int): Number of source rows fully covered once these chunks are written.
+        """
+        for name, array in (("input_ids", input_ids), ("lengths", lengths), ("labels", labels),
+                            ("original_indices", original_indices), ("positions", positions)):
+            self._buffers[name].append(array)
+        self._buffered += input_ids.shape[0]
+        self._rows_consumed = rows_consumed
+        while self._buffered >= self.shard_size:
+            self._flush(self.shard_size)
+
+    def close(self) -> None:
+        """Writes the remaining chunks as the last shard and marks the manifest complete."""
+        if self._buffered:
+            self._flush(self._buffered)
+        self.manifest["next_row"] = self._rows_consumed
+        self.manifest["skip_chunks"] = 0
+        self.manifest["complete"] = True
+        write_manifest(self.directory, self.manifest)
+
+    def _flush(self, count: int) -> None:
+        arrays = {name: np.concatenate(parts, axis=0) for name, parts in self._buffers.items()}
+        shard_name = f"shard_{len(self.manifest['shards']):05d}"
+        for name in SHARD_ARRAYS:
+            _atomic_save_npy(self.directory / f"{shard_name}.{name}.npy", arrays[name][:count])
+
+        remainder = {name: array[count:] for name, array in arrays.items()}
+        self._buffers = {name: [array] for name, array in remainder.items()}
+        self._buffered -= count
+
+        if self._buffered:
+            # Первая незаписанная строка и число ее чанков, уже попавших в шарды
+            self.manifest["next_row"] = int(remainder["original_indices"][0])
+            self.manifest["skip_chunks"] = int(remainder["positions"][0])
+        else:
+            self.manifest["next_row"] = self._rows_consumed
+            self.manifest["skip_chunks"] = 0
+        self.manifest["shards"].append({"name": shard_name, "num_chunks": count})
+        self.manifest["num_chunks"] += count
+        write_manifest(self.directory, self.manifest)
+        print(f"  Wrote {shard_name} ({count} chunks). Total: {self.manifest['num_chunks']} chunks, "
+              f"resume point: row {self.manifest['next_row']} (+{self.manifest['skip_chunks']} chunks)")
+
+
+# --- Единый memory-mapped формат (читается MemmapChunkDataset) ---
+
+MEMMAP_DIRNAME = "memmap"
+MEMMAP_META_FILENAME = "meta.json"
+
+
+def _open_memmap_arrays(out_dir: pathlib.Path,
+                        num_chunks: int,
+                        chunk_size: int,
+                        num_labels: int,
+                        token_dtype: np.dtype,
+                        label_dtype: np.dtype) -> Dict[str, np.ndarray]:
+    out_dir = pathlib.Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    shapes = {
+        "input_ids": ((num_chunks, chunk_size), token_dtype),
+        "lengths": ((num_chunks,), np.dtype(np.int16)),
+        "labels": ((num_chunks, num_labels), label_dtype),
+        "original_indices": ((num_chunks,), np.dtype(np.int64)),
+    }
+    return {
+        name: np.lib.format.open_memmap(out_dir / f"{name}.npy", mode="w+", dtype=dtype, shape=shape)
+        for name, (shape, dtype) in shapes.items()
+    }
+
+
+def _write_memmap_meta(out_dir: pathlib.Path, meta: Dict[str, Any]) -> None:
+    with open(pathlib.Path(out_dir) / MEMMAP_META_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def consolidate_shards(split_dir: pathlib.Path, out_dir: Optional[pathlib.Path] = None) -> pathlib.Path:
+    """
+    Concatenates the shards of a completed split into single contiguous .npy arrays,
+    streaming shard by shard so peak memory stays at one shard.
+
+    Returns:
+        pathlib.Path: Directory with the consolidated arrays (split_dir / "memmap" by default).
+    """
+    split_dir = pathlib.Path(split_dir)
+    manifest = read_manifest(split_dir)
+    if manifest is None or not manifest.get("complete"):
+        raise ValueError(f"{split_dir} does not contain a completed shard manifest.")
+    out_dir = pathlib.Path(out_dir) if out_dir is not None else split_dir / MEMMAP_DIRNAME
+
+    arrays = _open_memmap_arrays(
+        out_dir,
+        num_chunks=manifest["num_chunks"],
+        chunk_size=manifest["chunk_size"],
+        num_labels=len(manifest["label_columns"]),
+        token_dtype=np.dtype(manifest["token_dtype"]),
+        label_dtype=np.dtype(np.uint8),
+    )
+    offset = 0
+    for shard in manifest["shards"]:
+        shard_arrays = load_shard(split_dir, shard["name"])
+        count = shard["num_chunks"]
+        for name in SHARD_ARRAYS:
+            arrays[name][offset:offset + count] = shard_arrays[name]
+        offset += count
+    for array in arrays.values():
+        array.flush()
+
+    _write_memmap_meta(out_dir, {
+        "num_chunks": manifest["num_chunks"],
+        "chunk_size": manifest["chunk_size"],
+        "pad_token_id": manifest["pad_token_id"],
+        "token_dtype": manifest["token_dtype"],
+        "label_columns": manifest["label_columns"],
+        "tokenizer": manifest["tokenizer"],
+        "max_total_tokens": manifest["max_total_tokens"],
+        "overlap": manifest["overlap"],
+    })
+    print(f"Consolidated {len(manifest['shards'])} shards ({manifest['num_chunks']} chunks) into {out_dir}")
+    return out_dir
+
+
+def convert_pt_to_memmap(chunk_list_path: str,
+                         labels_path: str,
+                         out_dir: pathlib.Path,
+                         original_indices_path: Optional[str] = None,
+                         pad_token_id: int = 1,
+                         token_dtype: np.dtype = np.dtype(np.uint16)) -> pathlib.Path:
+    """
+    Converts the legacy ContractChunkDataset files (pickled list of per-chunk dicts + labels tensor)
+    into the memory-mapped format. Lengths are taken from the attention masks.
+
+    Args:
+        chunk_list_path (str): .pt file with a list of {'input_ids', 'attention_mask'} dicts.
+        labels_path (str): .pt file with a (num_chunks, num_labels) labels tensor.
+        out_dir (pathlib.Path): Output directory.
+        original_indices_path (Optional[str]): .pt file with the source row index of every chunk.
+        pad_token_id (int): Pad ID of the tokenizer the chunks were built with (1 for CodeBERT).
+        token_dtype (np.dtype): Storage dtype of token IDs (uint16 or int32).
+    """
+    import torch  # Нужен только для чтения старого pickle-формата
+
+    chunk_list = torch.load(chunk_list_path)
+    labels = torch.load(labels_path).numpy()
+    original_indices = (
+        np.asarray(torch.load(original_indices_path), dtype=np.int64)
+        if original_indices_path and os.path.exists(original_indices_path)
+        else np.arange(len(chunk_list), dtype=np.int64)
+    )
+    if len(chunk_list) != labels.shape[0]:
+        raise ValueError(f"Mismatch in number of chunks ({len(chunk_list)}) "
+                         f"and number of labels ({labels.shape[0]})")
+
+    binary_labels = bool(np.isin(labels, (0, 1)).all())
+    chunk_size = chunk_list[0]['input_ids'].shape[0] if chunk_list else main_config.MODEL_CHUNK_SIZE
+    arrays = _open_memmap_arrays(
+        out_dir,
+        num_chunks=len(chunk_list),
+        chunk_size=chunk_size,
+        num_labels=labels.shape[1],
+        token_dtype=np.dtype(token_dtype),
+        label_dtype=np.dtype(np.uint8) if binary_labels else np.dtype(np.float32),
+    )
+    for i, chunk in enumerate(chunk_list):
+        arrays["input_ids"][i] = chunk['input_ids'].numpy()
+        arrays["lengths"][i] = int(chunk['attention_mask'].sum())
+    arrays["labels"][:] = labels
+    arrays["original_indices"][:] = original_indices
+    for array in arrays.values():
+        array.flush()
+
+    _write_memmap_meta(out_dir, {
+        "num_chunks": len(chunk_list),
+        "chunk_size": chunk_size,
+        "pad_token_id": pad_token_id,
+        "token_dtype": np.dtype(token_dtype).name,
+        "label_columns": None,
+        "source": str(chunk_list_path),
+    })
+    print(f"Converted {len(chunk_list)} chunks from {chunk_list_path} into {out_dir}")
+    return pathlib.Path(out_dir)
@@ -1,6 +1,5 @@
 from transformers import AutoTokenizer
-from typing import List, Union, Dict, Tuple
-import pandas as pd
+from typing import List, Union, Dict, Sequence, Tuple
 import torch # Используем torch для тензоров
 
 from config import main_config
@@ -47,6 +46,184 @@ def get_tokenizer(tokenizer_name: str = "microsoft/codebert-base"):
         # Можно добавить фоллбэк на другой токенизатор, как в ноутбуке, или просто пробросить ошибку
         raise
 
+def _chunk_geometry(chunk_size: int, overlap: int) -> Tuple[int, int]:
+    """
+    Returns (content tokens per chunk, stride) and validates the chunking parameters.
+
+    Окна соседних чанков должны стыковаться без разрывов: stride <= body, т.е. overlap >= 2
+    (overlap считается в позициях чанка, включая <s> и </s>). Иначе токены между окнами
+    терялись бы, а хвостовое окно могло начаться за концом контента.
+    """
+    body = chunk_size - 2 # Место под контент без <s> и </s>
+    stride = chunk_size - overlap
+    if body <= 0:
+        raise ValueError("chunk_size must leave room for the two special tokens.")
+    if overlap < 2:
+        raise ValueError(f"overlap must be at least 2 (the <s> and </s> positions), got {overlap}; "
+                         f"a smaller overlap would skip content tokens between chunks.")
+    if overlap >= chunk_size - 1:
+        raise ValueError(f"overlap must be less than chunk_size - 1 ({chunk_size - 1}), got {overlap}.")
+    return body, stride
+
+def _count_chunks(num_tokens: int, body: int, stride: int) -> int:
+    """Number of windows needed to cover num_tokens content tokens."""
+    if num_tokens == 0:
+        return 0
+    num_full = (num_tokens - body) // stride + 1 if num_tokens >= body else 0
+    last_full_end = (num_full - 1) * stride + body if num_full else 0
+    return num_full + (1 if last_full_end < num_tokens else 0)
+
+def _write_chunks(
+    ids: torch.Tensor,
+    out: torch.Tensor,
+    body: int,
+    stride: int
+) -> torch.Tensor:
+    """
+    Writes the content windows of one contract into `out` (rows pre-filled with padding and `<s>`
+    in column 0) and returns the content length of every window.
+    """
+    num_tokens = ids.shape[0]
+    num_chunks = out.shape[0]
+    # Полные окна берем одним unfold (view без копирования), хвост (не более одного окна) - срезом
+    num_full = (num_tokens - body) // stride + 1 if num_tokens >= body else 0
+    if num_full:
+        out[:num_full, 1:body + 1] = ids.unfold(0, body, stride)
+    if num_chunks > num_full:
+        tail = ids[num_full * stride:]
+        out[num_full, 1:tail.shape[0] + 1] = tail
+    starts = torch.arange(num_chunks, dtype=torch.long) * stride
+    return torch.clamp(num_tokens - starts, max=body)
+
+def _finalize_chunks(
+    input_ids: torch.Tensor,
+    content_lengths: torch.Tensor,
+    sep_token_id: int
+) -> torch.Tensor:
+    """Places `</s>` after every window's content and returns the matching attention mask."""
+    chunk_size = input_ids.shape[1]
+    input_ids[torch.arange(input_ids.shape[0]), content_lengths + 1] = sep_token_id
+    return (torch.arange(chunk_size).unsqueeze(0) < (content_lengths + 2).unsqueeze(1)).long()
+
+def chunk_token_ids(
+    token_ids: Sequence[int],
+    cls_token_id: int,
+    sep_token_id: int,
+    pad_token_id: int,
+    chunk_size: int = main_config.MODEL_CHUNK_SIZE,
+    overlap: int = main_config.CHUNK_OVERLAP
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Splits content token IDs (without special tokens) into overlapping windows,
+    wraps every window as `<s> ... </s>` and pads it to chunk_size, all on IDs.
+
+    Windows hold up to chunk_size - 2 content tokens (the body) and start every
+    chunk_size - overlap tokens. The legacy re-encoding chunker used the same stride and
+    produces the same number of chunks, but it cut chunk_size positions from the stream that
+    still contained the contract's own <s>, so from its second window on every window starts
+    one content token earlier than here (see _tokenize_and_chunk_code_reencode).
+
+    Args:
+        token_ids (Sequence[int]): Content token IDs of one contract.
+        cls_token_id (int): ID prepended to every chunk (`<s>` for CodeBERT).
+        sep_token_id (int): ID appended after the content of every chunk (`</s>`).
+        pad_token_id (int): ID used for padding.
+        chunk_size (int): Length of every output row, special tokens included.
+        overlap (int): Number of positions shared by consecutive windows.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: input_ids and attention_mask, both int64
+                                           of shape (num_chunks, chunk_size).
+    """
+    body, stride = _chunk_geometry(chunk_size, overlap)
+    ids = torch.as_tensor(token_ids, dtype=torch.long)
+    num_chunks = _count_chunks(ids.shape[0], body, stride)
+
+    input_ids = torch.full((num_chunks, chunk_size), pad_token_id, dtype=torch.long)
+    input_ids[:, 0] = cls_token_id
+    if num_chunks == 0:
+        return input_ids, torch.zeros_like(input_ids)
+    content_lengths = _write_chunks(ids, input_ids, body, stride)
+    attention_mask = _finalize_chunks(input_ids, content_lengths, sep_token_id)
+    return input_ids, attention_mask
+
+def tokenize_and_chunk_batch(
+    codes: Sequence[str],
+    tokenizer, # Передаем уже загруженный токенизатор
+    max_total_tokens: int = main_config.MAX_TOTAL_TOKENS,
+    chunk_size: int = main_config.MODEL_CHUNK_SIZE,
+    overlap: int = main_config.CHUNK_OVERLAP
+) -> Dict[str, torch.Tensor]:
+    """
+    Tokenizes many contracts with a single batched tokenizer call (the Rust fast tokenizer
+    parallelizes it across cores) and chunks them into one flat tensor.
+
+    Chunks are laid out CSR-style: the chunks of contract i are rows
+    offsets[i]:offsets[i + 1]. Empty, whitespace-only or non-string entries get no chunks.
+
+    Args:
+        codes (Sequence[str]): Source code of every contract.
+        tokenizer: The Hugging Face tokenizer instance.
+        max_total_tokens (int): Maximum number of tokens per contract, special tokens included.
+        chunk_size (int): The target size for each chunk.
+        overlap (int): Number of tokens to overlap between consecutive chunks.
+
+    Returns:
+        Dict[str, torch.Tensor]: 'input_ids' and 'attention_mask' of shape (total_chunks, chunk_size)
+                                 and 'offsets' of shape (len(codes) + 1,), all int64.
+    """
+    body, stride = _chunk_geometry(chunk_size, overlap)
+
+    # В токенизатор отправляем только непустые контракты, остальные получают 0 чанков
+    valid_positions = [
+        i for i, code in enumerate(codes)
+        if isinstance(code, str) and code and not code.isspace()
+    ]
+    content_ids: List[List[int]] = [[] for _ in codes]
+    if valid_positions:
+        # Токенизируем один раз, без спецтокенов: <s>/</s> добавляются к каждому чанку по ID
+        encoded = tokenizer(
+            [codes[i] for i in valid_positions],
+            add_special_tokens=False,
+            max_length=max_total_tokens - 2, # Тот же бюджет контента, что и с <s>/</s> раньше
+            truncation=True,
+            padding=False,
+            return_attention_mask=False,
+            return_tensors=None
+        )['input_ids']
+        for position, ids in zip(valid_positions, encoded):
+            content_ids[position] = ids
+
+    counts = torch.tensor([_count_chunks(len(ids), body, stride) for ids in content_ids], dtype=torch.long)
+    offsets = torch.zeros(len(codes) + 1, dtype=torch.long)
+    offsets[1:] = torch.cumsum(counts, dim=0)
+    total_chunks = int(offsets[-1])
+
+    # Один предвыделенный тензор на все чанки всех контрактов
+    input_ids = torch.full((total_chunks, chunk_size), tokenizer.pad_token_id, dtype=torch.long)
+    input_ids[:, 0] = tokenizer.cls_token_id
+    content_lengths = torch.empty(total_chunks, dtype=torch.long)
+    for i, ids in enumerate(content_ids):
+        start, end = int(offsets[i]), int(offsets[i + 1])
+        if start == end:
+            continue
+        content_lengths[start:end] = _write_chunks(
+            torch.as_tensor(ids, dtype=torch.long), input_ids[start:end], body, stride
+        )
+    attention_mask = _finalize_chunks(input_ids, content_lengths, tokenizer.sep_token_id)
+
+    return {'input_ids': input_ids, 'attention_mask': attention_mask, 'offsets': offsets}
+
+def trim_padding(input_ids: torch.Tensor, attention_mask: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Narrows a batch of right-padded chunks to its longest chunk (dynamic padding).
+    Returns views, no copy; an empty batch is returned unchanged.
+    """
+    if input_ids.shape[0] == 0:
+        return input_ids, attention_mask
+    width = max(int(attention_mask.sum(dim=1).max()), 1)
+    return input_ids[:, :width], attention_mask[:, :width]
+
 def tokenize_and_chunk_code(
     code_string: str,
     tokenizer, # Передаем уже загруженный токенизатор
@@ -59,6 +236,50 @@ def tokenize_and_chunk_code(
     and then splits it into chunks with overlap.
     Each chunk is padded to chunk_size.
 
+    The contract is tokenized once; chunks are cut from the token IDs directly
+    (see `tokenize_and_chunk_batch`), so chunk boundaries always match the original tokenization.
+
+    Args:
+        code_string (str): The source code.
+        tokenizer: The Hugging Face tokenizer instance.
+        max_total_tokens (int): Maximum number of tokens to consider from the code string
+                                before chunking (special tokens included, as before).
+        chunk_size (int): The target size for each chunk (e.g., model's max input size).
+        overlap (int): Number of tokens to overlap between consecutive chunks.
+
+    Returns:
+        List[Dict[str, torch.Tensor]]: A list of dictionaries, where each dictionary
+                                       contains 'input_ids' and 'attention_mask'
+                                       for a single chunk, as PyTorch tensors.
+                                       Returns an empty list if the code_string is empty or only whitespace.
+    """
+    batch = tokenize_and_chunk_batch([code_string], tokenizer, max_total_tokens, chunk_size, overlap)
+    # Строки - view одного тензора (num_chunks, chunk_size), без копирования
+    return [
+        {'input_ids': batch['input_ids'][i], 'attention_mask': batch['attention_mask'][i]}
+        for i in range(batch['input_ids'].shape[0])
+    ]
+
+def _tokenize_and_chunk_code_reencode(
+    code_string: str,
+    tokenizer, # Передаем уже загруженный токенизатор
+    max_total_tokens: int = main_config.MAX_TOTAL_TOKENS,
+    chunk_size: int = main_config.MODEL_CHUNK_SIZE,
+    overlap: int = main_config.CHUNK_OVERLAP
+) -> List[Dict[str, torch.Tensor]]:
+    """
+    Legacy chunker: decodes every window back to text and tokenizes it again to add
+    special tokens and padding. Kept only as a reference for parity checks of
+    `tokenize_and_chunk_code` (see scripts/run_benchmark_chunking.py, tests/test_tokenization.py).
+
+    Known differences from the ID chunker, which are intended:
+    - windows are chunk_size positions of `<s> content </s>`, re-encoding truncates each of them
+      to a body of chunk_size - 2 tokens, so window k >= 1 starts at content token k*stride - 1
+      instead of k*stride (window 0 and the chunk count are the same);
+    - a contract that fits one chunk is decoded together with its special tokens, which the
+      tokenizer then adds again: the content may lose up to two trailing tokens to truncation;
+    - decoded text is re-tokenized, so a window cut inside a word may tokenize differently.
+
     Args:
         code_string (str): The source code.
         tokenizer: The Hugging Face tokenizer instance.
@@ -186,66 +407,3 @@ def tokenize_and_chunk_code(
             break
             
     return chunked_outputs
-
-if __name__ == '__main__':
-    # Пример использования
-    sample_codes = [
-        "pragma solidity ^0.8.0; contract A { uint public value; }",
-        "contract B { function foo() public pure returns(uint) { return 1; } event Log(string); }",
-        "very long code string..." * 1000 # Пример очень длинной строки
-    ]
-
-    # Сначала установим токенизатор по умолчанию
-    default_tokenizer = get_tokenizer() # Использует "microsoft/codebert-base"
-    print(f"Default tokenizer pad token: {default_tokenizer.pad_token_id} ({default_tokenizer.pad_token})")
-    print(f"Default tokenizer model_max_length: {default_tokenizer.model_max_length}")
-
-
-    # Используем MAX_CODE_LENGTH из конфига (4096)
-    print(f"\n--- Tokenizing with MAX_CODE_LENGTH = {main_config.MAX_CODE_LENGTH} ---")
-    tokenized_output = tokenize_code(sample_codes, max_length=main_config.MAX_CODE_LENGTH)
-
-    print("Input IDs shape:", tokenized_output['input_ids'].shape)
-    print("Attention Mask shape:", tokenized_output['attention_mask'].shape)
-    print("Sample Input IDs (first contract):", tokenized_output['input_ids'][0, :30])
-    print("Sample Attention Mask (first contract):", tokenized_output['attention_mask'][0, :30])
-
-    print(f"\n--- Tokenizing with a shorter max_length = 10 (for truncation demo) ---")
-    # Пример с короткой длиной для демонстрации обрезки
-    tokenized_output_short = tokenize_code(sample_codes, max_length=10)
-    print("Input IDs shape (short):", tokenized_output_short['input_ids'].shape)
-    print("Sample Input IDs (third contract, truncated):", tokenized_output_short['input_ids'][2])
-
-
-    # Проверка работы с Series
-    print("\n--- Tokenizing pandas Series ---")
-    sample_series = pd.Series(sample_codes)
-    tokenized_series_output = tokenize_code(sample_series)
-    print("Input IDs shape from Series:", tokenized_series_output['input_ids'].shape)
-
-    tokenizer_instance = get_tokenizer()
-    
-    sample_codes_for_chunking = [
-        "contract Short { uint x; }", # < chunk_size
-        "pragma solidity ^0.8.0; contract MediumLengthContractExample { function getValue() public pure returns(uint) { return 100; } function setValue(uint _v) public { require(_v > 0); value = _v; } uint private value; event ValueSet(uint indexed newValue); constructor() { value = 1; } }", # ~chunk_size
-        ("contract LongContract { " + "uint public valNum; function funcCallRepetitive(uint num) public { valNum = num + valNum - 2 * 3 / 1 + 777; } " * 30 + "}"), # > chunk_size, < max_total_tokens
-        ("contract VeryLongContract { " + "uint public dataField; function processData(uint inputData) internal pure returns(bytes memory) { return abi.encodePacked(inputData, inputData*2, inputData*3); } " * 150 + "}") # > max_total_tokens
-    ]
-    
-    print(f"Using: MAX_TOTAL_TOKENS={main_config.MAX_TOTAL_TOKENS}, MODEL_CHUNK_SIZE={main_config.MODEL_CHUNK_SIZE}, CHUNK_OVERLAP={main_config.CHUNK_OVERLAP}\n")
-
-    for i, code in enumerate(sample_codes_for_chunking):
-        print(f"--- Processing Code Sample {i+1} ---")
-        original_tokens = tokenizer_instance.encode(code, truncation=False)
-        print(f"Original code length (chars): {len(code)}")
-        print(f"Original code length (tokens before any truncation): {len(original_tokens)}")
-        
-        chunks = tokenize_and_chunk_code(code, tokenizer_instance)
-        print(f"Number of chunks generated: {len(chunks)}")
-        if chunks:
-            for j, chunk in enumerate(chunks):
-                print(f"  Chunk {j+1}: input_ids shape: {chunk['input_ids'].shape}, attention_mask shape: {chunk['attention_mask'].shape}")
-                # print(f"  Chunk {j+1} input_ids: {chunk['input_ids']}")
-        else:
-            print("  No chunks generated (empty or whitespace input).")
-        print("-" * 30) 
\ No newline at end of file
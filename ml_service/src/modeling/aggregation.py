@@ -0,0 +1,231 @@
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import torch
+
+from src.modeling.distributed import all_gather_objects, all_reduce_max, all_reduce_sum
+
+# Правила сведения вероятностей чанков в вероятность контракта
+AGGREGATORS = ("max", "mean", "topk_mean", "noisy_or")
+
+_NOISY_OR_EPS = 1e-6  # log(1 - p) при p == 1 уходит в -inf
+
+
+class ContractScoreAccumulator:
+    """
+    Потоковое сведение вероятностей чанков в оценки контрактов по `original_index`.
+
+    Чанки одного контракта могут приходить в разных батчах (перемешивание, бакетинг по длине)
+    и на разных рангах DDP, поэтому для каждого контракта хранится только состояние,
+    достаточное для выбранного правила, а не все его чанки:
+      * max       - поэлементный максимум;
+      * mean      - сумма и число чанков;
+      * topk_mean - `top_k` наибольших вероятностей по каждой метке;
+      * noisy_or  - сумма log(1 - p): P(контракт уязвим) = 1 - prod(1 - p_chunk).
+    Память O(num_contracts * num_labels) (для topk_mean - в `top_k` раз больше).
+
+    Тот же класс используется и для одного контракта в API (`aggregate_chunk_probs`),
+    так что метрики валидации считаются тем же кодом, что и ответ сервиса.
+    """
+    def __init__(self,
+                 num_contracts: int,
+                 num_labels: int,
+                 method: str = "max",
+                 top_k: int = 3,
+                 device: Union[str, torch.device] = "cpu"):
+        if method not in AGGREGATORS:
+            raise ValueError(f"Unknown aggregation method '{method}'. Expected one of {AGGREGATORS}.")
+        if top_k < 1:
+            raise ValueError("top_k must be >= 1.")
+        self.method = method
+        self.top_k = top_k
+        self.num_contracts = num_contracts
+        self.counts = torch.zeros(num_contracts, dtype=torch.long, device=device)
+        self.labels = torch.zeros((num_contracts, num_labels), dtype=torch.float32, device=device)
+        if method == "topk_mean":
+            # -1 ниже любой вероятности: незаполненные позиции не вытесняют настоящие значения
+            self.state = torch.full((num_contracts, top_k, num_labels), -1.0, device=device)
+        else:
+            self.state = torch.zeros((num_contracts, num_labels), device=device)
+
+    @torch.no_grad()
+    def update(self, probs: torch.Tensor, contract_index: torch.Tensor, labels: Optional[torch.Tensor] = None) -> None:
+        """
+        Args:
+            probs (torch.Tensor): Chunk probabilities, shape (num_chunks, num_labels).
+            contract_index (torch.Tensor): Contract of every chunk (original_index), shape (num_chunks,).
+            labels (torch.Tensor, optional): Chunk labels; every chunk carries its contract's labels.
+        """
+        probs = probs.detach().float()
+        contract_index = contract_index.to(probs.device, dtype=torch.long)
+        self.counts.index_add_(0, contract_index, torch.ones_like(contract_index))
+        if labels is not None:
+            self.labels.index_copy_(0, contract_index, labels.detach().float())
+
+        if self.method == "max":
+            # Вероятности >= 0, поэтому нулевое начальное состояние не искажает максимум
+            self.state.scatter_reduce_(0, contract_index.unsqueeze(1).expand_as(probs), probs, reduce="amax")
+        elif self.method == "mean":
+            self.state.index_add_(0, contract_index, probs)
+        elif self.method == "noisy_or":
+            self.state.index_add_(0, contract_index, torch.log1p(-probs.clamp(max=1.0 - _NOISY_OR_EPS)))
+        else:
+            self._update_topk(probs, contract_index)
+
+    def _update_topk(self, probs: torch.Tensor, contract_index: torch.Tensor) -> None:
+        # В батче у контракта может быть несколько чанков: сливаем их по одному за проход,
+        # чтобы в каждом проходе индексы контрактов были уникальны
+        order = torch.argsort(contract_index, stable=True)
+        sorted_index = contract_index[order]
+        group_start = torch.searchsorted(sorted_index, sorted_index, right=False)
+        rank_in_group = torch.arange(len(order), device=probs.device) - group_start
+        for position in range(int(rank_in_group.max()) + 1 if len(order) else 0):
+            selected = order[rank_in_group == position]
+            contracts = contract_index[selected]
+            merged = torch.cat([self.state[contracts], probs[selected].unsqueeze(1)], dim=1)
+            self.state[contracts] = merged.topk(self.top_k, dim=1).values
+
+    def sync(self) -> None:
+        """Merges the per-contract state across distributed ranks (no-op in a single process)."""
+        all_reduce_sum(self.counts)
+        all_reduce_max(self.labels)  # Метки контракта одинаковы на всех рангах, где он встретился
+        if self.method == "max":
+            all_reduce_max(self.state)
+        elif self.method in ("mean", "noisy_or"):
+            all_reduce_sum(self.state)
+        else:
+            parts = all_gather_objects(self.state.cpu())
+            if len(parts) > 1:
+                merged = torch.cat(parts, dim=1).to(self.state.device)
+                self.state = merged.topk(self.top_k, dim=1).values
+
+    def compute(self) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor, torch.Tensor]: contract scores (num_contracts, num_labels),
+            contract labels of the same shape, and a mask of contracts that received at least one chunk.
+            Contracts without chunks score 0.
+        """
+        seen = self.counts > 0
+        counts = self.counts.clamp(min=1).unsqueeze(1).float()
+        if self.method == "max":
+            scores = self.state.clone()
+        elif self.method == "mean":
+            scores = self.state / counts
+        elif self.method == "noisy_or":
+            scores = -torch.expm1(self.state)  # 1 - exp(sum log(1 - p))
+        else:
+            taken = torch.clamp(counts, max=self.top_k)  # у коротких контрактов чанков меньше top_k
+            scores = self.state.clamp(min=0.0).sum(dim=1) / taken
+        scores[~seen] = 0.0
+        return scores, self.labels, seen
+
+    def bounds(self, remaining: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Range the final scores can still reach if every contract gets `remaining` more chunks
+        with arbitrary probabilities in [0, 1].
+
+        Args:
+            remaining (torch.Tensor): Chunks not yet seen per contract, shape (num_contracts,).
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: (lower, upper) bounds, each (num_contracts, num_labels).
+        """
+        remaining = remaining.to(self.counts.device, dtype=torch.long).unsqueeze(1)
+        scores, _, _ = self.compute()
+        if self.method in ("max", "noisy_or"):
+            # Монотонные правила: новые чанки могут только поднять оценку
+            upper = torch.where(remaining > 0, torch.ones_like(scores), scores)
+            return scores, upper
+        seen_count = self.counts.unsqueeze(1).float()
+        total = seen_count + remaining
+        if self.method == "mean":
+            seen_sum = scores * seen_count
+            return seen_sum / total.clamp(min=1), (seen_sum + remaining) / total.clamp(min=1)
+        # topk_mean: итоговое среднее берется по min(top_k, всего чанков) значениям
+        final_k = total.clamp(max=self.top_k).clamp(min=1)
+        top = self.state.clamp(min=0.0)  # (C, top_k, L), по убыванию
+        lower = top.sum(dim=1) / final_k  # новые чанки с p = 0 только разбавляют среднее
+        # Верхняя граница: новые чанки с p = 1 вытесняют наименьшие из уже отобранных
+        ones = remaining.clamp(max=self.top_k).squeeze(1)
+        keep = (final_k.squeeze(1).long() - ones).clamp(min=0)
+        positions = torch.arange(self.top_k, device=top.device).view(1, -1, 1)
+        kept_sum = (top * (positions < keep.view(-1, 1, 1))).sum(dim=1)
+        upper = (kept_sum + ones.unsqueeze(1)) / final_k
+        return lower, upper
+
+    def is_decided(self, remaining: torch.Tensor, threshold: float) -> torch.Tensor:
+        """
+        True for contracts whose thresholded result (score > threshold for every label) can no longer
+        change whatever the `remaining` chunks contain. Shape (num_contracts,).
+        """
+        lower, upper = self.bounds(remaining)
+        return ((lower > threshold) | (upper <= threshold)).all(dim=1)
+
+
+def aggregate_chunk_probs(chunk_probs: Union[np.ndarray, torch.Tensor],
+                          method: str = "max",
+                          top_k: int = 3) -> np.ndarray:
+    """
+    Aggregates the chunk probabilities of a single contract.
+
+    Args:
+        chunk_probs: Array of shape (num_chunks, num_labels).
+        method (str): One of AGGREGATORS.
+        top_k (int): Number of chunks averaged by "topk_mean".
+
+    Returns:
+        np.ndarray: Contract probabilities, shape (num_labels,).
+    """
+    probs = torch.as_tensor(chunk_probs, dtype=torch.float32)
+    accumulator = ContractScoreAccumulator(1, probs.shape[1], method=method, top_k=top_k)
+    if len(probs):
+        accumulator.update(probs, torch.zeros(len(probs), dtype=torch.long))
+    scores, _, _ = accumulator.compute()
+    return scores[0].numpy()
+
+
+def aggregate_segments(chunk_probs: torch.Tensor,
+                       offsets: torch.Tensor,
+                       method: str = "max",
+                       top_k: int = 3) -> torch.Tensor:
+    """
+    Aggregates a flat batch of chunks laid out in CSR form: contract i owns rows offsets[i]:offsets[i + 1]
+    (the layout returned by tokenize_and_chunk_batch). Returns (len(offsets) - 1, num_labels).
+    """
+    counts = offsets[1:] - offsets[:-1]
+    contract_index = torch.repeat_interleave(torch.arange(len(counts), device=counts.device), counts)
+    accumulator = ContractScoreAccumulator(len(counts), chunk_probs.shape[1], method=method, top_k=top_k,
+                                           device=chunk_probs.device)
+    accumulator.update(chunk_probs, contract_index)
+    scores, _, _ = accumulator.compute()
+    return scores
+
+
+def pad_contract_chunks(values: torch.Tensor,
+                        contract_index: torch.Tensor,
+                        num_contracts: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Groups per-chunk rows by contract into a padded tensor (input of AttentionPoolingHead).
+
+    Args:
+        values (torch.Tensor): Per-chunk rows, shape (num_chunks, dim), in any order.
+        contract_index (torch.Tensor): Contract of every chunk, shape (num_chunks,).
+        num_contracts (int): Number of contracts (contract_index < num_contracts).
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: (num_contracts, max_chunks, dim) values and
+        a (num_contracts, max_chunks) bool mask of real chunks.
+    """
+    contract_index = contract_index.to(values.device, dtype=torch.long)
+    counts = torch.bincount(contract_index, minlength=num_contracts)
+    max_chunks = int(counts.max()) if len(counts) else 0
+    order = torch.argsort(contract_index, stable=True)
+    sorted_index = contract_index[order]
+    positions = torch.arange(len(order), device=values.device) - torch.searchsorted(sorted_index, sorted_index)
+
+    padded = values.new_zeros((num_contracts, max_chunks, values.shape[1]))
+    mask = torch.zeros((num_contracts, max_chunks), dtype=torch.bool, device=values.device)
+    padded[sorted_index, positions] = values[order]
+    mask[sorted_index, positions] = True
+    return padded, mask
@@ -0,0 +1,143 @@
+import os
+import pathlib
+import queue
+import random
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+
+from config import main_config
+
+CHECKPOINT_PATTERN = re.compile(r"^checkpoint_(\d+)\.pt$")
+
+
+def capture_rng_state() -> Dict[str, Any]:
+    """Состояние всех генераторов, влияющих на обучение: random, numpy, torch (CPU и CUDA)."""
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state: Dict[str, Any]) -> None:
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def _snapshot(obj: Any) -> Any:
+    """Рекурсивная копия на CPU: обучение продолжает менять тензоры, пока фоновый поток пишет файл."""
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: _snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(value) for value in obj)
+    return obj
+
+
+def list_checkpoints(directory: pathlib.Path) -> List[pathlib.Path]:
+    """Checkpoints in `directory`, oldest first (ordered by global step)."""
+    directory = pathlib.Path(directory)
+    if not directory.exists():
+        return []
+    found = []
+    for path in directory.iterdir():
+        match = CHECKPOINT_PATTERN.match(path.name)
+        if match:
+            found.append((int(match.group(1)), path))
+    return [path for _, path in sorted(found)]
+
+
+def latest_checkpoint(directory: pathlib.Path) -> Optional[pathlib.Path]:
+    checkpoints = list_checkpoints(directory)
+    return checkpoints[-1] if checkpoints else None
+
+
+def load_checkpoint(path: str, map_location: str = "cpu") -> Dict[str, Any]:
+    # weights_only=False: в чекпоинте состояния RNG (numpy/python), а не только тензоры
+    return torch.load(path, map_location=map_location, weights_only=False)
+
+
+class CheckpointManager:
+    """
+    Пишет полные чекпоинты обучения в фоновом потоке.
+
+    `save` синхронно снимает копию состояния на CPU (это быстро по сравнению с сериализацией
+    и записью на диск), а torch.save, fsync и os.replace выполняет поток-писатель, так что шаги
+    обучения не ждут диска. Одновременно в очереди не больше одного чекпоинта: если писатель
+    еще занят предыдущим, следующий `save` подождет, и копии состояния не копятся в памяти.
+    После записи остаются только `keep_last` последних чекпоинтов.
+    """
+    def __init__(self, directory: pathlib.Path = main_config.CHECKPOINT_DIR, keep_last: int = 3):
+        if keep_last < 1:
+            raise ValueError("keep_last must be >= 1.")
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.keep_last = keep_last
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=1)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, state: Dict[str, Any], global_step: int) -> pathlib.Path:
+        """
+        Schedules `state` to be written as checkpoint_<global_step>.pt.
+
+        Raises:
+            RuntimeError: If a previous background write failed.
+        """
+        self._raise_if_failed()
+        path = self.directory / f"checkpoint_{global_step:09d}.pt"
+        self._queue.put((_snapshot(state), path))
+        return path
+
+    def wait(self) -> None:
+        """Blocks until every scheduled checkpoint is on disk."""
+        self._queue.join()
+        self._raise_if_failed()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_if_failed()
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"Background checkpoint write failed: {self._error}") from self._error
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                state, path = item
+                self._write(state, path)
+                self._prune()
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, state: Dict[str, Any], path: pathlib.Path) -> None:
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            torch.save(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)  # Читатель видит либо старый, либо полностью записанный файл
+        print(f"Checkpoint saved: {path}")
+
+    def _prune(self) -> None:
+        for path in list_checkpoints(self.directory)[:-self.keep_last]:
+            path.unlink(missing_ok=True)
@@ -1,19 +1,61 @@
+import json
+import math
+import numpy as np
 import torch
-from torch.utils.data import Dataset
-from typing import List, Dict, Any
+from torch.utils.data import (
+    BatchSampler,
+    DataLoader,
+    Dataset,
+    DistributedSampler,
+    RandomSampler,
+    Sampler,
+    SequentialSampler,
+    get_worker_info,
+)
+from typing import List, Dict, Any, Optional, Tuple
 import os
 
 from config import main_config # Убедимся, что main_config доступен
 
+def _batch_buffer(shape, dtype: torch.dtype, pin_memory: bool) -> torch.Tensor:
+    """
+    Буфер под один батч. В основном процессе при pin_memory выделяется в page-locked памяти,
+    чтобы .to(device, non_blocking=True) шел без промежуточной копии; в воркерах DataLoader
+    пиннить нельзя (CUDA не инициализирована) - там обычная память в shared-сегменте.
+    Повторно между батчами буферы не используются: на CPU `.to(device)` возвращает тот же
+    тензор, и numpy-view меток для метрик эпохи ссылались бы на перезаписанную память.
+    Переиспользование закреплённых страниц делает кеширующий host-аллокатор torch.
+    """
+    pin = pin_memory and get_worker_info() is None
+    return torch.empty(shape, dtype=dtype, pin_memory=pin)
+
+
+def _batch_width(lengths: np.ndarray, index: np.ndarray, chunk_size: int, dynamic_padding: bool) -> int:
+    """Ширина батча: самый длинный чанк в нем (при dynamic_padding) или полный chunk_size."""
+    if not dynamic_padding or index.shape[0] == 0:
+        return chunk_size
+    return max(int(lengths[index].max()), 1)
+
+
+def _is_batch_index(idx: Any) -> bool:
+    return not isinstance(idx, (int, np.integer)) and not (torch.is_tensor(idx) and idx.dim() == 0)
+
+
 class ContractChunkDataset(Dataset):
     """
     PyTorch Dataset для чанков смарт-контрактов.
     Каждый элемент датасета представляет один чанк.
+
+    Помимо индекса чанка, `__getitem__` принимает список индексов и возвращает сразу
+    собранный батч (см. create_chunk_dataloader): одна index_select-копия на тензор
+    вместо клонирования каждого чанка и последующего stack в default_collate.
     """
     def __init__(self, 
                  chunk_list_path: str, 
                  labels_path: str,
-                 original_indices_path: str = None):
+                 original_indices_path: str = None,
+                 pin_memory: bool = torch.cuda.is_available(),
+                 dynamic_padding: bool = True):
         """
         Args:
             chunk_list_path (str): Путь к файлу .pt, содержащему список словарей чанков.
@@ -21,50 +63,362 @@ class ContractChunkDataset(Dataset):
             labels_path (str): Путь к файлу .pt, содержащему тензор меток для каждого чанка.
             original_indices_path (str, optional): Путь к файлу .pt с исходными индексами.
                                                     Может использоваться для группировки или отладки.
+            pin_memory (bool): Собирать батчи в page-locked памяти (имеет смысл только для CUDA).
+            dynamic_padding (bool): Обрезать батч до самого длинного чанка в нем, а не до chunk_size.
         """
         super().__init__()
+        self.pin_memory = pin_memory
+        self.dynamic_padding = dynamic_padding
         
         print(f"Loading chunk list from: {chunk_list_path}")
-        self.chunk_list: List[Dict[str, torch.Tensor]] = torch.load(chunk_list_path)
+        chunk_list: List[Dict[str, torch.Tensor]] = torch.load(chunk_list_path)
+        # Один непрерывный тензор вместо списка мелких: нет Python-объекта на чанк,
+        # и батч собирается одной индексированной копией
+        if chunk_list:
+            self.input_ids = torch.stack([chunk['input_ids'] for chunk in chunk_list])
+            self.attention_mask = torch.stack([chunk['attention_mask'] for chunk in chunk_list])
+        else:
+            self.input_ids = torch.empty((0, main_config.MODEL_CHUNK_SIZE), dtype=torch.long)
+            self.attention_mask = torch.empty((0, main_config.MODEL_CHUNK_SIZE), dtype=torch.long)
+        del chunk_list
+        # Истинные длины чанков (паддинг всегда в конце): для бакетинга и динамического паддинга
+        self.lengths: np.ndarray = self.attention_mask.sum(dim=1).numpy()
         
         print(f"Loading labels from: {labels_path}")
-        self.labels: torch.Tensor = torch.load(labels_path)
+        self.labels: torch.Tensor = torch.load(labels_path).contiguous()
 
-        self.original_indices = None
+        self.original_indices: Optional[torch.Tensor] = None
         if original_indices_path and os.path.exists(original_indices_path):
             print(f"Loading original indices from: {original_indices_path}")
-            self.original_indices: List[int] = torch.load(original_indices_path)
-            if len(self.original_indices) != len(self.chunk_list):
-                print(f"Warning: Length of original_indices ({len(self.original_indices)}) "
-                      f"does not match length of chunk_list ({len(self.chunk_list)}).")
+            original_indices = torch.as_tensor(torch.load(original_indices_path), dtype=torch.long)
+            if len(original_indices) != len(self.input_ids):
+                print(f"Warning: Length of original_indices ({len(original_indices)}) "
+                      f"does not match length of chunk_list ({len(self.input_ids)}). Ignoring them.")
+            else:
+                self.original_indices = original_indices
         
-        if len(self.chunk_list) != self.labels.shape[0]:
-            raise ValueError(f"Mismatch in number of chunks ({len(self.chunk_list)}) "
+        if len(self.input_ids) != self.labels.shape[0]:
+            raise ValueError(f"Mismatch in number of chunks ({len(self.input_ids)}) "
                              f"and number of labels ({self.labels.shape[0]})")
         
-        print(f"Dataset loaded. Number of chunks: {len(self.chunk_list)}. Labels shape: {self.labels.shape}")
+        print(f"Dataset loaded. Number of chunks: {len(self.input_ids)}. Labels shape: {self.labels.shape}")
 
     def __len__(self) -> int:
-        return len(self.chunk_list)
+        return len(self.input_ids)
 
-    def __getitem__(self, idx: int) -> Dict[str, Any]:
+    def __getitem__(self, idx) -> Dict[str, Any]:
         """
-        Возвращает один чанк и его метки.
+        Возвращает один чанк и его метки, либо целый батч, если idx - список индексов.
+        Тензоры одиночного элемента - view на общие данные, без копий; модифицировать их in-place нельзя.
         """
-        item = self.chunk_list[idx] # Это уже словарь с 'input_ids' и 'attention_mask'
-        label = self.labels[idx]
-        
+        if _is_batch_index(idx):
+            return self._get_batch(idx)
+
         output_item = {
-            'input_ids': item['input_ids'].clone().detach(), # клонируем, чтобы избежать проблем с inplace операциями
-            'attention_mask': item['attention_mask'].clone().detach(),
-            'labels': label.clone().detach()
+            'input_ids': self.input_ids[idx],
+            'attention_mask': self.attention_mask[idx],
+            'labels': self.labels[idx]
         }
 
-        if self.original_indices:
-            output_item['original_index'] = self.original_indices[idx]
+        if self.original_indices is not None:
+            output_item['original_index'] = int(self.original_indices[idx])
         
         return output_item
 
+    def _get_batch(self, indices) -> Dict[str, Any]:
+        index = torch.as_tensor(indices, dtype=torch.long)
+        width = _batch_width(self.lengths, index.numpy(), self.input_ids.shape[1], self.dynamic_padding)
+        batch = {}
+        # Срез [:, :width] - view, index_select копирует только нужные столбцы
+        for name, source in (("input_ids", self.input_ids[:, :width]),
+                             ("attention_mask", self.attention_mask[:, :width]),
+                             ("labels", self.labels)):
+            out = _batch_buffer((len(index),) + tuple(source.shape[1:]), source.dtype, self.pin_memory)
+            batch[name] = torch.index_select(source, 0, index, out=out)
+        if self.original_indices is not None:
+            batch['original_index'] = self.original_indices[index]
+        return batch
+
+
+class MemmapChunkDataset(Dataset):
+    """
+    Датасет чанков поверх единых memory-mapped массивов (см. chunk_shards.consolidate_shards
+    и chunk_shards.convert_pt_to_memmap):
+
+        input_ids.npy         (num_chunks, chunk_size) uint16/int32
+        lengths.npy           (num_chunks,) int16 - число значимых токенов, из него строится attention_mask
+        labels.npy            (num_chunks, num_labels) uint8/float32
+        original_indices.npy  (num_chunks,) int64
+        meta.json
+
+    Данные не загружаются в RAM: страницы подтягивает page cache ОС и делит его между всеми
+    процессами. Python-объектов на чанк нет, поэтому форкнутые воркеры DataLoader не
+    трогают refcount'ы и не вызывают copy-on-write копирования.
+    """
+    def __init__(self,
+                 data_dir: str,
+                 pin_memory: bool = torch.cuda.is_available(),
+                 dynamic_padding: bool = True):
+        """
+        Args:
+            data_dir (str): Directory with the consolidated arrays and meta.json.
+            pin_memory (bool): Собирать батчи в page-locked памяти (имеет смысл только для CUDA).
+            dynamic_padding (bool): Обрезать батч до самого длинного чанка в нем, а не до chunk_size.
+        """
+        super().__init__()
+        self.data_dir = str(data_dir)
+        self.pin_memory = pin_memory
+        self.dynamic_padding = dynamic_padding
+        with open(os.path.join(self.data_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta: Dict[str, Any] = json.load(f)
+        self.pad_token_id: int = self.meta["pad_token_id"]
+        self.chunk_size: int = self.meta["chunk_size"]
+        self.label_columns: Optional[List[str]] = self.meta.get("label_columns")
+        self._open()
+
+        if self.input_ids.shape[0] != self.labels.shape[0]:
+            raise ValueError(f"Mismatch in number of chunks ({self.input_ids.shape[0]}) "
+                             f"and number of labels ({self.labels.shape[0]})")
+        print(f"Memmap dataset opened from {self.data_dir}. Number of chunks: {len(self)}. "
+              f"Token dtype: {self.input_ids.dtype}. Labels shape: {self.labels.shape}")
+
+    def _open(self) -> None:
+        def load(name: str, mmap_mode: str) -> np.ndarray:
+            return np.load(os.path.join(self.data_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        # "c" (copy-on-write) дает записываемый numpy-view, так что torch.from_numpy не ругается
+        # на read-only буфер; сами страницы остаются общими, пока в них никто не пишет
+        self.input_ids = load("input_ids", "c")
+        self.lengths = load("lengths", "r")
+        self.labels = load("labels", "c")
+        self.original_indices = load("original_indices", "r")
+        self._positions = torch.arange(self.chunk_size)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # При spawn/pickle передаем только путь, иначе np.memmap сериализуется целиком
+        state = self.__dict__.copy()
+        for name in ("input_ids", "lengths", "labels", "original_indices", "_positions"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._open()
+
+    def __len__(self) -> int:
+        return self.input_ids.shape[0]
+
+    def __getitem__(self, idx: int) -> Dict[str, Any]:
+        """
+        Возвращает один чанк и его метки.
+        При int32-хранении input_ids — view на отображенную страницу без копирования;
+        uint16 расширяется до int64 (embedding не принимает uint16), это одна копия строки.
+        Список индексов возвращает целый батч (см. create_chunk_dataloader).
+        """
+        if _is_batch_index(idx):
+            return self._get_batch(idx)
+
+        row = self.input_ids[idx]
+        if row.dtype == np.int32:
+            input_ids = torch.from_numpy(row)
+        else:
+            input_ids = torch.from_numpy(row.astype(np.int64))
+        length = int(self.lengths[idx])
+        attention_mask = (self._positions < length).long()
+        labels = torch.from_numpy(self.labels[idx]).float()
+
+        return {
+            'input_ids': input_ids,
+            'attention_mask': attention_mask,
+            'labels': labels,
+            'original_index': int(self.original_indices[idx]),
+        }
+
+    def _get_batch(self, indices) -> Dict[str, Any]:
+        index = np.asarray(indices, dtype=np.int64)
+        num_rows = index.shape[0]
+        width = _batch_width(self.lengths, index, self.chunk_size, self.dynamic_padding)
+        # Индексированное чтение строк из отображения (numpy fancy indexing) - одна копия
+        # только нужных столбцов, затем расширение типа прямо в буфер батча
+        input_ids = _batch_buffer((num_rows, width), torch.long, self.pin_memory)
+        input_ids.copy_(torch.from_numpy(self.input_ids[index, :width]))
+        lengths = torch.from_numpy(self.lengths[index].astype(np.int64))
+        attention_mask = _batch_buffer((num_rows, width), torch.long, self.pin_memory)
+        attention_mask.copy_(self._positions[:width].unsqueeze(0) < lengths.unsqueeze(1))
+        labels = _batch_buffer((num_rows, self.labels.shape[1]), torch.float32, self.pin_memory)
+        labels.copy_(torch.from_numpy(self.labels[index]))
+
+        return {
+            'input_ids': input_ids,
+            'attention_mask': attention_mask,
+            'labels': labels,
+            'original_index': torch.from_numpy(self.original_indices[index]),
+        }
+
+
+def _passthrough_collate(batch: Dict[str, Any]) -> Dict[str, Any]:
+    # Батч уже собран датасетом
+    return batch
+
+
+class LengthBucketBatchSampler(Sampler):
+    """
+    Батч-сэмплер, группирующий чанки близкой длины.
+
+    Индексы перемешиваются, режутся на пулы по `batch_size * bucket_size_multiplier`,
+    внутри пула сортируются по длине и нарезаются на батчи; порядок батчей снова
+    перемешивается. Так батч почти не содержит паддинга (при динамическом паддинге
+    он дополняется только до своего самого длинного чанка), а случайность сохраняется.
+    Перемешивание детерминировано `seed` и номером эпохи (см. set_epoch).
+
+    При распределенном обучении все ранги строят один и тот же список батчей и берут
+    каждый `num_replicas`-й, начиная с `rank`. С even_shards список дополняется батчами
+    с начала (по кругу), чтобы у всех рангов было одинаковое число шагов (иначе DDP зависнет).
+    """
+    def __init__(self,
+                 lengths: np.ndarray,
+                 batch_size: int,
+                 shuffle: bool = True,
+                 drop_last: bool = False,
+                 bucket_size_multiplier: int = 50,
+                 seed: int = main_config.RANDOM_STATE,
+                 num_replicas: int = 1,
+                 rank: int = 0,
+                 even_shards: bool = True):
+        """
+        Args:
+            lengths (np.ndarray): True (unpadded) length of every chunk, e.g. `dataset.lengths`.
+            batch_size (int): Chunks per batch.
+            shuffle (bool): Shuffle pools and batch order; without it chunks are sorted by length globally.
+            drop_last (bool): Drop the last incomplete batch of every pool.
+            bucket_size_multiplier (int): Pool size in batches; larger pools give tighter length groups.
+            seed (int): Base seed of the permutation.
+            num_replicas (int): Number of distributed ranks sharing the data.
+            rank (int): Rank of this process.
+            even_shards (bool): Pad the batch list so every rank gets the same number of batches
+                                (required for training; evaluation can use uneven shards).
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive.")
+        if not 0 <= rank < num_replicas:
+            raise ValueError(f"rank must be in [0, {num_replicas}).")
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.pool_size = batch_size * max(bucket_size_multiplier, 1)
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.even_shards = even_shards
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def set_start_batch(self, start_batch: int) -> None:
+        """Пропустить первые `start_batch` батчей ближайшей итерации (возобновление с середины эпохи)."""
+        self.start_batch = start_batch
+
+    def _pool_bounds(self) -> List[Tuple[int, int]]:
+        num_items = self.lengths.shape[0]
+        # Без перемешивания весь датасет - один пул, т.е. глобальная сортировка по длине
+        pool_size = self.pool_size if self.shuffle else max(num_items, 1)
+        return [(start, min(start + pool_size, num_items)) for start in range(0, num_items, pool_size)]
+
+    def _batches(self) -> List[np.ndarray]:
+        num_items = self.lengths.shape[0]
+        rng = np.random.default_rng(self.seed + self.epoch)
+        order = rng.permutation(num_items) if self.shuffle else np.arange(num_items)
+        batches = []
+        for start, end in self._pool_bounds():
+            pool = order[start:end]
+            pool = pool[np.argsort(self.lengths[pool], kind="stable")]
+            pool_batches = [pool[i:i + self.batch_size] for i in range(0, len(pool), self.batch_size)]
+            if self.drop_last and pool_batches and len(pool_batches[-1]) < self.batch_size:
+                pool_batches.pop()
+            batches.extend(pool_batches)
+        if self.shuffle:
+            rng.shuffle(batches)
+        if self.num_replicas > 1:
+            if self.even_shards and batches:
+                # Повторяем список по кругу, как DistributedSampler: батчей может быть меньше, чем недостает
+                padding = -len(batches) % self.num_replicas
+                batches = batches + (batches * math.ceil(padding / len(batches)))[:padding]
+            batches = batches[self.rank::self.num_replicas]
+        return batches
+
+    def __iter__(self):
+        start_batch, self.start_batch = self.start_batch, 0
+        for batch in self._batches()[start_batch:]:
+            yield batch.tolist()
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            total = sum((end - start) // self.batch_size for start, end in self._pool_bounds())
+        else:
+            total = sum((end - start + self.batch_size - 1) // self.batch_size for start, end in self._pool_bounds())
+        if self.num_replicas == 1:
+            return total
+        if self.even_shards:
+            return (total + self.num_replicas - 1) // self.num_replicas
+        return len(range(self.rank, total, self.num_replicas))
+
+
+def create_chunk_dataloader(dataset: Dataset,
+                            batch_size: int,
+                            shuffle: bool = False,
+                            drop_last: bool = False,
+                            num_workers: int = 0,
+                            generator: Optional[torch.Generator] = None,
+                            bucket_by_length: bool = False,
+                            seed: int = main_config.RANDOM_STATE,
+                            num_replicas: int = 1,
+                            rank: int = 0,
+                            even_shards: bool = True,
+                            **kwargs: Any) -> DataLoader:
+    """
+    DataLoader, в котором сэмплер выдает сразу список индексов батча, а датасет собирает
+    батч одной индексированной копией на тензор (ContractChunkDataset / MemmapChunkDataset).
+
+    Pinning делает сам датасет в основном процессе, поэтому pin_memory у DataLoader
+    не включаем, иначе батч скопировался бы в закрепленную память второй раз. С воркерами
+    (num_workers > 0) батчи приходят через shared memory; если нужен pinning, передайте
+    pin_memory=True в kwargs - тогда его сделает поток pin_memory DataLoader.
+
+    bucket_by_length=True включает LengthBucketBatchSampler по `dataset.lengths`; вместе
+    с dynamic_padding датасета батчи дополняются только до своего самого длинного чанка.
+
+    num_replicas/rank шардируют данные между процессами DDP. Для обучения оставляйте
+    even_shards=True (DistributedSampler / выровненные шарды бакет-сэмплера); для оценки
+    even_shards=False дает шарды без повторов, и метрики не искажаются дубликатами.
+    """
+    if bucket_by_length:
+        batch_sampler = LengthBucketBatchSampler(dataset.lengths, batch_size, shuffle=shuffle,
+                                                 drop_last=drop_last, seed=seed, num_replicas=num_replicas,
+                                                 rank=rank, even_shards=even_shards)
+    else:
+        if num_replicas > 1 and even_shards:
+            sampler = DistributedSampler(dataset, num_replicas=num_replicas, rank=rank,
+                                         shuffle=shuffle, seed=seed, drop_last=drop_last)
+        elif num_replicas > 1:
+            sampler = range(rank, len(dataset), num_replicas)  # Непересекающиеся шарды без дополнения
+        elif shuffle:
+            sampler = RandomSampler(dataset, generator=generator)
+        else:
+            sampler = SequentialSampler(dataset)
+        batch_sampler = BatchSampler(sampler, batch_size=batch_size, drop_last=drop_last)
+    return DataLoader(
+        dataset,
+        sampler=batch_sampler,
+        batch_size=None,  # автобатчинг выключен: элемент сэмплера уже батч
+        collate_fn=_passthrough_collate,
+        num_workers=num_workers,
+        **kwargs
+    )
+
+
 if __name__ == '__main__':
     # Пример использования и тестирования Dataset
     # Убедитесь, что пути и имена файлов соответствуют тому, что было сохранено
@@ -0,0 +1,101 @@
+import os
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+import torch
+import torch.distributed as dist
+
+
+@dataclass
+class DistributedContext:
+    rank: int = 0
+    world_size: int = 1
+    local_rank: int = 0
+    local_world_size: int = 1
+
+    @property
+    def enabled(self) -> bool:
+        return self.world_size > 1
+
+    @property
+    def is_main(self) -> bool:
+        return self.rank == 0
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    return get_rank() == 0
+
+
+def init_distributed(backend: str = "gloo", num_threads: Optional[int] = None) -> DistributedContext:
+    """
+    Инициализирует process group по переменным окружения torchrun (RANK, WORLD_SIZE, LOCAL_RANK,
+    LOCAL_WORLD_SIZE, MASTER_ADDR/PORT). Без torchrun возвращает контекст одного процесса.
+
+    torchrun по умолчанию выставляет OMP_NUM_THREADS=1, поэтому число потоков intra-op задаем
+    явно: ядра машины делятся поровну между процессами одного узла.
+
+    Args:
+        backend (str): "gloo" for CPU training.
+        num_threads (Optional[int]): Threads per process; defaults to cpu_count // local_world_size.
+    """
+    context = DistributedContext(
+        rank=int(os.environ.get("RANK", 0)),
+        world_size=int(os.environ.get("WORLD_SIZE", 1)),
+        local_rank=int(os.environ.get("LOCAL_RANK", 0)),
+        local_world_size=int(os.environ.get("LOCAL_WORLD_SIZE", 1)),
+    )
+    if context.enabled and not is_distributed():
+        dist.init_process_group(backend=backend, rank=context.rank, world_size=context.world_size)
+
+    threads = num_threads or max(1, (os.cpu_count() or 1) // context.local_world_size)
+    torch.set_num_threads(threads)
+    if context.is_main:
+        print(f"Distributed: world_size={context.world_size}, backend={backend if context.enabled else 'none'}, "
+              f"threads per process={threads}")
+    return context
+
+
+def cleanup_distributed() -> None:
+    if is_distributed():
+        dist.destroy_process_group()
+
+
+def all_reduce_sum(tensor: torch.Tensor) -> torch.Tensor:
+    """Sums `tensor` across ranks in place (no-op without a process group) and returns it."""
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+def all_reduce_max(tensor: torch.Tensor) -> torch.Tensor:
+    """Element-wise maximum of `tensor` across ranks, in place (no-op without a process group)."""
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.MAX)
+    return tensor
+
+
+def all_gather_objects(obj: Any) -> List[Any]:
+    """Collects one picklable object from every rank, ordered by rank."""
+    if not is_distributed():
+        return [obj]
+    gathered: List[Any] = [None] * get_world_size()
+    dist.all_gather_object(gathered, obj)
+    return gathered
+
+
+def barrier() -> None:
+    if is_distributed():
+        dist.barrier()
+
@@ -0,0 +1,288 @@
+import os
+from typing import Dict, Optional, Sequence, Union
+
+import torch
+import torch.nn as nn
+from transformers import AutoConfig, AutoTokenizer
+
+from src.modeling.models import ContractVulnerabilityClassifier
+
+# Варианты модели для инференса; каждый, кроме fp32, - отдельный файл рядом с чекпоинтом
+MODEL_VARIANTS = ("fp32", "int8", "torchscript", "int8_torchscript")
+
+
+def variant_path(model_path: str, variant: str) -> str:
+    """Artifact path of `variant` next to the fp32 checkpoint: model.pt -> model.int8.pt etc."""
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant '{variant}'. Expected one of {MODEL_VARIANTS}.")
+    if variant == "fp32":
+        return model_path
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{variant}{ext}"
+
+
+def onnx_model_path(model_path: str) -> str:
+    """Path of the ONNX export next to the fp32 checkpoint: model.pt -> model.onnx."""
+    return os.path.splitext(model_path)[0] + ".onnx"
+
+
+def _example_inputs(batch_size: int = 2, length: int = 32):
+    input_ids = torch.randint(3, 1000, (batch_size, length))
+    attention_mask = torch.ones((batch_size, length), dtype=torch.long)
+    return input_ids, attention_mask
+
+
+def load_state_dict_file(path: str, mmap: bool = True) -> Dict[str, torch.Tensor]:
+    """
+    Reads a state dict without copying it into RAM up front: safetensors files and torch.save
+    zip checkpoints are memory-mapped, so pages are read from disk when the tensors are touched.
+    `mmap=False` reads the file eagerly (quantized checkpoints, see load_inference_model).
+    """
+    if path.endswith(".safetensors"):
+        from safetensors.torch import load_file
+        return load_file(path, device="cpu")
+    # weights_only: чекпоинт модели - только тензоры, без произвольного pickle
+    return torch.load(path, map_location="cpu", mmap=mmap, weights_only=True)
+
+
+def _materialize_meta_buffers(model: nn.Module) -> None:
+    """
+    Non-persistent buffers are not saved in the state dict, so after assign-loading into a model
+    built on the meta device they are still empty. For RoBERTa-family encoders these are
+    position_ids (arange) and token_type_ids (zeros); they are recreated on CPU.
+
+    Raises:
+        RuntimeError: For a meta buffer that cannot be recreated.
+    """
+    for module in model.modules():
+        for name, buffer in list(module.named_buffers(recurse=False)):
+            if not buffer.is_meta:
+                continue
+            if name == "position_ids":
+                value = torch.arange(buffer.shape[-1], dtype=buffer.dtype).expand(buffer.shape)
+            elif name == "token_type_ids":
+                value = torch.zeros(buffer.shape, dtype=buffer.dtype)
+            else:
+                raise RuntimeError(f"Cannot materialize buffer '{name}' of {type(module).__name__} "
+                                   "after loading onto the meta device.")
+            module.register_buffer(name, value, persistent=False)
+
+
+def build_model_from_checkpoint(model_path: str,
+                                base_model_name: str,
+                                num_labels: int,
+                                num_hidden_layers: Optional[int] = None) -> ContractVulnerabilityClassifier:
+    """
+    Builds the classifier from its config only and loads the fp32 checkpoint into it.
+
+    Модуль создается на meta-устройстве (без выделения памяти и случайной инициализации),
+    затем load_state_dict(assign=True) подставляет тензоры из memory-mapped чекпоинта как есть.
+    Предобученные веса не загружаются и не скачиваются: `base_model_name` может быть локальным
+    каталогом с config.json (см. save_offline_assets), тогда загрузка работает без сети.
+    """
+    state_dict = load_state_dict_file(model_path)
+    with torch.device("meta"):
+        model = ContractVulnerabilityClassifier(base_model_name=base_model_name, num_labels=num_labels,
+                                                num_hidden_layers=num_hidden_layers, pretrained=False)
+    model.load_state_dict(state_dict, assign=True)
+    _materialize_meta_buffers(model)
+    return model
+
+
+def save_offline_assets(base_model_name: str, output_dir: str) -> str:
+    """
+    Saves the encoder config and the tokenizer of `base_model_name` into `output_dir`, so the
+    service can build the model and tokenize with base_model_name=output_dir without the hub.
+
+    Returns:
+        str: `output_dir`.
+    """
+    AutoConfig.from_pretrained(base_model_name).save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(base_model_name).save_pretrained(output_dir)
+    return output_dir
+
+
+def quantize_dynamic_int8(model: nn.Module) -> nn.Module:
+    """
+    Dynamic int8 quantization of every nn.Linear (веса в int8, активации квантуются на лету).
+    Для энкодера BERT-типа это почти все вычисления; эмбеддинги и LayerNorm остаются в fp32.
+    Работает только на CPU.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def trace_model(model: nn.Module, example_length: int = 32) -> torch.jit.ScriptModule:
+    """
+    Traces forward, encode_chunks and classify_embeddings into one TorchScript module, so the API
+    (including the embedding cache path) can use it in place of ContractVulnerabilityClassifier.
+    Batch size and sequence length stay dynamic.
+    """
+    model.eval()
+    input_ids, attention_mask = _example_inputs(length=example_length)
+    with torch.no_grad():
+        embeddings = model.encode_chunks(input_ids, attention_mask)
+        # strict=False: энкодер HF внутри возвращает словарь
+        return torch.jit.trace_module(model, {
+            "forward": (input_ids, attention_mask),
+            "encode_chunks": (input_ids, attention_mask),
+            "classify_embeddings": (embeddings,),
+        }, strict=False)
+
+
+def export_model(model: ContractVulnerabilityClassifier, model_path: str, variant: str) -> str:
+    """
+    Builds `variant` from the fp32 `model` and saves it at variant_path(model_path, variant).
+
+    Returns:
+        str: Path of the written artifact.
+    """
+    path = variant_path(model_path, variant)
+    if variant == "fp32":
+        torch.save(model.state_dict(), path)
+        return path
+    model = model.cpu().eval()
+    if variant.startswith("int8"):
+        model = quantize_dynamic_int8(model)
+    if variant.endswith("torchscript"):
+        torch.jit.save(trace_model(model), path)
+    else:
+        torch.save(model.state_dict(), path)
+    return path
+
+
+def load_inference_model(model_path: str,
+                         base_model_name: str,
+                         num_labels: int,
+                         variant: str = "fp32",
+                         device: Union[str, torch.device] = "cpu",
+                         compile_model: bool = False,
+                         num_hidden_layers: Optional[int] = None) -> nn.Module:
+    """
+    Loads a model variant for inference (in eval mode). Every variant exposes forward,
+    encode_chunks and classify_embeddings. Pretrained weights are never loaded: the encoder
+    is built from its config and filled from the (memory-mapped) checkpoint.
+
+    Args:
+        model_path (str): Path of the fp32 checkpoint; other variants are looked up next to it.
+        compile_model (bool): Wrap encode_chunks/classify_embeddings in torch.compile (nn.Module variants only).
+        num_hidden_layers (Optional[int]): Encoder depth of a distilled student checkpoint.
+
+    Raises:
+        ValueError: For an unknown variant, int8 on a non-CPU device, or compile_model with TorchScript.
+    """
+    device = torch.device(device)
+    path = variant_path(model_path, variant)
+    if variant.startswith("int8") and device.type != "cpu":
+        raise ValueError("Dynamically quantized int8 variants run on CPU only.")
+
+    if variant.endswith("torchscript"):
+        if compile_model:
+            raise ValueError("torch.compile is not applicable to TorchScript variants.")
+        model = torch.jit.load(path, map_location=device)
+        model.eval()
+        return model
+
+    if variant == "int8":
+        # Квантованные слои нельзя собрать на meta: архитектура на CPU без предобученных весов
+        model = ContractVulnerabilityClassifier(base_model_name=base_model_name, num_labels=num_labels,
+                                                num_hidden_layers=num_hidden_layers, pretrained=False)
+        model = quantize_dynamic_int8(model)  # структура с квантованными слоями под сохраненный state_dict
+        # Упакованные int8-веса (packed params) пересобираются при загрузке и все равно копируются:
+        # mmap им ничего не дает, читаем файл целиком (он вчетверо меньше fp32)
+        model.load_state_dict(load_state_dict_file(path, mmap=False))
+    else:
+        model = build_model_from_checkpoint(path, base_model_name, num_labels, num_hidden_layers)
+    model.to(device)
+    model.eval()
+    if compile_model:
+        # Компилируем методы, которые вызывает API, а не только forward
+        model.encode_chunks = torch.compile(model.encode_chunks, dynamic=True)
+        model.classify_embeddings = torch.compile(model.classify_embeddings, dynamic=True)
+    return model
+
+
+def export_onnx(model: ContractVulnerabilityClassifier, model_path: str, opset_version: int = 17) -> str:
+    """
+    Exports the full classifier (encoder + CLS + linear head) to ONNX at onnx_model_path(model_path).
+    Inputs `input_ids`/`attention_mask` (int64) and output `logits` have dynamic batch and sequence axes.
+
+    Returns:
+        str: Path of the written .onnx file.
+    """
+    path = onnx_model_path(model_path)
+    model = model.cpu().eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            _example_inputs(),
+            path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=opset_version,
+            do_constant_folding=True,
+        )
+    return path
+
+
+def create_onnx_session(onnx_path: str, num_threads: Optional[int] = None):
+    """
+    ONNX Runtime session on the CPU execution provider with all graph optimizations
+    (слияние attention/GELU/LayerNorm и т.п.). Operators run sequentially; `num_threads`
+    caps the intra-op pool so that concurrent workers do not fight over cores.
+
+    Raises:
+        ImportError: If onnxruntime is not installed.
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError("The ONNX Runtime backend requires `pip install onnxruntime`.") from e
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.inter_op_num_threads = 1
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+    return ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def check_onnx_parity(model: ContractVulnerabilityClassifier,
+                      onnx_path: str,
+                      shapes: Sequence[tuple] = ((1, 16), (3, 200), (8, 512)),
+                      atol: float = 1e-4) -> float:
+    """
+    Compares ONNX Runtime logits with the PyTorch model on random inputs of several (batch, length)
+    shapes, with a padded tail in every other row so the attention mask is exercised.
+
+    Returns:
+        float: Max absolute logit difference.
+
+    Raises:
+        RuntimeError: If the difference exceeds `atol` for any shape.
+    """
+    session = create_onnx_session(onnx_path)
+    model = model.cpu().eval()
+    generator = torch.Generator().manual_seed(0)
+    max_diff = 0.0
+    for batch_size, length in shapes:
+        input_ids = torch.randint(3, 1000, (batch_size, length), generator=generator)
+        attention_mask = torch.ones_like(input_ids)
+        attention_mask[1::2, length // 2:] = 0
+        input_ids[attention_mask == 0] = 1  # pad_token_id CodeBERT
+        with torch.no_grad():
+            expected = model(input_ids, attention_mask)
+        actual = torch.from_numpy(session.run(["logits"], {
+            "input_ids": input_ids.numpy(),
+            "attention_mask": attention_mask.numpy(),
+        })[0])
+        diff = float((actual - expected).abs().max())
+        if diff > atol:
+            # Явное исключение, а не assert: проверка не должна исчезать под python -O
+            raise RuntimeError(f"ONNX logits differ by {diff:.2e} (> {atol:.0e}) for shape {(batch_size, length)}")
+        max_diff = max(max_diff, diff)
+    return max_diff
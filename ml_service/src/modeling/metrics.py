@@ -0,0 +1,116 @@
+from typing import Any, Dict, List, Sequence
+
+import torch
+
+from src.modeling.distributed import all_reduce_sum
+
+
+class StreamingMultiLabelMetrics:
+    """
+    Потоковый аккумулятор метрик multi-label классификации с памятью O(num_labels * num_bins).
+
+    На каждом батче на устройстве модели обновляются:
+      * матрицы ошибок (TP/FP/FN) по каждому порогу и метке - из них точно, как в
+        calculate_metrics, считаются micro/macro precision/recall/F1;
+      * число строк, совпавших по всем меткам (exact match);
+      * гистограммы вероятностей положительных и отрицательных примеров по `num_bins`
+        равным корзинам [0, 1] - из них ROC AUC с погрешностью порядка 1/num_bins.
+    Ни один шаг не вызывает .cpu()/.item(), поэтому нет синхронизации с устройством на каждом батче.
+    """
+    def __init__(self,
+                 num_labels: int,
+                 device: torch.device,
+                 thresholds: Sequence[float] = (0.5,),
+                 num_bins: int = 1000):
+        if num_bins <= 0:
+            raise ValueError("num_bins must be positive.")
+        self.num_labels = num_labels
+        self.num_bins = num_bins
+        self.thresholds = list(thresholds)
+        self._threshold_tensor = torch.tensor(self.thresholds, device=device).view(-1, 1, 1)
+        num_thresholds = len(self.thresholds)
+        self.tp = torch.zeros((num_thresholds, num_labels), dtype=torch.long, device=device)
+        self.fp = torch.zeros_like(self.tp)
+        self.fn = torch.zeros_like(self.tp)
+        self.exact_match = torch.zeros(num_thresholds, dtype=torch.long, device=device)
+        self.num_samples = torch.zeros((), dtype=torch.long, device=device)
+        self.pos_hist = torch.zeros((num_labels, num_bins), dtype=torch.long, device=device)
+        self.neg_hist = torch.zeros_like(self.pos_hist)
+        self._label_offsets = torch.arange(num_labels, device=device) * num_bins
+
+    @torch.no_grad()
+    def update(self, probs: torch.Tensor, labels: torch.Tensor) -> None:
+        """
+        Args:
+            probs (torch.Tensor): Probabilities of shape (batch_size, num_labels).
+            labels (torch.Tensor): Binary targets of the same shape (values >= 0.5 count as positive).
+        """
+        probs = probs.detach().float()
+        positive = labels.detach() >= 0.5  # (B, L)
+        predicted = probs.unsqueeze(0) > self._threshold_tensor  # (T, B, L), как preds > threshold в calculate_metrics
+
+        self.tp += (predicted & positive).sum(dim=1)
+        self.fp += (predicted & ~positive).sum(dim=1)
+        self.fn += (~predicted & positive).sum(dim=1)
+        self.exact_match += (predicted == positive).all(dim=2).sum(dim=1)
+        self.num_samples += probs.shape[0]
+
+        bins = (probs * self.num_bins).long().clamp_(0, self.num_bins - 1)
+        flat_bins = (bins + self._label_offsets).flatten()
+        positive_flat = positive.flatten().long()
+        # scatter_add с весами 0/1 вместо булевой индексации: без синхронизации ради nonzero()
+        self.pos_hist.view(-1).scatter_add_(0, flat_bins, positive_flat)
+        self.neg_hist.view(-1).scatter_add_(0, flat_bins, 1 - positive_flat)
+
+    def sync(self) -> None:
+        """Sums the counters across distributed ranks (no-op in a single process)."""
+        for tensor in (self.tp, self.fp, self.fn, self.exact_match, self.num_samples, self.pos_hist, self.neg_hist):
+            all_reduce_sum(tensor)
+
+    def compute(self, threshold: float = 0.5) -> Dict[str, Any]:
+        """Metrics at `threshold` (one of `thresholds`), with the same keys as calculate_metrics."""
+        t = self.thresholds.index(threshold)
+        tp, fp, fn = (counts[t].double().cpu() for counts in (self.tp, self.fp, self.fn))
+
+        def safe_div(num: torch.Tensor, den: torch.Tensor) -> torch.Tensor:
+            # zero_division=0, как в sklearn
+            return torch.where(den > 0, num / den.clamp(min=1), torch.zeros_like(num))
+
+        precision = safe_div(tp, tp + fp)
+        recall = safe_div(tp, tp + fn)
+        f1 = safe_div(2 * tp, 2 * tp + fp + fn)
+        tp_sum, fp_sum, fn_sum = tp.sum(), fp.sum(), fn.sum()
+        num_samples = int(self.num_samples)
+
+        return {
+            "accuracy_exact_match": int(self.exact_match[t]) / num_samples if num_samples else 0.0,
+            "f1_micro": float(safe_div(2 * tp_sum, 2 * tp_sum + fp_sum + fn_sum)),
+            "precision_micro": float(safe_div(tp_sum, tp_sum + fp_sum)),
+            "recall_micro": float(safe_div(tp_sum, tp_sum + fn_sum)),
+            "f1_macro": float(f1.mean()),
+            "precision_macro": float(precision.mean()),
+            "recall_macro": float(recall.mean()),
+            "roc_auc_macro": self.roc_auc_macro(),
+        }
+
+    def f1_per_label(self, threshold: float = 0.5) -> List[float]:
+        """F1 of every label at `threshold` (zero_division=0)."""
+        t = self.thresholds.index(threshold)
+        tp, fp, fn = (counts[t].double().cpu() for counts in (self.tp, self.fp, self.fn))
+        den = 2 * tp + fp + fn
+        return torch.where(den > 0, 2 * tp / den.clamp(min=1), torch.zeros_like(tp)).tolist()
+
+    def roc_auc_macro(self) -> float:
+        """
+        Mean over labels that have both classes of the histogram ROC AUC:
+        P(score_pos > score_neg) + 0.5 * P(same bin). 0.0 if no label qualifies, as in calculate_metrics.
+        """
+        pos = self.pos_hist.double().cpu()
+        neg = self.neg_hist.double().cpu()
+        num_pos, num_neg = pos.sum(dim=1), neg.sum(dim=1)
+        neg_below = torch.cumsum(neg, dim=1) - neg  # отрицательные примеры в корзинах строго ниже
+        auc = (pos * (neg_below + 0.5 * neg)).sum(dim=1)
+        valid = (num_pos > 0) & (num_neg > 0)
+        if not bool(valid.any()):
+            return 0.0
+        return float((auc[valid] / (num_pos[valid] * num_neg[valid])).mean())
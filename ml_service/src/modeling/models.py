@@ -1,24 +1,48 @@
 import torch
 import torch.nn as nn
 from transformers import AutoModel, AutoConfig
+from typing import List, Optional
 
 from config import main_config # Для доступа к MODEL_CHUNK_SIZE, если нужно
 
+_POOLER_PREFIX = "base_model.pooler."
+
+
+def _drop_pooler_weights(module, state_dict, prefix, *args) -> None:
+    for key in [key for key in state_dict if key.startswith(prefix + _POOLER_PREFIX)]:
+        del state_dict[key]
+
+
 class ContractVulnerabilityClassifier(nn.Module):
     def __init__(self, 
                  base_model_name: str = "microsoft/codebert-base", 
                  num_labels: int = 7, # Количество типов уязвимостей
-                 dropout_rate: float = 0.1):
+                 dropout_rate: float = 0.1,
+                 num_hidden_layers: Optional[int] = None, # Усечение энкодера до первых N слоев (студент)
+                 pretrained: bool = True): # False - только архитектура из конфига, веса придут из чекпоинта
         super().__init__()
         
+        self.base_model_name = base_model_name
         self.num_labels = num_labels
         
         # Загружаем конфигурацию предобученной модели, чтобы получить размер скрытого состояния
-        config = AutoConfig.from_pretrained(base_model_name)
+        # (base_model_name может быть локальным каталогом с config.json - без обращения к хабу)
+        config_overrides = {"num_hidden_layers": num_hidden_layers} if num_hidden_layers is not None else {}
+        config = AutoConfig.from_pretrained(base_model_name, **config_overrides)
         
         # Загружаем предобученную модель (без классификационной "головы")
         # Мы будем использовать ее для получения эмбеддингов чанков
-        self.base_model = AutoModel.from_pretrained(base_model_name)
+        # При усечении загружаются веса только первых num_hidden_layers слоев
+        # Без pretrained веса не читаются вовсе: при загрузке чекпоинта их все равно перезапишет load_state_dict
+        # Пулер не строим: forward берет CLS из last_hidden_state, а параметры без градиента
+        # ломают DDP (редукция ждет градиенты всех параметров) и лишь раздувают чекпоинты
+        if pretrained:
+            self.base_model = AutoModel.from_pretrained(base_model_name, config=config, add_pooling_layer=False)
+        else:
+            self.base_model = AutoModel.from_config(config, add_pooling_layer=False)
+        # Чекпоинты, сохраненные до отказа от пулера, содержат его веса - отбрасываем их при загрузке
+        self.register_load_state_dict_pre_hook(_drop_pooler_weights)
+        self.num_hidden_layers = config.num_hidden_layers
         
         # Размер выхода предобученной модели (размер эмбеддинга CLS токена)
         self.hidden_size = config.hidden_size 
@@ -31,17 +55,19 @@ class ContractVulnerabilityClassifier(nn.Module):
         self.classifier = nn.Linear(self.hidden_size, num_labels)
         
         print(f"Model initialized with base: {base_model_name}")
-        print(f"Hidden size: {self.hidden_size}")
+        print(f"Hidden size: {self.hidden_size}, layers: {self.num_hidden_layers}")
         print(f"Number of labels: {num_labels}")
 
-    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    def encode_chunks(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
         """
+        Runs the base encoder and returns the CLS representation of every chunk.
+
         Args:
             input_ids (torch.Tensor): Tensor of shape (batch_size, chunk_size)
             attention_mask (torch.Tensor): Tensor of shape (batch_size, chunk_size)
-        
+
         Returns:
-            torch.Tensor: Logits for each label, shape (batch_size, num_labels)
+            torch.Tensor: CLS embeddings, shape (batch_size, hidden_size)
         """
         # Получаем выходы от базовой модели
         # outputs.last_hidden_state будет иметь размерность (batch_size, chunk_size, hidden_size)
@@ -56,16 +82,116 @@ class ContractVulnerabilityClassifier(nn.Module):
         
         # Используем представление CLS токена (первый токен в последовательности)
         # Его размерность (batch_size, hidden_size)
-        cls_representation = outputs.last_hidden_state[:, 0, :] 
         # Альтернатива: outputs.pooler_output, но для RoBERTa-based моделей CLS из last_hidden_state часто лучше.
-        
+        return outputs.last_hidden_state[:, 0, :]
+
+    def classify_embeddings(self, cls_representation: torch.Tensor) -> torch.Tensor:
+        """
+        Applies the classification head to CLS embeddings produced by `encode_chunks`.
+
+        Args:
+            cls_representation (torch.Tensor): Tensor of shape (batch_size, hidden_size)
+
+        Returns:
+            torch.Tensor: Logits for each label, shape (batch_size, num_labels)
+        """
         # Применяем Dropout
         pooled_output = self.dropout(cls_representation)
         
         # Подаем на классификатор
-        logits = self.classifier(pooled_output)
+        return self.classifier(pooled_output)
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            input_ids (torch.Tensor): Tensor of shape (batch_size, chunk_size)
+            attention_mask (torch.Tensor): Tensor of shape (batch_size, chunk_size)
         
-        return logits
+        Returns:
+            torch.Tensor: Logits for each label, shape (batch_size, num_labels)
+        """
+        return self.classify_embeddings(self.encode_chunks(input_ids, attention_mask))
+
+def _student_layer_map(teacher_layers: int, student_layers: int) -> List[int]:
+    """Teacher layers copied into the student: evenly spaced, always ending with the last one (12 -> 6: 1, 3, ..., 11)."""
+    return [round((i + 1) * teacher_layers / student_layers) - 1 for i in range(student_layers)]
+
+
+def create_student(teacher: ContractVulnerabilityClassifier,
+                   num_hidden_layers: int = 6,
+                   base_model_name: Optional[str] = None) -> ContractVulnerabilityClassifier:
+    """
+    Builds a smaller student for distillation from `teacher`.
+
+    Без `base_model_name` студент - та же архитектура, усеченная до `num_hidden_layers` слоев:
+    эмбеддинги, равномерно выбранные слои энкодера и классификатор копируются из учителя.
+    С `base_model_name` студент - другая (меньшая) модель RoBERTa-семейства с головой с нуля;
+    словарь должен совпадать с учительским, потому что чанки токенизируются один раз.
+
+    Raises:
+        ValueError: If the student has more layers than the teacher or a different vocabulary.
+    """
+    if base_model_name is not None and base_model_name != teacher.base_model_name:
+        student = ContractVulnerabilityClassifier(base_model_name=base_model_name, num_labels=teacher.num_labels)
+        if student.base_model.config.vocab_size != teacher.base_model.config.vocab_size:
+            raise ValueError(f"Student '{base_model_name}' uses a different vocabulary than the teacher; "
+                             "the chunked datasets and the API tokenizer would not match it.")
+        return student
+
+    if num_hidden_layers > teacher.num_hidden_layers:
+        raise ValueError(f"Student layers ({num_hidden_layers}) exceed teacher layers ({teacher.num_hidden_layers}).")
+    student = ContractVulnerabilityClassifier(
+        base_model_name=teacher.base_model_name,
+        num_labels=teacher.num_labels,
+        dropout_rate=teacher.dropout.p,
+        num_hidden_layers=num_hidden_layers
+    )
+    student.base_model.embeddings.load_state_dict(teacher.base_model.embeddings.state_dict())
+    for student_idx, teacher_idx in enumerate(_student_layer_map(teacher.num_hidden_layers, num_hidden_layers)):
+        student.base_model.encoder.layer[student_idx].load_state_dict(
+            teacher.base_model.encoder.layer[teacher_idx].state_dict()
+        )
+    student.classifier.load_state_dict(teacher.classifier.state_dict())
+    return student
+
+
+class AttentionPoolingHead(nn.Module):
+    """
+    Легкая голова уровня контракта: attention pooling по CLS-эмбеддингам его чанков
+    и линейный классификатор. Энкодер не дообучается - голова учится на готовых эмбеддингах
+    (см. trainer.fit_attention_pooling_head).
+    """
+    def __init__(self, hidden_size: int, num_labels: int, dropout_rate: float = 0.1):
+        super().__init__()
+        self.num_labels = num_labels
+        self.attention = nn.Linear(hidden_size, 1)
+        self.dropout = nn.Dropout(dropout_rate)
+        self.classifier = nn.Linear(hidden_size, num_labels)
+
+    @classmethod
+    def from_classifier(cls, model: ContractVulnerabilityClassifier) -> "AttentionPoolingHead":
+        """Head whose classifier starts from the chunk classifier's weights (uniform attention = mean pooling)."""
+        head = cls(model.hidden_size, model.num_labels, dropout_rate=model.dropout.p)
+        head.classifier.load_state_dict(model.classifier.state_dict())
+        nn.init.zeros_(head.attention.weight)
+        nn.init.zeros_(head.attention.bias)
+        return head
+
+    def forward(self, chunk_embeddings: torch.Tensor, chunk_mask: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            chunk_embeddings (torch.Tensor): Padded chunk embeddings, shape (num_contracts, max_chunks, hidden_size)
+            chunk_mask (torch.Tensor): True for real chunks, shape (num_contracts, max_chunks)
+
+        Returns:
+            torch.Tensor: Contract logits, shape (num_contracts, num_labels)
+        """
+        scores = self.attention(chunk_embeddings).squeeze(-1)
+        scores = scores.masked_fill(~chunk_mask, float("-inf"))
+        # У контракта без чанков все веса -inf -> NaN после softmax; такой контракт получает нулевой вектор
+        weights = torch.softmax(scores, dim=1).nan_to_num(0.0)
+        pooled = torch.bmm(weights.unsqueeze(1), chunk_embeddings).squeeze(1)
+        return self.classifier(self.dropout(pooled))
 
 if __name__ == '__main__':
     # Пример использования и тестирования модели
@@ -1,23 +1,74 @@
 import torch
 import torch.nn as nn
 from torch.optim import AdamW
+from torch.nn.parallel import DistributedDataParallel as DDP
 from torch.utils.data import DataLoader
 from sklearn.metrics import precision_recall_fscore_support, accuracy_score, roc_auc_score
 import numpy as np
 from tqdm.auto import tqdm # Для красивых progress bar
 import mlflow
 import mlflow.pytorch # Для автоматического логирования моделей PyTorch
+import contextlib
+import math
 import os
-from typing import Dict, List, Tuple, Any
+from transformers import get_scheduler
+from typing import Callable, Dict, List, Optional, Tuple, Any
 
 from config import main_config
-from src.modeling.models import ContractVulnerabilityClassifier # Наша модель
+from src.modeling.models import AttentionPoolingHead, ContractVulnerabilityClassifier # Наша модель
+from src.modeling.distributed import all_reduce_sum, barrier, is_distributed, is_main_process
+from src.modeling.metrics import StreamingMultiLabelMetrics
+from src.modeling.aggregation import ContractScoreAccumulator, pad_contract_chunks
+from src.modeling.checkpointing import (
+    CheckpointManager,
+    capture_rng_state,
+    latest_checkpoint,
+    load_checkpoint,
+    restore_rng_state,
+)
 # dataset.py нам здесь напрямую не нужен, так как DataLoader будет передан в train_model
 
 # Определение устройства (GPU или CPU)
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print(f"Using device: {DEVICE}")
 
+# Режимы точности для autocast (None - обычный fp32)
+PRECISION_DTYPES = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+def get_dataloader_batch_size(dataloader: DataLoader) -> int:
+    """batch_size DataLoader'а, в том числе когда батчи собирает batch_sampler/sampler (create_chunk_dataloader)."""
+    if dataloader.batch_size is not None:
+        return dataloader.batch_size
+    sampler = dataloader.batch_sampler or dataloader.sampler
+    return getattr(sampler, "batch_size", None)
+
+def set_sampler_epoch(dataloader: DataLoader, epoch: int) -> None:
+    """Передает номер эпохи сэмплеру (LengthBucketBatchSampler, DistributedSampler), чтобы перемешивание менялось."""
+    for sampler in (dataloader.batch_sampler, dataloader.sampler):
+        # DistributedSampler обычно обернут в BatchSampler
+        for candidate in (sampler, getattr(sampler, "sampler", None)):
+            if hasattr(candidate, "set_epoch"):
+                candidate.set_epoch(epoch)
+
+def iterate_from_batch(dataloader: DataLoader, start_batch: int = 0):
+    """
+    Итератор по DataLoader, начинающийся с батча `start_batch`.
+    Сэмплеры с set_start_batch (LengthBucketBatchSampler) пропускают батчи без чтения данных,
+    для остальных пропущенные батчи загружаются и отбрасываются.
+    """
+    sampler = dataloader.batch_sampler or dataloader.sampler
+    if start_batch and hasattr(sampler, "set_start_batch"):
+        sampler.set_start_batch(start_batch)
+        return iter(dataloader)
+    iterator = iter(dataloader)
+    for _ in range(start_batch):
+        next(iterator)
+    return iterator
+
+def padding_waste_pct(real_tokens: int, padded_tokens: int) -> float:
+    """Доля позиций-паддинга среди всех позиций, прошедших через модель, в процентах."""
+    return 100.0 * (1.0 - real_tokens / padded_tokens) if padded_tokens else 0.0
+
 def calculate_metrics(preds: np.ndarray, labels: np.ndarray, threshold: float = 0.5) -> Dict[str, Any]:
     """
     Рассчитывает метрики для multi-label классификации.
@@ -80,6 +131,77 @@ def calculate_metrics(preds: np.ndarray, labels: np.ndarray, threshold: float =
         
     return metrics
 
+def autocast_context(device: torch.device, precision: str = "fp32"):
+    """
+    Контекст autocast для выбранной точности: "fp32" (без autocast), "bf16" (CPU и CUDA),
+    "fp16" (только CUDA, вместе с GradScaler).
+    """
+    if precision not in PRECISION_DTYPES:
+        raise ValueError(f"Unknown precision: {precision}. Use one of {list(PRECISION_DTYPES)}.")
+    dtype = PRECISION_DTYPES[precision]
+    if dtype is None:
+        return contextlib.nullcontext()
+    if dtype == torch.float16 and device.type != "cuda":
+        raise ValueError("fp16 autocast is only supported on CUDA; use bf16 on CPU.")
+    return torch.autocast(device_type=device.type, dtype=dtype)
+
+class DistillationLoss(nn.Module):
+    """
+    Loss студента при дистилляции: BCE к мягким меткам учителя (его sigmoid-вероятностям)
+    плюс обычная BCE к истинным меткам, в пропорции `alpha` : (1 - `alpha`).
+    `temperature` > 1 сглаживает вероятности учителя; мягкая часть умножается на T^2,
+    чтобы масштаб ее градиентов не зависел от температуры.
+    """
+    def __init__(self, alpha: float = 0.5, temperature: float = 1.0):
+        super().__init__()
+        if not 0.0 <= alpha <= 1.0:
+            raise ValueError("alpha must be in [0, 1].")
+        if temperature <= 0:
+            raise ValueError("temperature must be positive.")
+        self.alpha = alpha
+        self.temperature = temperature
+        self.bce = nn.BCEWithLogitsLoss()
+
+    def forward(self, student_logits: torch.Tensor, labels: torch.Tensor, teacher_logits: torch.Tensor) -> torch.Tensor:
+        soft_targets = torch.sigmoid(teacher_logits / self.temperature)
+        soft_loss = self.bce(student_logits / self.temperature, soft_targets) * self.temperature ** 2
+        hard_loss = self.bce(student_logits, labels)
+        return self.alpha * soft_loss + (1.0 - self.alpha) * hard_loss
+
+def _teacher_logits(
+    teacher: nn.Module,
+    input_ids: torch.Tensor,
+    attention_mask: torch.Tensor,
+    device: torch.device,
+    precision: str
+) -> torch.Tensor:
+    with torch.no_grad(), autocast_context(device, precision):
+        return teacher(input_ids, attention_mask).float()
+
+def _aggregate_epoch(
+    loss_sum: torch.Tensor,
+    num_batches: int,
+    metrics: StreamingMultiLabelMetrics,
+    real_tokens: int,
+    padded_tokens: int
+) -> Tuple[float, Dict[str, Any]]:
+    """
+    Сводит результаты эпохи в средний loss и метрики. Под DDP суммы и счетчики метрик all-reduce'ятся,
+    так что метрики на всех рангах одинаковые. Это единственная синхронизация с устройством за эпоху.
+    """
+    totals = torch.tensor([loss_sum.item(), num_batches, real_tokens, padded_tokens], dtype=torch.float64)
+    total_loss, num_batches, real_tokens, padded_tokens = all_reduce_sum(totals).tolist()
+    metrics.sync()
+
+    avg_loss = total_loss / num_batches
+    epoch_metrics = metrics.compute()
+    epoch_metrics["padding_waste_pct"] = padding_waste_pct(real_tokens, padded_tokens)
+    return avg_loss, epoch_metrics
+
+def _create_metrics(model: nn.Module, device: torch.device) -> StreamingMultiLabelMetrics:
+    # num_labels берем у модели, а не у первого батча: под DDP ранг без батчей тоже участвует в sync()
+    return StreamingMultiLabelMetrics(getattr(model, "module", model).num_labels, device)
+
 def train_epoch(
     model: ContractVulnerabilityClassifier,
     dataloader: DataLoader,
@@ -87,49 +209,123 @@ def train_epoch(
     criterion: nn.Module,
     device: torch.device,
     epoch_num: int,
-    num_epochs: int
+    num_epochs: int,
+    scheduler: Optional[torch.optim.lr_scheduler.LRScheduler] = None,
+    precision: str = "fp32",
+    grad_accum_steps: int = 1,
+    max_grad_norm: Optional[float] = None,
+    scaler: Optional[torch.amp.GradScaler] = None,
+    start_batch: int = 0,
+    resume_rng_state: Optional[Dict[str, Any]] = None,
+    on_optimizer_step: Optional[Callable[[int], None]] = None,
+    teacher: Optional[nn.Module] = None
 ) -> Tuple[float, Dict[str, Any]]:
-    """Проводит одну эпоху обучения."""
+    """
+    Проводит одну эпоху обучения.
+
+    Градиенты накапливаются по `grad_accum_steps` микро-батчам (loss делится на их число),
+    затем выполняются клиппинг по норме, шаг оптимизатора и шаг планировщика LR.
+    Последняя группа эпохи может быть неполной - шаг делается и по ней.
+
+    При возобновлении эпоха начинается с батча `start_batch` (он всегда на границе шага
+    оптимизатора), а после создания итератора восстанавливается `resume_rng_state`.
+    Loss и метрики такой эпохи считаются только по пройденным после возобновления батчам.
+    `on_optimizer_step` вызывается после каждого шага оптимизатора с числом батчей, пройденных в эпохе.
+
+    Loss и метрики копятся на устройстве (см. StreamingMultiLabelMetrics), предсказания эпохи
+    в памяти не хранятся.
+
+    С `teacher` (дистилляция) `criterion` вызывается как criterion(logits, labels, teacher_logits),
+    см. DistillationLoss; учитель работает в режиме eval и без градиентов.
+    """
     model.train()  # Переводим модель в режим обучения
-    total_loss = 0.0
-    all_preds = []
-    all_labels = []
+    loss_sum = torch.zeros((), device=device)
+    metrics = _create_metrics(model, device)
+    real_tokens, padded_tokens = 0, 0
+    num_batches = len(dataloader)
     
-    progress_bar = tqdm(dataloader, desc=f"Epoch {epoch_num+1}/{num_epochs} [Training]", leave=False)
+    # Итератор создается до восстановления текущего RNG: порядок батчей (и сиды воркеров)
+    # определяется состоянием генераторов на начало эпохи
+    iterator = iterate_from_batch(dataloader, start_batch)
+    if resume_rng_state is not None:
+        restore_rng_state(resume_rng_state)
+    progress_bar = tqdm(iterator, total=num_batches, initial=start_batch,
+                        desc=f"Epoch {epoch_num+1}/{num_epochs} [Training]", leave=False,
+                        disable=not is_main_process())
     
-    for batch_idx, batch in enumerate(progress_bar):
-        input_ids = batch['input_ids'].to(device)
-        attention_mask = batch['attention_mask'].to(device)
-        labels = batch['labels'].to(device)
-        
-        optimizer.zero_grad()  # Обнуляем градиенты
-        
-        logits = model(input_ids, attention_mask)  # Прямой проход
-        loss = criterion(logits, labels)  # Рассчитываем потери
+    optimizer.zero_grad()  # Обнуляем градиенты
+    for batch_idx, batch in enumerate(progress_bar, start=start_batch):
+        # Считаем на CPU до переноса, чтобы не синхронизироваться с GPU на каждом батче
+        real_tokens += int(batch['attention_mask'].sum())
+        padded_tokens += batch['attention_mask'].numel()
+        input_ids = batch['input_ids'].to(device, non_blocking=True)
+        attention_mask = batch['attention_mask'].to(device, non_blocking=True)
+        labels = batch['labels'].to(device, non_blocking=True)
+        is_step = (batch_idx + 1) % grad_accum_steps == 0 or batch_idx + 1 == num_batches
+        # Под DDP градиенты промежуточных микро-батчей не синхронизируем: all-reduce один раз на шаг
+        sync_context = model.no_sync() if isinstance(model, DDP) and not is_step else contextlib.nullcontext()
         
-        loss.backward()  # Обратный проход (вычисление градиентов)
-        optimizer.step()  # Обновляем веса модели
-        
-        total_loss += loss.item()
+        with sync_context:
+            with autocast_context(device, precision):
+                logits = model(input_ids, attention_mask)  # Прямой проход
+            logits = logits.float()  # loss и метрики считаем в fp32
+            if teacher is not None:
+                teacher_logits = _teacher_logits(teacher, input_ids, attention_mask, device, precision)
+                loss = criterion(logits, labels, teacher_logits)
+            else:
+                loss = criterion(logits, labels)  # Рассчитываем потери
+            
+            # Обратный проход (вычисление градиентов), градиенты копятся до шага оптимизатора
+            scaled_loss = loss / grad_accum_steps
+            if scaler is not None:
+                scaler.scale(scaled_loss).backward()
+            else:
+                scaled_loss.backward()
+
+        if is_step:
+            if scaler is not None:
+                scaler.unscale_(optimizer)  # клиппинг по настоящим, а не масштабированным градиентам
+            if max_grad_norm is not None:
+                torch.nn.utils.clip_grad_norm_(model.parameters(), max_grad_norm)
+            if scaler is not None:
+                scaler.step(optimizer)
+                scaler.update()
+            else:
+                optimizer.step()  # Обновляем веса модели
+            if scheduler is not None:
+                scheduler.step()
+            optimizer.zero_grad()
+            if on_optimizer_step is not None:
+                on_optimizer_step(batch_idx + 1)
         
-        # Сохраняем предсказания и метки для расчета метрик в конце эпохи
-        # Переводим на CPU и в NumPy для sklearn.metrics
-        # Используем sigmoid для получения вероятностей из логитов
-        all_preds.append(torch.sigmoid(logits).detach().cpu().numpy())
-        all_labels.append(labels.detach().cpu().numpy())
+        # Копим loss и счетчики метрик на устройстве, без .item()/.cpu() на каждом батче
+        loss_sum += loss.detach()
+        metrics.update(torch.sigmoid(logits), labels)
 
-        if batch_idx % 50 == 0: # Логируем промежуточный loss
+        if batch_idx % 50 == 0: # Логируем промежуточный loss (единственная синхронизация внутри эпохи)
              progress_bar.set_postfix({'loss': f'{loss.item():.4f}'})
              
-    avg_loss = total_loss / len(dataloader)
-    
-    # Объединяем предсказания и метки со всех батчей
-    all_preds = np.concatenate(all_preds, axis=0)
-    all_labels = np.concatenate(all_labels, axis=0)
-    
-    epoch_metrics = calculate_metrics(all_preds, all_labels)
-    
-    return avg_loss, epoch_metrics
+    if num_batches == start_batch:  # Возобновились после последнего шага эпохи - обучать нечего
+        return 0.0, {}
+    return _aggregate_epoch(loss_sum, num_batches - start_batch, metrics, real_tokens, padded_tokens)
+
+def _label_names(num_labels: int) -> List[str]:
+    columns = main_config.VULNERABILITY_COUNT_COLUMNS
+    return [column.lower() for column in columns] if len(columns) == num_labels else [str(i) for i in range(num_labels)]
+
+def _num_contracts(dataloader: DataLoader) -> Optional[int]:
+    """Number of contracts behind a chunk dataset (max original_index + 1), None if indices are unknown."""
+    original_indices = getattr(dataloader.dataset, "original_indices", None)
+    if original_indices is None or len(original_indices) == 0:
+        return None
+    return int(original_indices.max()) + 1
+
+def _contract_metrics(contracts: ContractScoreAccumulator, threshold: float) -> Dict[str, Any]:
+    """Метрики по контрактам (префикс contract_), встретившимся хотя бы в одном батче."""
+    scores, labels, seen = contracts.compute()
+    metrics = StreamingMultiLabelMetrics(labels.shape[1], labels.device, thresholds=(threshold,))
+    metrics.update(scores[seen], labels[seen])
+    return {f"contract_{name}": value for name, value in metrics.compute(threshold).items()}
 
 def evaluate_epoch(
     model: ContractVulnerabilityClassifier,
@@ -137,37 +333,201 @@ def evaluate_epoch(
     criterion: nn.Module,
     device: torch.device,
     epoch_num: int, # Для логирования, если нужно
-    num_epochs: int
+    num_epochs: int,
+    precision: str = "fp32",
+    contract_aggregation: Optional[str] = main_config.CHUNK_AGGREGATION,
+    contract_top_k: int = main_config.CHUNK_AGGREGATION_TOP_K,
+    teacher: Optional[nn.Module] = None,
+    per_label_metrics: bool = False
 ) -> Tuple[float, Dict[str, Any]]:
-    """Проводит одну эпоху оценки (валидации/тестирования)."""
+    """
+    Проводит одну эпоху оценки (валидации/тестирования).
+
+    Кроме метрик по чанкам, если в батчах есть `original_index`, вероятности чанков сводятся
+    в оценки контрактов правилом `contract_aggregation` (тем же кодом, что и в API) и
+    добавляются метрики с префиксом contract_ - именно их видит пользователь сервиса.
+    `contract_aggregation=None` отключает метрики по контрактам.
+
+    С `teacher` loss считается как при дистилляции, и добавляется teacher_agreement - доля пар
+    (чанк, метка), где бинарные предсказания студента и учителя совпадают.
+    `per_label_metrics` добавляет F1 каждой метки (f1_<имя колонки>).
+    """
     model.eval()  # Переводим модель в режим оценки
-    total_loss = 0.0
-    all_preds = []
-    all_labels = []
+    loss_sum = torch.zeros((), device=device)
+    metrics = _create_metrics(model, device)
+    num_contracts = _num_contracts(dataloader) if contract_aggregation else None
+    contracts = ContractScoreAccumulator(
+        num_contracts, metrics.num_labels, method=contract_aggregation, top_k=contract_top_k, device=device
+    ) if num_contracts is not None else None
+    agreement = torch.zeros(2, device=device)  # (совпавшие пары, все пары)
+    real_tokens, padded_tokens = 0, 0
     
-    progress_bar = tqdm(dataloader, desc=f"Epoch {epoch_num+1}/{num_epochs} [Evaluating]", leave=False)
+    progress_bar = tqdm(dataloader, desc=f"Epoch {epoch_num+1}/{num_epochs} [Evaluating]", leave=False,
+                        disable=not is_main_process())
     
     with torch.no_grad():  # Отключаем вычисление градиентов
         for batch in progress_bar:
-            input_ids = batch['input_ids'].to(device)
-            attention_mask = batch['attention_mask'].to(device)
-            labels = batch['labels'].to(device)
+            real_tokens += int(batch['attention_mask'].sum())
+            padded_tokens += batch['attention_mask'].numel()
+            input_ids = batch['input_ids'].to(device, non_blocking=True)
+            attention_mask = batch['attention_mask'].to(device, non_blocking=True)
+            labels = batch['labels'].to(device, non_blocking=True)
             
-            logits = model(input_ids, attention_mask)
-            loss = criterion(logits, labels)
+            with autocast_context(device, precision):
+                logits = model(input_ids, attention_mask)
+            logits = logits.float()
+            probs = torch.sigmoid(logits)
+            if teacher is not None:
+                teacher_logits = _teacher_logits(teacher, input_ids, attention_mask, device, precision)
+                loss = criterion(logits, labels, teacher_logits)
+                agreement[0] += ((probs > 0.5) == (teacher_logits > 0.0)).sum()
+                agreement[1] += probs.numel()
+            else:
+                loss = criterion(logits, labels)
             
-            total_loss += loss.item()
-            all_preds.append(torch.sigmoid(logits).cpu().numpy())
-            all_labels.append(labels.cpu().numpy())
+            loss_sum += loss
+            metrics.update(probs, labels)
+            if contracts is not None:
+                contracts.update(probs, batch['original_index'], labels)
             
-    avg_loss = total_loss / len(dataloader)
-    all_preds = np.concatenate(all_preds, axis=0)
-    all_labels = np.concatenate(all_labels, axis=0)
-    
-    epoch_metrics = calculate_metrics(all_preds, all_labels)
-    
+    avg_loss, epoch_metrics = _aggregate_epoch(loss_sum, len(dataloader), metrics, real_tokens, padded_tokens)
+    if teacher is not None:
+        agreed, total = all_reduce_sum(agreement.double().cpu()).tolist()
+        epoch_metrics["teacher_agreement"] = agreed / total if total else 0.0
+    if per_label_metrics:
+        label_names = _label_names(metrics.num_labels)
+        for name, f1 in zip(label_names, metrics.f1_per_label()):
+            epoch_metrics[f"f1_{name}"] = f1
+    if contracts is not None:
+        contracts.sync()
+        epoch_metrics.update(_contract_metrics(contracts, main_config.CONTRACT_THRESHOLD))
     return avg_loss, epoch_metrics
 
+def collect_chunk_embeddings(
+    model: ContractVulnerabilityClassifier,
+    dataloader: DataLoader,
+    device: torch.device,
+    precision: str = "fp32"
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Прогоняет замороженный энкодер по всем чанкам. Возвращает на CPU CLS-эмбеддинги
+    (num_chunks, hidden_size), original_index (num_chunks,) и метки (num_chunks, num_labels).
+    """
+    model.eval()
+    embeddings, contract_index, labels = [], [], []
+    with torch.no_grad():
+        for batch in tqdm(dataloader, desc="Encoding chunks", leave=False):
+            input_ids = batch['input_ids'].to(device, non_blocking=True)
+            attention_mask = batch['attention_mask'].to(device, non_blocking=True)
+            with autocast_context(device, precision):
+                cls_embeddings = model.encode_chunks(input_ids, attention_mask)
+            embeddings.append(cls_embeddings.float().cpu())
+            contract_index.append(torch.as_tensor(batch['original_index'], dtype=torch.long))
+            labels.append(batch['labels'].float())
+    return torch.cat(embeddings), torch.cat(contract_index), torch.cat(labels)
+
+def _contract_inputs(
+    model: ContractVulnerabilityClassifier,
+    dataloader: DataLoader,
+    device: torch.device,
+    precision: str
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Padded chunk embeddings, chunk mask and labels of every contract that has chunks."""
+    embeddings, contract_index, labels = collect_chunk_embeddings(model, dataloader, device, precision)
+    num_contracts = int(contract_index.max()) + 1
+    padded, mask = pad_contract_chunks(embeddings, contract_index, num_contracts)
+    contract_labels = torch.zeros((num_contracts, labels.shape[1])).index_copy_(0, contract_index, labels)
+    seen = mask.any(dim=1)
+    return padded[seen], mask[seen], contract_labels[seen]
+
+def evaluate_attention_pooling_head(
+    head: AttentionPoolingHead,
+    padded: torch.Tensor,
+    mask: torch.Tensor,
+    labels: torch.Tensor,
+    device: torch.device,
+    batch_size: int = 64
+) -> Dict[str, Any]:
+    """Contract-level metrics of the head (same keys as evaluate_epoch's contract_* metrics)."""
+    head.eval()
+    metrics = StreamingMultiLabelMetrics(head.num_labels, device, thresholds=(main_config.CONTRACT_THRESHOLD,))
+    with torch.no_grad():
+        for start in range(0, len(padded), batch_size):
+            logits = head(padded[start:start + batch_size].to(device), mask[start:start + batch_size].to(device))
+            metrics.update(torch.sigmoid(logits), labels[start:start + batch_size].to(device))
+    return {f"contract_{name}": value for name, value in metrics.compute(main_config.CONTRACT_THRESHOLD).items()}
+
+def fit_attention_pooling_head(
+    model: ContractVulnerabilityClassifier,
+    train_dataloader: DataLoader,
+    val_dataloader: Optional[DataLoader] = None,
+    num_epochs: int = 5,
+    learning_rate: float = 1e-3,
+    batch_size: int = 64,
+    precision: str = "fp32"
+) -> Tuple[AttentionPoolingHead, Dict[str, Any]]:
+    """
+    Обучает AttentionPoolingHead поверх замороженного энкодера `model`.
+
+    Эмбеддинги чанков считаются один раз (в батчах нужен `original_index`), после чего голова
+    учится на уровне контрактов: attention pooling по чанкам контракта и BCE с его метками.
+    Классификатор головы инициализируется весами чанкового, а равномерное внимание в начале
+    соответствует усреднению эмбеддингов. Рассчитано на один процесс (без DDP).
+
+    Returns:
+        Tuple[AttentionPoolingHead, Dict[str, Any]]: The fitted head (in eval mode) and its
+        contract-level validation metrics (empty without `val_dataloader`).
+    """
+    model.to(DEVICE)
+    head = AttentionPoolingHead.from_classifier(model).to(DEVICE)
+    train_padded, train_mask, train_labels = _contract_inputs(model, train_dataloader, DEVICE, precision)
+    print(f"Fitting attention pooling head on {len(train_padded)} contracts "
+          f"(up to {train_padded.shape[1]} chunks each)...")
+
+    optimizer = AdamW(head.parameters(), lr=learning_rate)
+    criterion = nn.BCEWithLogitsLoss()
+    for epoch in range(num_epochs):
+        head.train()
+        loss_sum = torch.zeros((), device=DEVICE)
+        permutation = torch.randperm(len(train_padded))
+        for start in range(0, len(permutation), batch_size):
+            index = permutation[start:start + batch_size]
+            logits = head(train_padded[index].to(DEVICE), train_mask[index].to(DEVICE))
+            loss = criterion(logits, train_labels[index].to(DEVICE))
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            loss_sum += loss.detach() * len(index)
+        print(f"Attention head epoch {epoch + 1}/{num_epochs}: loss {loss_sum.item() / len(permutation):.4f}")
+
+    val_metrics: Dict[str, Any] = {}
+    if val_dataloader is not None:
+        val_metrics = evaluate_attention_pooling_head(head, *_contract_inputs(model, val_dataloader, DEVICE, precision),
+                                                      device=DEVICE, batch_size=batch_size)
+        for metric_name, metric_val in val_metrics.items():
+            print(f"  Validation {metric_name}: {metric_val:.4f}")
+    head.eval()
+    return head, val_metrics
+
+def _log_training_params(
+    model: ContractVulnerabilityClassifier,
+    train_dataloader: DataLoader,
+    val_dataloader: DataLoader,
+    params: Dict[str, Any]
+) -> None:
+    """Логирует гиперпараметры запуска в MLflow (только при старте нового run, не при возобновлении)."""
+    mlflow.log_param("base_model_name", model.base_model.name_or_path if hasattr(model.base_model, 'name_or_path') else "custom")
+    mlflow.log_param("batch_size", get_dataloader_batch_size(train_dataloader))
+    mlflow.log_param("effective_batch_size", (get_dataloader_batch_size(train_dataloader) or 0) * params["grad_accum_steps"])
+    mlflow.log_param("train_dataset_size", len(train_dataloader.dataset))
+    mlflow.log_param("val_dataset_size", len(val_dataloader.dataset))
+    mlflow.log_param("device", str(DEVICE))
+    mlflow.log_params(params)
+    # Логируем параметры чанкинга
+    mlflow.log_param("max_total_tokens", main_config.MAX_TOTAL_TOKENS)
+    mlflow.log_param("model_chunk_size", main_config.MODEL_CHUNK_SIZE)
+    mlflow.log_param("chunk_overlap", main_config.CHUNK_OVERLAP)
+
 def train_model(
     model: ContractVulnerabilityClassifier,
     train_dataloader: DataLoader,
@@ -175,65 +535,208 @@ def train_model(
     num_epochs: int = 10,
     learning_rate: float = 1e-5, # Типичное значение для дообучения трансформеров
     model_save_path: str = None, # Путь для сохранения лучшей модели
-    mlflow_experiment_name: str = main_config.EXPERIMENT_NAME
+    mlflow_experiment_name: str = main_config.EXPERIMENT_NAME,
+    precision: str = "fp32", # "bf16" - autocast на CPU; "fp16" - только CUDA
+    grad_accum_steps: int = 1, # Эффективный батч = batch_size * grad_accum_steps
+    max_grad_norm: Optional[float] = None, # Клиппинг градиентов по норме (None - без клиппинга)
+    lr_scheduler_type: Optional[str] = None, # "linear", "cosine", ... (transformers.get_scheduler); None - постоянный LR
+    warmup_ratio: float = 0.0, # Доля шагов оптимизатора на линейный разогрев LR
+    checkpoint_dir: Optional[str] = None, # Каталог полных чекпоинтов; None - не сохранять
+    checkpoint_every_n_steps: Optional[int] = main_config.CHECKPOINT_EVERY_N_STEPS, # + чекпоинт в конце каждой эпохи
+    keep_last_checkpoints: int = main_config.CHECKPOINT_KEEP_LAST,
+    resume_from: Optional[str] = None, # Путь к чекпоинту или "latest" (последний в checkpoint_dir)
+    teacher: Optional[nn.Module] = None, # Учитель для дистилляции; обучается `model` (студент)
+    distill_alpha: float = 0.5, # Вес мягких меток учителя в loss студента
+    distill_temperature: float = 1.0
 ) -> ContractVulnerabilityClassifier:
-    """Основная функция для обучения модели."""
+    """
+    Основная функция для обучения модели.
+
+    С `resume_from` восстанавливаются веса, оптимизатор, планировщик, GradScaler, лучшая
+    метрика, состояние RNG и позиция сэмплера, а логирование продолжается в тот же MLflow run.
+    Гиперпараметры и DataLoader при возобновлении должны совпадать с исходным запуском.
+
+    Если process group инициализирован (scripts/run_train.py под torchrun), модель
+    оборачивается в DistributedDataParallel; DataLoader'ы должны быть шардированы по рангам
+    (create_chunk_dataloader(num_replicas=..., rank=...)). MLflow, сохранение лучшей модели
+    и чекпоинты - только на ранге 0; метрики эпохи сводятся со всех рангов.
+
+    С `teacher` выполняется дистилляция: `model` учится на DistillationLoss (мягкие метки учителя
+    + истинные метки), а в MLflow дополнительно пишутся teacher_agreement и F1 по каждой метке.
+    """
+    if grad_accum_steps < 1:
+        raise ValueError("grad_accum_steps must be >= 1.")
+
+    resume_state = None
+    if resume_from is not None:
+        resume_path = latest_checkpoint(checkpoint_dir) if resume_from == "latest" else resume_from
+        if resume_path is None:
+            raise FileNotFoundError(f"No checkpoints found in {checkpoint_dir}.")
+        print(f"Resuming from checkpoint: {resume_path}")
+        resume_state = load_checkpoint(str(resume_path))
     
-    mlflow.set_tracking_uri(main_config.MLFLOW_TRACKING_URI)
-    mlflow.set_experiment(mlflow_experiment_name)
+    is_main = is_main_process()
+    run_context = contextlib.nullcontext()
+    if is_main:
+        mlflow.set_tracking_uri(main_config.MLFLOW_TRACKING_URI)
+        mlflow.set_experiment(mlflow_experiment_name)
+        run_context = mlflow.start_run(run_id=resume_state["mlflow_run_id"] if resume_state else None)
     
-    with mlflow.start_run() as run:
-        print(f"MLflow Run ID: {run.info.run_id}")
-        mlflow.log_param("base_model_name", model.base_model.name_or_path if hasattr(model.base_model, 'name_or_path') else "custom")
-        mlflow.log_param("num_epochs", num_epochs)
-        mlflow.log_param("learning_rate", learning_rate)
-        mlflow.log_param("batch_size", train_dataloader.batch_size)
-        mlflow.log_param("train_dataset_size", len(train_dataloader.dataset))
-        mlflow.log_param("val_dataset_size", len(val_dataloader.dataset))
-        mlflow.log_param("device", str(DEVICE))
-        # Логируем параметры чанкинга
-        mlflow.log_param("max_total_tokens", main_config.MAX_TOTAL_TOKENS)
-        mlflow.log_param("model_chunk_size", main_config.MODEL_CHUNK_SIZE)
-        mlflow.log_param("chunk_overlap", main_config.CHUNK_OVERLAP)
+    with run_context as run:
+        if is_main:
+            print(f"MLflow Run ID: {run.info.run_id}")
 
         model.to(DEVICE)
+        # Под DDP прямой/обратный проход идут через обертку, а state_dict берем у исходной модели
+        train_module = DDP(model) if is_distributed() else model
         
         # Функция потерь: BCEWithLogitsLoss подходит для multi-label классификации,
         # так как она применяет Sigmoid к логитам и затем BCE Loss.
         # Она также более численно стабильна, чем Sigmoid + BCELoss по отдельности.
         criterion = nn.BCEWithLogitsLoss()
+        if teacher is not None:
+            teacher.to(DEVICE)
+            teacher.eval()
+            teacher.requires_grad_(False)
+            criterion = DistillationLoss(alpha=distill_alpha, temperature=distill_temperature)
         
         optimizer = AdamW(model.parameters(), lr=learning_rate)
+
+        # Планировщик шагает раз в шаг оптимизатора, т.е. раз в grad_accum_steps батчей
+        steps_per_epoch = math.ceil(len(train_dataloader) / grad_accum_steps)
+        total_steps = steps_per_epoch * num_epochs
+        warmup_steps = int(total_steps * warmup_ratio)
+        scheduler = None
+        if lr_scheduler_type is not None or warmup_steps > 0:
+            scheduler = get_scheduler(
+                lr_scheduler_type or "constant_with_warmup",
+                optimizer=optimizer,
+                num_warmup_steps=warmup_steps,
+                num_training_steps=total_steps
+            )
+
+        # GradScaler нужен только для fp16; bf16 имеет тот же диапазон, что fp32
+        scaler = torch.amp.GradScaler("cuda") if precision == "fp16" else None
+
+        if is_main and resume_state is None:
+            _log_training_params(model, train_dataloader, val_dataloader, {
+                "num_epochs": num_epochs,
+                "learning_rate": learning_rate,
+                "precision": precision,
+                "grad_accum_steps": grad_accum_steps,
+                "max_grad_norm": max_grad_norm,
+                "lr_scheduler_type": lr_scheduler_type or "constant",
+                "warmup_ratio": warmup_ratio,
+                "warmup_steps": warmup_steps,
+                "total_optimizer_steps": total_steps,
+                "checkpoint_every_n_steps": checkpoint_every_n_steps if checkpoint_dir else None,
+                "distillation": teacher is not None,
+                "distill_alpha": distill_alpha if teacher is not None else None,
+                "distill_temperature": distill_temperature if teacher is not None else None,
+                "teacher_num_hidden_layers": getattr(teacher, "num_hidden_layers", None),
+                "num_hidden_layers": getattr(model, "num_hidden_layers", None),
+            })
+        elif is_main:
+            mlflow.set_tag("resumed_from", str(resume_path))
         
         best_val_f1_macro = -1.0 # Отслеживаем лучшую F1-macro на валидации
+        start_epoch, start_batch, global_step = 0, 0, 0
+        if resume_state is not None:
+            model.load_state_dict(resume_state["model"])
+            optimizer.load_state_dict(resume_state["optimizer"])
+            if scheduler is not None and resume_state.get("scheduler") is not None:
+                scheduler.load_state_dict(resume_state["scheduler"])
+            if scaler is not None and resume_state.get("scaler") is not None:
+                scaler.load_state_dict(resume_state["scaler"])
+            best_val_f1_macro = resume_state["best_val_f1_macro"]
+            start_epoch = resume_state["epoch"]
+            start_batch = resume_state["batches_done"]
+            global_step = resume_state["global_step"]
+            print(f"Resumed at epoch {start_epoch + 1}, batch {start_batch}, optimizer step {global_step}.")
+
+        checkpoint_manager = (
+            CheckpointManager(checkpoint_dir, keep_last=keep_last_checkpoints) if checkpoint_dir and is_main else None
+        )
+
+        def build_checkpoint(epoch: int, batches_done: int, epoch_rng_state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            return {
+                "model": model.state_dict(),
+                "optimizer": optimizer.state_dict(),
+                "scheduler": scheduler.state_dict() if scheduler is not None else None,
+                "scaler": scaler.state_dict() if scaler is not None else None,
+                "epoch": epoch,
+                "batches_done": batches_done, # Позиция сэмплера внутри эпохи
+                "global_step": global_step,
+                "best_val_f1_macro": best_val_f1_macro,
+                "epoch_rng_state": epoch_rng_state, # RNG на начало эпохи: воспроизводит порядок батчей
+                "rng_state": capture_rng_state(), # RNG в момент сохранения: dropout и т.п. дальше
+                "mlflow_run_id": run.info.run_id,
+            }
         
         print(f"\nStarting training for {num_epochs} epochs...")
         
-        for epoch in range(num_epochs):
+        for epoch in range(start_epoch, num_epochs):
             print(f"\n--- Epoch {epoch+1}/{num_epochs} ---")
+            set_sampler_epoch(train_dataloader, epoch)
+
+            resume_rng_state = None
+            epoch_start_batch = 0
+            if resume_state is not None and epoch == start_epoch and start_batch > 0:
+                # Середина эпохи: порядок батчей задает RNG начала эпохи, дальше - RNG момента сохранения
+                epoch_rng_state = resume_state["epoch_rng_state"]
+                restore_rng_state(epoch_rng_state)
+                resume_rng_state = resume_state["rng_state"]
+                epoch_start_batch = start_batch
+            else:
+                if resume_state is not None and epoch == start_epoch:
+                    restore_rng_state(resume_state["rng_state"])
+                epoch_rng_state = capture_rng_state()
+
+            def on_optimizer_step(batches_done: int) -> None:
+                nonlocal global_step
+                global_step += 1
+                if (checkpoint_manager is not None and checkpoint_every_n_steps
+                        and global_step % checkpoint_every_n_steps == 0):
+                    checkpoint_manager.save(build_checkpoint(epoch, batches_done, epoch_rng_state), global_step)
             
             train_loss, train_metrics = train_epoch(
-                model, train_dataloader, optimizer, criterion, DEVICE, epoch, num_epochs
+                train_module, train_dataloader, optimizer, criterion, DEVICE, epoch, num_epochs,
+                scheduler=scheduler,
+                precision=precision,
+                grad_accum_steps=grad_accum_steps,
+                max_grad_norm=max_grad_norm,
+                scaler=scaler,
+                start_batch=epoch_start_batch,
+                resume_rng_state=resume_rng_state,
+                on_optimizer_step=on_optimizer_step,
+                teacher=teacher
             )
-            print(f"Train Loss: {train_loss:.4f}")
-            for metric_name, metric_val in train_metrics.items():
-                print(f"  Train {metric_name}: {metric_val:.4f}")
-                mlflow.log_metric(f"train_{metric_name}", metric_val, step=epoch)
-            mlflow.log_metric("train_loss", train_loss, step=epoch)
+            if is_main:
+                print(f"Train Loss: {train_loss:.4f}")
+                for metric_name, metric_val in train_metrics.items():
+                    print(f"  Train {metric_name}: {metric_val:.4f}")
+                    mlflow.log_metric(f"train_{metric_name}", metric_val, step=epoch)
+                mlflow.log_metric("train_loss", train_loss, step=epoch)
+                mlflow.log_metric("learning_rate", optimizer.param_groups[0]["lr"], step=epoch)
             
             val_loss, val_metrics = evaluate_epoch(
-                model, val_dataloader, criterion, DEVICE, epoch, num_epochs
+                model, val_dataloader, criterion, DEVICE, epoch, num_epochs, precision=precision,
+                teacher=teacher, per_label_metrics=teacher is not None
             )
-            print(f"Validation Loss: {val_loss:.4f}")
-            for metric_name, metric_val in val_metrics.items():
-                print(f"  Validation {metric_name}: {metric_val:.4f}")
-                mlflow.log_metric(f"val_{metric_name}", metric_val, step=epoch)
-            mlflow.log_metric("val_loss", val_loss, step=epoch)
+            if is_main:
+                print(f"Validation Loss: {val_loss:.4f}")
+                for metric_name, metric_val in val_metrics.items():
+                    print(f"  Validation {metric_name}: {metric_val:.4f}")
+                    mlflow.log_metric(f"val_{metric_name}", metric_val, step=epoch)
+                mlflow.log_metric("val_loss", val_loss, step=epoch)
             
-            # Сохраняем модель, если она показала лучший результат на валидации
+            # Сохраняем модель, если она показала лучший результат на валидации.
+            # Метрики сведены со всех рангов, поэтому решение одинаково на всех
             current_val_f1_macro = val_metrics.get("f1_macro", -1.0)
-            if current_val_f1_macro > best_val_f1_macro:
+            improved = current_val_f1_macro > best_val_f1_macro
+            if improved:
                 best_val_f1_macro = current_val_f1_macro
+            if improved and is_main:
                 print(f"New best validation F1-macro: {best_val_f1_macro:.4f}. Saving model...")
                 if model_save_path:
                     # Убедимся, что директория существует
@@ -246,11 +749,20 @@ def train_model(
                     mlflow.pytorch.log_model(model, artifact_path="best_model_mlflow_native")
                 mlflow.log_metric("best_val_f1_macro", best_val_f1_macro, step=epoch)
 
-        print("\nTraining finished.")
+            if checkpoint_manager is not None:
+                # Конец эпохи: следующая начинается с нулевого батча
+                checkpoint_manager.save(build_checkpoint(epoch + 1, 0, None), global_step)
+
+        if checkpoint_manager is not None:
+            checkpoint_manager.close() # Дожидаемся записи последних чекпоинтов
+        barrier()
+
+        if is_main:
+            print("\nTraining finished.")
         # Логируем финальную лучшую модель еще раз, если она не была сохранена в артефакты на каждой эпохе
         if model_save_path and os.path.exists(model_save_path):
              pass # Уже сохранено и залогировано как артефакт
-        elif not model_save_path: # Если сохраняли только в mlflow native
+        elif not model_save_path and is_main: # Если сохраняли только в mlflow native
              print("Final best model was logged via mlflow.pytorch.log_model.")
 
     return model # Возвращаем обученную (последнюю или лучшую) модель
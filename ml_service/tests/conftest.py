@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+# Как и scripts/*.py: корень ml_service в sys.path, чтобы импортировались config и src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.helpers import SOLIDITY_SAMPLES  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def tiny_encoder_dir(tmp_path_factory) -> str:
+    """
+    Каталог в формате save_offline_assets: конфиг крошечного RoBERTa и BPE-токенизатор, обученный
+    на нескольких контрактах. ContractVulnerabilityClassifier(..., pretrained=False) и get_tokenizer
+    строятся из него без обращения к хабу.
+    """
+    from tokenizers import ByteLevelBPETokenizer
+    from transformers import RobertaConfig, RobertaTokenizerFast
+
+    path = tmp_path_factory.mktemp("tiny_encoder")
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator(SOLIDITY_SAMPLES * 20, vocab_size=600, min_frequency=1,
+                            special_tokens=["<s>", "<pad>", "</s>", "<unk>", "<mask>"])  # ID как у RoBERTa
+    bpe.save_model(str(path))
+    RobertaTokenizerFast(vocab_file=str(path / "vocab.json"), merges_file=str(path / "merges.txt")).save_pretrained(path)
+    RobertaConfig(vocab_size=1024, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                  intermediate_size=64, max_position_embeddings=514).save_pretrained(path)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def tiny_checkpoint(tiny_encoder_dir, tmp_path_factory) -> str:
+    """fp32-чекпоинт крошечного классификатора с числом меток из конфига."""
+    import torch
+
+    from config import main_config
+    from src.modeling.models import ContractVulnerabilityClassifier
+
+    torch.manual_seed(0)
+    model = ContractVulnerabilityClassifier(tiny_encoder_dir, num_labels=len(main_config.VULNERABILITY_COUNT_COLUMNS),
+                                            pretrained=False)
+    path = tmp_path_factory.mktemp("tiny_checkpoint") / "model.pt"
+    torch.save(model.state_dict(), path)
+    return str(path)
@@ -0,0 +1,14 @@
+"""Общие данные тестов."""
+
+# Небольшие реальные по форме контракты: корпус для крошечного токенизатора и входы сервиса
+SOLIDITY_SAMPLES = [
+    "pragma solidity ^0.8.0;\ncontract Vault {\n    mapping(address => uint256) public balances;\n"
+    "    function withdraw(uint256 amount) public {\n        require(balances[msg.sender] >= amount, \"low\");\n"
+    "        (bool ok, ) = msg.sender.call{value: amount}(\"\");\n        require(ok);\n"
+    "        balances[msg.sender] -= amount;\n    }\n}\n",
+    "contract Token { event Transfer(address indexed from, address indexed to, uint256 value);\n"
+    "  function transfer(address to, uint256 value) external returns (bool) { emit Transfer(msg.sender, to, value); "
+    "return true; } }\n",
+    "// SPDX-License-Identifier: MIT\n/* owner only */ contract Timelock { uint public unlockTime = block.timestamp + 1 days;"
+    " function release() public { require(block.timestamp > unlockTime, \"locked\"); selfdestruct(payable(msg.sender)); } }",
+]
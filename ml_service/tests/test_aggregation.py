@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+import torch
+
+from src.modeling.aggregation import (
+    AGGREGATORS,
+    ContractScoreAccumulator,
+    aggregate_chunk_probs,
+    aggregate_segments,
+    pad_contract_chunks,
+)
+
+# Три чанка, две метки; ожидаемые значения посчитаны вручную
+PROBS = [[0.2, 0.9],
+         [0.6, 0.1],
+         [0.4, 0.5]]
+EXPECTED = {
+    ("max", 3): [0.6, 0.9],
+    ("mean", 3): [0.4, 0.5],
+    ("topk_mean", 2): [(0.6 + 0.4) / 2, (0.9 + 0.5) / 2],
+    ("topk_mean", 3): [0.4, 0.5],
+    ("topk_mean", 5): [0.4, 0.5],  # Чанков меньше top_k: среднее по всем трем
+    ("noisy_or", 3): [1 - 0.8 * 0.4 * 0.6, 1 - 0.1 * 0.9 * 0.5],
+}
+
+
+@pytest.mark.parametrize("method,top_k", list(EXPECTED))
+def test_aggregate_chunk_probs_hand_computed(method, top_k):
+    np.testing.assert_allclose(aggregate_chunk_probs(np.array(PROBS), method, top_k), EXPECTED[method, top_k],
+                               rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize("method", AGGREGATORS)
+def test_single_chunk_is_its_own_score(method):
+    np.testing.assert_allclose(aggregate_chunk_probs(np.array([[0.3, 0.7]]), method, 3), [0.3, 0.7], atol=1e-6)
+
+
+@pytest.mark.parametrize("method", AGGREGATORS)
+def test_empty_contract_scores_zero(method):
+    scores = aggregate_chunk_probs(np.zeros((0, 2), dtype=np.float32), method, 3)
+    assert scores.shape == (2,) and np.all(scores == 0.0)
+
+
+def test_noisy_or_of_a_certain_chunk_stays_finite():
+    scores = aggregate_chunk_probs(np.array([[1.0, 0.0], [0.0, 0.0]]), "noisy_or")
+    assert np.all(np.isfinite(scores))
+    np.testing.assert_allclose(scores, [1.0, 0.0], atol=1e-5)
+
+
+@pytest.mark.parametrize("method,top_k", list(EXPECTED))
+def test_aggregate_segments_matches_per_contract_values(method, top_k):
+    # Контракты: PROBS, пустой, одиночный чанк
+    chunk_probs = torch.tensor(PROBS + [[0.3, 0.7]])
+    offsets = torch.tensor([0, 3, 3, 4])
+    scores = aggregate_segments(chunk_probs, offsets, method, top_k)
+    assert scores.shape == (3, 2)
+    torch.testing.assert_close(scores[0], torch.tensor(EXPECTED[method, top_k]), rtol=0, atol=1e-6)
+    assert torch.all(scores[1] == 0.0)
+    torch.testing.assert_close(scores[2], torch.tensor([0.3, 0.7]), rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize("method", AGGREGATORS)
+def test_accumulator_over_shuffled_batches_equals_one_pass(method):
+    # Чанки двух контрактов вперемешку и по несколько в одном батче (как при бакетинге по длине)
+    chunk_probs = torch.tensor(PROBS + [[0.3, 0.7], [0.8, 0.05]])
+    contract_index = torch.tensor([0, 0, 0, 1, 1])
+    order = torch.tensor([3, 0, 2, 4, 1])
+    accumulator = ContractScoreAccumulator(2, 2, method=method, top_k=2)
+    for batch in (order[:2], order[2:]):
+        accumulator.update(chunk_probs[batch], contract_index[batch])
+    scores, _, seen = accumulator.compute()
+    expected = aggregate_segments(chunk_probs, torch.tensor([0, 3, 5]), method, top_k=2)
+    torch.testing.assert_close(scores, expected, rtol=0, atol=1e-6)
+    assert seen.tolist() == [True, True]
+
+
+def test_pad_contract_chunks_groups_rows_in_original_order():
+    values = torch.tensor([[1.0, 1.5], [2.0, 2.5], [3.0, 3.5], [4.0, 4.5]])
+    padded, mask = pad_contract_chunks(values, torch.tensor([2, 0, 2, 0]), num_contracts=4)
+    assert padded.shape == (4, 2, 2)
+    assert padded[0].tolist() == [[2.0, 2.5], [4.0, 4.5]]
+    assert padded[2].tolist() == [[1.0, 1.5], [3.0, 3.5]]
+    assert torch.all(padded[1] == 0) and torch.all(padded[3] == 0)  # Контракты без чанков
+    assert mask.tolist() == [[True, True], [False, False], [True, True], [False, False]]
+
+
+def test_pad_contract_chunks_uneven_and_single_chunk_contracts():
+    values = torch.arange(6, dtype=torch.float32).unsqueeze(1)
+    padded, mask = pad_contract_chunks(values, torch.tensor([1, 0, 0, 0, 1, 2]), num_contracts=3)
+    assert padded[:, :, 0].tolist() == [[1.0, 2.0, 3.0], [0.0, 4.0, 0.0], [5.0, 0.0, 0.0]]
+    assert mask.tolist() == [[True, True, True], [True, True, False], [True, False, False]]
+
+
+def test_pad_contract_chunks_without_chunks():
+    padded, mask = pad_contract_chunks(torch.zeros((0, 3)), torch.zeros(0, dtype=torch.long), num_contracts=2)
+    assert padded.shape == (2, 0, 3) and mask.shape == (2, 0)
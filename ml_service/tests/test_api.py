@@ -0,0 +1,186 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+import torch
+from fastapi.testclient import TestClient
+
+from config import main_config
+from src.api import fastapi_service as service
+from src.api.batch_analysis import iter_packed_contract_probs
+from src.api.batching import MicroBatcher
+from src.api.readiness import ModelLoadStatus
+from src.api.result_cache import ResultCache
+from src.api.worker_pool import InferenceWorkerPool
+from src.feature_engineering.tokenization import get_tokenizer
+from tests.helpers import SOLIDITY_SAMPLES
+
+NUM_LABELS = len(service.VULN_INFO)
+
+
+def first_token_infer(input_ids, attention_mask):
+    """Фейковая модель: у чанка "найдена" одна метка - по первому токену контента."""
+    probs = torch.full((input_ids.shape[0], NUM_LABELS), 0.1)
+    probs[torch.arange(input_ids.shape[0]), input_ids[:, 1] % NUM_LABELS] = 0.9
+    return probs
+
+
+def failing_infer(input_ids, attention_mask):
+    raise RuntimeError("model crashed")
+
+
+@pytest.fixture
+def ready_service(monkeypatch, tiny_encoder_dir):
+    """Сервис в состоянии "ready" с крошечным токенизатором и фейковой моделью за настоящим micro-batcher."""
+    tokenizer = get_tokenizer(tiny_encoder_dir)
+    batchers = []
+
+    def install(infer=first_token_infer):
+        batcher = MicroBatcher(infer, max_batch_size=8, max_wait_ms=1, pad_token_id=tokenizer.pad_token_id)
+        batchers.append(batcher)
+        monkeypatch.setattr(service, "batcher", batcher)
+
+    status = ModelLoadStatus()
+    status.start()
+    status.finish()
+    monkeypatch.setattr(service, "tokenizer", tokenizer)
+    monkeypatch.setattr(service, "result_cache", ResultCache(sqlite_path=None))
+    monkeypatch.setattr(service, "_model_id", "test-model")
+    monkeypatch.setattr(service, "load_status", status)
+    # Короткие чанки: контракт - несколько чанков, и упаковка режет контракты между батчами
+    monkeypatch.setattr(main_config, "MODEL_CHUNK_SIZE", 16)
+    monkeypatch.setattr(main_config, "CHUNK_OVERLAP", 4)
+    monkeypatch.setattr(main_config, "INFERENCE_EARLY_EXIT", False)
+    install()
+    yield install
+    for batcher in batchers:
+        batcher.close()
+
+
+def _contracts(count: int):
+    return [{"code": SOLIDITY_SAMPLES[i % 3] + f"\n// contract {i}\n", "id": f"c{i}"} for i in range(count)]
+
+
+def _stream(client: TestClient, contracts):
+    response = client.post("/api/analyze/batch", json={"contracts": contracts})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def test_batch_streams_one_line_per_contract(ready_service):
+    contracts = _contracts(10)
+    contracts[2]["code"] = "abc"  # Слишком короткий
+    contracts[5]["code"] = ""
+    client = TestClient(service.app)
+    # Контракт 6 уже в кэше: его строка отдается без инференса
+    assert client.post("/api/analyze", json={"code": contracts[6]["code"]}).status_code == 200
+
+    lines = _stream(client, contracts)
+    assert sorted(line["index"] for line in lines) == list(range(10))
+    # Сначала некорректные и закэшированные (в порядке входа), затем посчитанные - по мере готовности
+    assert [line["index"] for line in lines[:3]] == [2, 5, 6]
+    assert [line["index"] for line in lines[3:]] == [0, 1, 3, 4, 7, 8, 9]
+
+    for line in lines:
+        contract = contracts[line["index"]]
+        assert line["id"] == contract["id"]
+        if line["index"] in (2, 5):
+            assert "error" in line and "vulnerabilities" not in line
+        else:
+            # Каждый контракт получает свои чанки, как при одиночном анализе
+            expected = service._build_response(service._compute_chunk_probs(contract["code"]))
+            assert line["vulnerabilities"] == expected["vulnerabilities"]
+
+
+def test_batch_model_error_is_the_last_line(ready_service):
+    ready_service(failing_infer)
+    contracts = _contracts(3)
+    contracts[1]["code"] = "x"
+    lines = _stream(TestClient(service.app), contracts)
+    assert lines[0]["index"] == 1 and "error" in lines[0]
+    assert "index" not in lines[-1] and "model crashed" in lines[-1]["error"]
+    assert len(lines) == 2  # Контракты 0 и 2 остались без строки
+
+
+def test_batch_caches_full_results_even_with_early_exit_enabled(ready_service, monkeypatch):
+    monkeypatch.setattr(main_config, "INFERENCE_EARLY_EXIT", True)
+    code = _contracts(1)[0]["code"]
+    _stream(TestClient(service.app), [{"code": code}])
+    # Batch-эндпоинт считает все чанки: полный результат и под ключом "full"
+    full = service.result_cache.get(service._cache_key(code, early_exit=False))
+    assert full is not None and len(full) == service._compute_chunk_probs(code).shape[0]
+    assert service.result_cache.get(service._cache_key(code, early_exit=True)) is None
+
+
+def test_batch_rejects_too_many_contracts(ready_service, monkeypatch):
+    monkeypatch.setattr(main_config, "INFERENCE_BATCH_MAX_CONTRACTS", 2)
+    response = TestClient(service.app).post("/api/analyze/batch", json={"contracts": _contracts(3)})
+    assert response.status_code == 413
+
+
+class CountingTokenizer:
+    """Прокси токенизатора, считающий вызовы токенизации."""
+    def __init__(self, tokenizer):
+        self._tokenizer = tokenizer
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self._tokenizer(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._tokenizer, name)
+
+
+def test_closing_the_stream_cancels_queued_batches_and_stops_tokenizing(tiny_encoder_dir):
+    tokenizer = CountingTokenizer(get_tokenizer(tiny_encoder_dir))
+    futures = []
+
+    def submit(input_ids, attention_mask):
+        future = Future()
+        if not futures:  # Первый батч готов, остальные "ждут в очереди" батчера
+            future.set_result(first_token_infer(input_ids, attention_mask))
+        futures.append(future)
+        return future
+
+    async def consume_first():
+        # Контракт - один чанк (MODEL_CHUNK_SIZE по умолчанию), батч - один чанк
+        results = iter_packed_contract_probs([item["code"] for item in _contracts(6)], tokenizer, submit,
+                                             max_batch_size=1, max_in_flight=2, tokenize_group_size=2)
+        position, probs = await results.__anext__()
+        await results.aclose()  # Так StreamingResponse закрывает генератор при отключении клиента
+        return position, probs
+
+    position, probs = asyncio.run(consume_first())
+    assert position == 0 and probs.shape == (1, NUM_LABELS)
+    assert len(futures) == 2 and futures[1].cancelled()
+    assert tokenizer.calls == 1  # Следующие группы контрактов не токенизировались
+
+
+def test_async_endpoint_answers_429_when_the_pool_is_full(ready_service, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def blocking_predict(code):
+        started.set()
+        release.wait(10)
+        return None
+
+    pool = InferenceWorkerPool(num_workers=1, threads_per_worker=1, max_queue_size=0, mode="thread")
+    monkeypatch.setattr(service, "worker_pool", pool)
+    monkeypatch.setattr(service, "_pool_predict_fn", blocking_predict)
+    client = TestClient(service.app)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            first = executor.submit(client.post, "/api/analyze/async", json={"code": SOLIDITY_SAMPLES[0]})
+            assert started.wait(10)
+            second = client.post("/api/analyze/async", json={"code": SOLIDITY_SAMPLES[1]})
+            release.set()
+            assert second.status_code == 429
+            assert first.result(10).status_code == 200
+    finally:
+        release.set()
+        pool.shutdown()
+    assert pool.stats()["rejected_total"] == 1
@@ -0,0 +1,26 @@
+import pytest
+import torch
+
+from config import main_config
+from src.api.backends import InferenceBackend, TorchBackend, create_backend
+
+NUM_LABELS = len(main_config.VULNERABILITY_COUNT_COLUMNS)
+
+
+def test_backend_without_predict_probs_cannot_be_built():
+    class Incomplete(InferenceBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        InferenceBackend()
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_torch_backend_returns_probabilities_on_cpu(tiny_checkpoint, tiny_encoder_dir):
+    backend = create_backend("torch", tiny_checkpoint, tiny_encoder_dir, num_labels=NUM_LABELS)
+    assert isinstance(backend, TorchBackend)
+    input_ids = torch.randint(5, 500, (3, 16))
+    probs = backend.predict_probs(input_ids, torch.ones_like(input_ids))
+    assert probs.shape == (3, NUM_LABELS) and probs.device.type == "cpu"
+    assert torch.all((probs >= 0) & (probs <= 1))
@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+from config import main_config
+from src.api.backends import TorchBackend
+from src.feature_engineering.chunk_shards import read_manifest, write_manifest
+from src.feature_engineering.tokenization import get_tokenizer, tokenize_and_chunk_batch, trim_padding
+from src.modeling.aggregation import aggregate_chunk_probs
+from src.modeling.export import load_inference_model
+from tests.helpers import SOLIDITY_SAMPLES
+
+ML_SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ML_SERVICE_DIR, "scripts", "run_batch_inference.py")
+MANIFEST_FILENAME = "_manifest.json"
+LABELS = [column.lower() for column in main_config.VULNERABILITY_COUNT_COLUMNS]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    codes = [SOLIDITY_SAMPLES[0], SOLIDITY_SAMPLES[1], "", SOLIDITY_SAMPLES[2], SOLIDITY_SAMPLES[0] * 3]
+    path = tmp_path / "contracts.csv"
+    pd.DataFrame({"address": [f"0x{i:02x}" for i in range(len(codes))], "sourcecode": codes}).to_csv(path, index=False)
+    return path, codes
+
+
+def _run(corpus_path, output_dir, tiny_encoder_dir, tiny_checkpoint, *extra):
+    return subprocess.run(
+        [sys.executable, SCRIPT, "--input", str(corpus_path), "--output-dir", str(output_dir),
+         "--base-model", tiny_encoder_dir, "--model-path", tiny_checkpoint, "--device", "cpu",
+         "--num-workers", "1", "--rows-per-group", "2", "--rows-per-task", "1", "--batch-size", "3", *extra],
+        cwd=ML_SERVICE_DIR, capture_output=True, text=True, timeout=600
+    )
+
+
+def _expected_probs(codes, tiny_encoder_dir, tiny_checkpoint) -> np.ndarray:
+    """Контракт за контрактом, как /api/analyze: без упаковки по длине и между контрактами."""
+    model = load_inference_model(tiny_checkpoint, tiny_encoder_dir, len(LABELS))
+    backend = TorchBackend(model, torch.device("cpu"), artifact_path=tiny_checkpoint)
+    tokenizer = get_tokenizer(tiny_encoder_dir)
+    expected = np.full((len(codes), len(LABELS)), np.nan, dtype=np.float32)
+    for i, code in enumerate(codes):
+        batch = tokenize_and_chunk_batch([code], tokenizer)
+        if batch["input_ids"].shape[0]:
+            probs = backend.predict_probs(*trim_padding(batch["input_ids"], batch["attention_mask"]))
+            expected[i] = aggregate_chunk_probs(probs.numpy(), main_config.CHUNK_AGGREGATION,
+                                                main_config.CHUNK_AGGREGATION_TOP_K)
+    return expected
+
+
+def test_scores_a_corpus_into_parts_and_resumes_after_the_last_part(corpus, tmp_path, tiny_encoder_dir,
+                                                                    tiny_checkpoint):
+    corpus_path, codes = corpus
+    output_dir = tmp_path / "scores"
+    completed = _run(corpus_path, output_dir, tiny_encoder_dir, tiny_checkpoint)
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+
+    manifest = read_manifest(output_dir, MANIFEST_FILENAME)
+    assert manifest["complete"] and manifest["next_row"] == len(codes)
+    assert manifest["parts"] == ["part-00000.parquet", "part-00001.parquet", "part-00002.parquet"]
+    scores = pd.read_parquet(output_dir).sort_values("row_index").reset_index(drop=True)
+    assert scores["row_index"].tolist() == list(range(len(codes)))
+    assert scores["address"].tolist() == [f"0x{i:02x}" for i in range(len(codes))]
+    assert scores.loc[2, "num_chunks"] == 0 and scores.loc[4, "num_chunks"] >= 1
+
+    probs = scores[[f"prob_{name}" for name in LABELS]].to_numpy()
+    expected = _expected_probs(codes, tiny_encoder_dir, tiny_checkpoint)
+    assert np.isnan(probs[2]).all()  # Контракт без чанков - NaN, а не 0
+    np.testing.assert_allclose(probs, expected, atol=1e-5, equal_nan=True)
+    preds = scores[[f"pred_{name}" for name in LABELS]].to_numpy()
+    np.testing.assert_array_equal(preds, np.nan_to_num(expected) > main_config.CONTRACT_THRESHOLD)
+
+    # Прерывание после первой части: манифест указывает на строку 2, остальные части не записаны
+    for name in manifest["parts"][1:]:
+        (output_dir / name).unlink()
+    write_manifest(output_dir, dict(manifest, parts=manifest["parts"][:1], next_row=2, complete=False),
+                   MANIFEST_FILENAME)
+    resumed = _run(corpus_path, output_dir, tiny_encoder_dir, tiny_checkpoint)
+    assert resumed.returncode == 0, resumed.stdout + resumed.stderr
+    assert "Resuming from row 2" in resumed.stdout
+    assert read_manifest(output_dir, MANIFEST_FILENAME)["parts"] == manifest["parts"]
+    pd.testing.assert_frame_equal(pd.read_parquet(output_dir).sort_values("row_index").reset_index(drop=True), scores)
+
+    # Завершенный запуск не пересчитывается, а другие параметры без --overwrite отклоняются
+    again = _run(corpus_path, output_dir, tiny_encoder_dir, tiny_checkpoint)
+    assert again.returncode == 0 and "Already complete" in again.stdout
+    mismatched = _run(corpus_path, output_dir, tiny_encoder_dir, tiny_checkpoint, "--threshold", "0.9")
+    assert mismatched.returncode == 1 and "threshold" in mismatched.stdout
@@ -0,0 +1,143 @@
+import threading
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from src.api.batching import Histogram, MicroBatcher
+
+PAD = 1
+
+
+class RecordingInfer:
+    """Фейковая модель: возвращает сами input_ids (float) и запоминает формы батчей."""
+    def __init__(self, gate: threading.Event = None):
+        self.calls = []
+        self.gate = gate
+
+    def __call__(self, input_ids, attention_mask):
+        self.calls.append((input_ids.clone(), attention_mask.clone()))
+        if self.gate is not None:
+            self.gate.wait(5)
+        return input_ids.float()
+
+
+def _request(num_chunks: int, width: int, start: int):
+    input_ids = torch.arange(start, start + num_chunks * width).reshape(num_chunks, width) + 10
+    attention_mask = torch.ones_like(input_ids)
+    attention_mask[:, width - 1] = 0  # Паддинг внутри запроса тоже сохраняется
+    return input_ids, attention_mask
+
+
+def test_requests_of_different_widths_share_a_batch_and_get_their_own_rows():
+    infer = RecordingInfer()
+    batcher = MicroBatcher(infer, max_batch_size=6, max_wait_ms=2000, pad_token_id=PAD)
+    requests = [_request(2, 5, 0), _request(1, 8, 100), _request(3, 3, 200)]
+    futures = [batcher.submit(ids, mask) for ids, mask in requests]
+    results = [future.result(timeout=5) for future in futures]
+    batcher.close()
+
+    assert len(infer.calls) == 1  # 2 + 1 + 3 = max_batch_size: один проход без ожидания дедлайна
+    batch_ids, batch_mask = infer.calls[0]
+    assert batch_ids.shape == (6, 8)
+    offset = 0
+    for (ids, mask), result in zip(requests, results):
+        padded_ids = F.pad(ids, (0, 8 - ids.shape[1]), value=PAD)
+        padded_mask = F.pad(mask, (0, 8 - mask.shape[1]), value=0)
+        assert torch.equal(result, padded_ids.float())
+        assert torch.equal(batch_mask[offset:offset + ids.shape[0]], padded_mask)
+        offset += ids.shape[0]
+
+
+def test_request_that_does_not_fit_is_carried_to_the_next_batch():
+    infer = RecordingInfer()
+    batcher = MicroBatcher(infer, max_batch_size=4, max_wait_ms=500, pad_token_id=PAD)
+    requests = [_request(3, 4, 0), _request(2, 4, 100), _request(1, 4, 200)]
+    futures = [batcher.submit(ids, mask) for ids, mask in requests]
+    results = [future.result(timeout=5) for future in futures]
+    batcher.close()
+
+    assert [call[0].shape[0] for call in infer.calls] == [3, 3]
+    for (ids, _), result in zip(requests, results):
+        assert torch.equal(result, ids.float())
+
+
+def test_oversized_request_runs_alone():
+    infer = RecordingInfer()
+    batcher = MicroBatcher(infer, max_batch_size=4, max_wait_ms=0, pad_token_id=PAD)
+    ids, mask = _request(10, 4, 0)
+    assert torch.equal(batcher.submit(ids, mask).result(timeout=5), ids.float())
+    batcher.close()
+    assert [call[0].shape[0] for call in infer.calls] == [10]
+
+
+def test_partial_batch_runs_after_max_wait():
+    infer = RecordingInfer()
+    batcher = MicroBatcher(infer, max_batch_size=32, max_wait_ms=5, pad_token_id=PAD)
+    ids, mask = _request(1, 4, 0)
+    assert torch.equal(batcher.submit(ids, mask).result(timeout=5), ids.float())
+    batcher.close()
+
+
+def test_cancelled_request_is_not_run():
+    gate = threading.Event()
+    infer = RecordingInfer(gate)
+    batcher = MicroBatcher(infer, max_batch_size=1, max_wait_ms=0, pad_token_id=PAD)
+    first = batcher.submit(*_request(1, 4, 0))
+    second = batcher.submit(*_request(1, 4, 100))
+    assert second.cancel()  # Первый батч еще считается, второй ждет в очереди
+    gate.set()
+    first.result(timeout=5)
+    batcher.close(timeout=5)
+
+    assert second.cancelled()
+    assert len(infer.calls) == 1
+    assert batcher.stats()["requests_total"] == 1
+
+
+def test_infer_error_is_delivered_to_every_request_of_the_batch():
+    def failing_infer(input_ids, attention_mask):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(failing_infer, max_batch_size=2, max_wait_ms=2000, pad_token_id=PAD)
+    futures = [batcher.submit(*_request(1, 4, 0)), batcher.submit(*_request(1, 4, 100))]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="boom"):
+            future.result(timeout=5)
+    batcher.close()
+
+
+def test_stats_histograms_and_padding_waste():
+    infer = RecordingInfer()
+    batcher = MicroBatcher(infer, max_batch_size=3, max_wait_ms=2000, pad_token_id=PAD)
+    futures = [batcher.submit(*_request(2, 2, 0)), batcher.submit(*_request(1, 4, 100))]
+    for future in futures:
+        future.result(timeout=5)
+    batcher.close()
+
+    stats = batcher.stats()
+    assert stats["batches_total"] == 1 and stats["requests_total"] == 2
+    assert stats["batch_size_chunks"]["count"] == 1
+    assert stats["batch_size_chunks"]["buckets"]["2"] == 0 and stats["batch_size_chunks"]["buckets"]["4"] == 1
+    assert stats["wait_time_ms"]["count"] == 2
+    # Реальных токенов 2*1 + 1*3 = 5 из 3*4 = 12 позиций
+    assert stats["padding_waste_pct"] == pytest.approx(100.0 * (1 - 5 / 12))
+
+
+def test_close_serves_queued_requests_and_rejects_new_ones():
+    infer = RecordingInfer()
+    batcher = MicroBatcher(infer, max_batch_size=1, max_wait_ms=0, pad_token_id=PAD)
+    futures = [batcher.submit(*_request(1, 4, i * 10)) for i in range(5)]
+    batcher.close(timeout=5)
+    assert all(future.done() and not future.cancelled() for future in futures)
+    with pytest.raises(RuntimeError):
+        batcher.submit(*_request(1, 4, 0))
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 5, 10))
+    for value in (0.5, 1, 3, 7, 50):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {"1": 2, "5": 3, "10": 4, "+Inf": 5}
+    assert snapshot["count"] == 5 and snapshot["sum"] == pytest.approx(61.5)
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import default_collate
+
+from src.modeling.dataset import ContractChunkDataset, LengthBucketBatchSampler, create_chunk_dataloader
+
+
+@pytest.mark.parametrize("num_items", [1, 2, 3, 5, 17])
+@pytest.mark.parametrize("num_replicas", [2, 3, 8])
+def test_even_shards_give_every_rank_the_same_number_of_batches(num_items, num_replicas):
+    lengths = np.arange(num_items) + 1
+    shards = [
+        list(LengthBucketBatchSampler(lengths, batch_size=2, seed=0, num_replicas=num_replicas, rank=rank))
+        for rank in range(num_replicas)
+    ]
+    expected = -(-((num_items + 1) // 2) // num_replicas)
+    assert [len(shard) for shard in shards] == [expected] * num_replicas
+    assert all(
+        len(LengthBucketBatchSampler(lengths, batch_size=2, seed=0, num_replicas=num_replicas, rank=rank)) == expected
+        for rank in range(num_replicas)
+    )
+    covered = {index for shard in shards for batch in shard for index in batch}
+    assert covered == set(range(num_items))
+
+
+CHUNK_SIZE = 8
+LENGTHS = [8, 3, 5, 1, 6, 2, 8, 4]
+
+
+@pytest.fixture
+def chunk_dataset_paths(tmp_path):
+    """Файлы формата run_build_chunks --legacy-pt: чанки с паддингом в конце, метки и исходные индексы."""
+    generator = torch.Generator().manual_seed(0)
+    chunks = []
+    for length in LENGTHS:
+        input_ids = torch.ones(CHUNK_SIZE, dtype=torch.long)  # pad_token_id RoBERTa
+        input_ids[:length] = torch.randint(5, 500, (length,), generator=generator)
+        chunks.append({"input_ids": input_ids, "attention_mask": (torch.arange(CHUNK_SIZE) < length).long()})
+    paths = {name: str(tmp_path / f"{name}.pt") for name in ("chunk_list", "labels", "original_indices")}
+    torch.save(chunks, paths["chunk_list"])
+    torch.save(torch.randint(0, 2, (len(LENGTHS), 3), generator=generator).float(), paths["labels"])
+    torch.save(torch.tensor([0, 0, 1, 2, 2, 2, 3, 4]), paths["original_indices"])
+    return paths
+
+
+def _chunk_dataset(paths, dynamic_padding: bool = True) -> ContractChunkDataset:
+    return ContractChunkDataset(paths["chunk_list"], paths["labels"], paths["original_indices"],
+                                pin_memory=False, dynamic_padding=dynamic_padding)
+
+
+def _collated(dataset: ContractChunkDataset, indices, width: int):
+    """Эталон: поэлементный __getitem__ + default_collate, обрезанный до ширины батча."""
+    batch = default_collate([dataset[i] for i in indices])
+    batch["input_ids"] = batch["input_ids"][:, :width]
+    batch["attention_mask"] = batch["attention_mask"][:, :width]
+    return batch
+
+
+@pytest.mark.parametrize("make_index", [list, np.array, torch.tensor], ids=["list", "numpy", "tensor"])
+@pytest.mark.parametrize("indices", [[4, 1, 3], [0], [7, 6, 5, 4, 3, 2, 1, 0], [2, 2, 5]])
+def test_batch_index_equals_collated_items(chunk_dataset_paths, make_index, indices):
+    dataset = _chunk_dataset(chunk_dataset_paths)
+    batch = dataset[make_index(indices)]
+    width = max(LENGTHS[i] for i in indices)  # Динамический паддинг: до самого длинного чанка батча
+    expected = _collated(dataset, indices, width)
+    assert set(batch) == set(expected) == {"input_ids", "attention_mask", "labels", "original_index"}
+    for name in expected:
+        assert torch.equal(batch[name], expected[name]), name
+    assert batch["input_ids"].shape == (len(indices), width)
+
+
+def test_batch_index_without_dynamic_padding_keeps_chunk_size(chunk_dataset_paths):
+    dataset = _chunk_dataset(chunk_dataset_paths, dynamic_padding=False)
+    batch = dataset[[1, 3]]
+    assert batch["input_ids"].shape == (2, CHUNK_SIZE)
+    assert torch.equal(batch["attention_mask"], _collated(dataset, [1, 3], CHUNK_SIZE)["attention_mask"])
+
+
+def test_single_index_returns_views_and_batch_returns_copies(chunk_dataset_paths):
+    dataset = _chunk_dataset(chunk_dataset_paths)
+    item = dataset[torch.tensor(2)]  # 0-мерный тензор - одиночный индекс, а не батч
+    assert item["input_ids"].shape == (CHUNK_SIZE,) and item["original_index"] == 1
+    assert item["input_ids"].data_ptr() == dataset.input_ids[2].data_ptr()
+    batch = dataset[[2]]
+    batch["input_ids"].fill_(0)  # Батч - отдельный буфер: данные датасета не меняются
+    assert torch.equal(dataset[2]["input_ids"], item["input_ids"]) and item["input_ids"].sum() > 0
+
+
+@pytest.mark.parametrize("bucket_by_length", [False, True])
+def test_chunk_dataloader_covers_every_chunk_once(chunk_dataset_paths, bucket_by_length):
+    dataset = _chunk_dataset(chunk_dataset_paths)
+    loader = create_chunk_dataloader(dataset, batch_size=3, shuffle=True, bucket_by_length=bucket_by_length,
+                                     generator=torch.Generator().manual_seed(0))
+    lengths = []
+    for batch in loader:
+        batch_lengths = batch["attention_mask"].sum(dim=1)
+        assert batch["input_ids"].shape[1] == int(batch_lengths.max())
+        lengths.extend(batch_lengths.tolist())
+    assert sorted(lengths) == sorted(LENGTHS)
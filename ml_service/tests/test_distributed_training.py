@@ -0,0 +1,63 @@
+import os
+import socket
+
+import torch
+import torch.multiprocessing as mp
+import torch.nn as nn
+from torch.nn.parallel import DistributedDataParallel as DDP
+from torch.optim import AdamW
+from torch.utils.data import DataLoader
+
+from src.modeling.distributed import all_gather_objects, cleanup_distributed, init_distributed
+from src.modeling.models import ContractVulnerabilityClassifier
+from src.modeling.trainer import train_epoch
+
+WORLD_SIZE = 2
+NUM_LABELS = 3
+CHUNK_SIZE = 16
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _ddp_worker(rank: int, port: int, config_dir: str) -> None:
+    os.environ.update(MASTER_ADDR="127.0.0.1", MASTER_PORT=str(port), RANK=str(rank), WORLD_SIZE=str(WORLD_SIZE),
+                      LOCAL_RANK=str(rank), LOCAL_WORLD_SIZE=str(WORLD_SIZE))
+    init_distributed("gloo", num_threads=1)
+    try:
+        model = ContractVulnerabilityClassifier(config_dir, num_labels=NUM_LABELS, pretrained=False)
+        module = DDP(model)  # Веса ранга 0 рассылаются остальным
+        generator = torch.Generator().manual_seed(rank)  # Разные данные на рангах
+        data = [{
+            "input_ids": torch.randint(5, 1024, (CHUNK_SIZE,), generator=generator),
+            "attention_mask": torch.ones(CHUNK_SIZE, dtype=torch.long),
+            "labels": torch.randint(0, 2, (NUM_LABELS,), generator=generator).float(),
+        } for _ in range(12)]
+        # 6 батчей по 2 с накоплением по 2: три шага оптимизатора, в том числе через no_sync()
+        train_epoch(module, DataLoader(data, batch_size=2), AdamW(model.parameters(), lr=1e-3),
+                    nn.BCEWithLogitsLoss(), torch.device("cpu"), epoch_num=0, num_epochs=1, grad_accum_steps=2)
+        weights = torch.cat([param.detach().flatten() for param in model.parameters()])
+        gathered = all_gather_objects(weights)
+        assert all(torch.equal(gathered[0], other) for other in gathered[1:]), "Ranks diverged"
+    finally:
+        cleanup_distributed()
+
+
+def test_ddp_training_smoke(tiny_encoder_dir):
+    # Параметр без градиента (например, пулер RoBERTa) ронял бы второй шаг DDP
+    mp.spawn(_ddp_worker, args=(_free_port(), tiny_encoder_dir), nprocs=WORLD_SIZE, join=True)
+
+
+def test_encoder_has_no_pooler_and_loads_old_checkpoints(tiny_encoder_dir):
+    config_dir = tiny_encoder_dir
+    model = ContractVulnerabilityClassifier(config_dir, num_labels=NUM_LABELS, pretrained=False)
+    assert not any(name.startswith("base_model.pooler.") for name in model.state_dict())
+
+    # Чекпоинт, сохраненный с пулером, загружается строго: его веса отбрасываются
+    old_state = dict(model.state_dict())
+    old_state["base_model.pooler.dense.weight"] = torch.zeros(32, 32)
+    old_state["base_model.pooler.dense.bias"] = torch.zeros(32)
+    ContractVulnerabilityClassifier(config_dir, num_labels=NUM_LABELS, pretrained=False).load_state_dict(old_state)
@@ -0,0 +1,163 @@
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+import torch
+
+from src.api.early_exit import score_chunks_early_exit
+from src.modeling.aggregation import AGGREGATORS, ContractScoreAccumulator, aggregate_chunk_probs
+
+TOP_K = 3
+THRESHOLD = 0.5
+
+
+def _accumulator(seen: torch.Tensor, method: str) -> ContractScoreAccumulator:
+    accumulator = ContractScoreAccumulator(1, seen.shape[1], method=method, top_k=TOP_K)
+    accumulator.update(seen, torch.zeros(len(seen), dtype=torch.long))
+    return accumulator
+
+
+@pytest.mark.parametrize("method", AGGREGATORS)
+@pytest.mark.parametrize("num_seen,remaining", [(1, 0), (1, 1), (2, 1), (2, 5), (4, 2), (5, 0)])
+def test_bounds_are_reached_by_all_zero_and_all_one_chunks_and_contain_any_completion(method, num_seen, remaining):
+    generator = torch.Generator().manual_seed(num_seen * 10 + remaining)
+    seen = torch.rand((num_seen, 4), generator=generator)
+    lower, upper = _accumulator(seen, method).bounds(torch.tensor([remaining]))
+
+    def final(rest: torch.Tensor) -> torch.Tensor:
+        return torch.from_numpy(aggregate_chunk_probs(torch.cat([seen, rest]), method, TOP_K))
+
+    # Границы точные: их дают продолжения из одних нулей и одних единиц
+    assert torch.allclose(lower[0], final(torch.zeros((remaining, 4))), atol=1e-5)
+    assert torch.allclose(upper[0], final(torch.ones((remaining, 4))), atol=1e-5)
+    for _ in range(20):
+        score = final(torch.rand((remaining, 4), generator=generator))
+        assert torch.all(lower[0] <= score + 1e-6) and torch.all(score <= upper[0] + 1e-6)
+    if remaining == 0:
+        assert torch.allclose(lower, upper)
+
+
+@pytest.mark.parametrize("method", AGGREGATORS)
+def test_nothing_remaining_is_always_decided(method):
+    accumulator = _accumulator(torch.tensor([[0.5, 0.1], [0.2, 0.9]]), method)
+    assert bool(accumulator.is_decided(torch.tensor([0]), THRESHOLD)[0])
+
+
+@pytest.mark.parametrize("method,seen,remaining,decided", [
+    # max / noisy_or: положительные метки решены сразу, отрицательные - только без оставшихся чанков
+    ("max", [[0.9, 0.8]], 3, True),
+    ("max", [[0.9, 0.2]], 3, False),
+    ("noisy_or", [[0.6, 0.7]], 2, True),
+    ("noisy_or", [[0.3, 0.3]], 1, False),
+    # mean: 3 чанка по 0.9 и еще 1 нулевой дают 0.675 > 0.5, еще 3 нулевых - 0.45
+    ("mean", [[0.9], [0.9], [0.9]], 1, True),
+    ("mean", [[0.9], [0.9], [0.9]], 3, False),
+    ("mean", [[0.1], [0.1], [0.1]], 1, True),  # Верх (0.3 + 1) / 4 = 0.325
+    # topk_mean (k=3): три чанка по 0.9 уже в top-k, нули его не меняют; единица вытеснит 0.9, но 1.0 > 0.5
+    ("topk_mean", [[0.9], [0.9], [0.9]], 5, True),
+    ("topk_mean", [[0.9]], 2, False),  # Нижняя граница 0.9 / 3 = 0.3
+    ("topk_mean", [[0.1], [0.1], [0.1]], 1, True),  # Верх (0.1 + 0.1 + 1) / 3 = 0.4
+    ("topk_mean", [[0.1], [0.1], [0.1]], 2, False),  # Верх (0.1 + 1 + 1) / 3 = 0.7
+])
+def test_is_decided_per_aggregator(method, seen, remaining, decided):
+    accumulator = _accumulator(torch.tensor(seen), method)
+    assert bool(accumulator.is_decided(torch.tensor([remaining]), THRESHOLD)[0]) is decided
+
+
+def _chunks(num_chunks: int):
+    """Чанк i несет свой номер в позиции 1; ширина у чанков разная, как у реальных контрактов."""
+    input_ids = torch.ones((num_chunks, 6), dtype=torch.long)
+    input_ids[:, 1] = torch.arange(num_chunks)
+    lengths = torch.randint(3, 7, (num_chunks,), generator=torch.Generator().manual_seed(num_chunks))
+    attention_mask = (torch.arange(6).unsqueeze(0) < lengths.unsqueeze(1)).long()
+    return input_ids, attention_mask
+
+
+class TablePredictor:
+    """Фейковая модель: вероятности чанков берутся из таблицы по номеру чанка."""
+    def __init__(self, table: torch.Tensor):
+        self.table = table
+        self.calls = []
+
+    def __call__(self, input_ids, attention_mask):
+        self.calls.append(input_ids[:, 1].tolist())
+        return self.table[input_ids[:, 1]]
+
+
+@pytest.mark.parametrize("method", AGGREGATORS)
+@pytest.mark.parametrize("order", ["sequential", "longest_first"])
+def test_early_exit_labels_equal_full_scoring(method, order):
+    generator = torch.Generator().manual_seed(0)
+    exits = 0
+    for trial in range(40):
+        num_chunks = int(torch.randint(1, 12, (1,), generator=generator))
+        # Разные режимы: от почти нулевых до почти единичных вероятностей
+        scale = (trial % 4) / 3
+        table = (torch.rand((num_chunks, 3), generator=generator) * 0.5 + scale * 0.5).clamp(max=1.0)
+        input_ids, attention_mask = _chunks(num_chunks)
+        probs, encoded = score_chunks_early_exit(TablePredictor(table), input_ids, attention_mask, method=method,
+                                                 top_k=TOP_K, threshold=THRESHOLD, group_size=2, order=order)
+        assert probs.shape == (encoded, 3) and 0 < encoded <= num_chunks
+        exits += int(encoded < num_chunks)
+        full_labels = aggregate_chunk_probs(table, method, TOP_K) > THRESHOLD
+        early_labels = aggregate_chunk_probs(probs, method, TOP_K) > THRESHOLD
+        np.testing.assert_array_equal(early_labels, full_labels)
+    assert exits > 0  # Проверка содержательна, только если ранний выход действительно случался
+
+
+class RecordingSubmit:
+    """Фейковый MicroBatcher.submit: считает сразу, но журналирует отправку и ожидание результатов."""
+    def __init__(self, table: torch.Tensor):
+        self.predict = TablePredictor(table)
+        self.events = []
+        self.futures = []
+
+    def __call__(self, input_ids, attention_mask):
+        future = _LoggedFuture(self.events, len(self.futures))
+        future.set_result(self.predict(input_ids, attention_mask))
+        self.events.append(("submit", len(self.futures)))
+        self.futures.append(future)
+        return future
+
+
+class _LoggedFuture(Future):
+    def __init__(self, events, number):
+        super().__init__()
+        self.events = events
+        self.number = number
+        self.cancel_requested = False
+
+    def result(self, timeout=None):
+        self.events.append(("wait", self.number))
+        return super().result(timeout)
+
+    def cancel(self):
+        self.cancel_requested = True
+        return super().cancel()
+
+
+def test_pipeline_submits_the_next_group_before_waiting_and_matches_sequential_scoring():
+    table = torch.full((7, 2), 0.1)
+    input_ids, attention_mask = _chunks(7)
+    sequential, sequential_encoded = score_chunks_early_exit(TablePredictor(table), input_ids, attention_mask,
+                                                             method="max", group_size=2, order="sequential")
+    submit = RecordingSubmit(table)
+    pipelined, pipelined_encoded = score_chunks_early_exit(submit, input_ids, attention_mask, method="max",
+                                                           group_size=2, order="sequential", pipeline=True)
+    assert torch.equal(pipelined, sequential) and pipelined_encoded == sequential_encoded == 7
+    # Группа k + 1 уже в очереди батчера, когда ждем результат группы k
+    assert submit.events[:3] == [("submit", 0), ("submit", 1), ("wait", 0)]
+    for k in range(1, 4):
+        assert submit.events.index(("submit", k)) < submit.events.index(("wait", k - 1))
+
+
+def test_pipeline_cancels_the_prefetched_group_after_an_early_exit():
+    table = torch.full((6, 2), 0.1)
+    table[0:2] = 0.95  # После первой группы обе метки положительны при max
+    input_ids, attention_mask = _chunks(6)
+    submit = RecordingSubmit(table)
+    probs, encoded = score_chunks_early_exit(submit, input_ids, attention_mask, method="max", threshold=THRESHOLD,
+                                             group_size=2, order="sequential", pipeline=True)
+    assert encoded == 2 and probs.shape == (2, 2)
+    assert len(submit.futures) == 2 and submit.futures[1].cancel_requested
+    assert ("wait", 1) not in submit.events
@@ -0,0 +1,52 @@
+import pytest
+import torch
+
+from src.modeling.export import (
+    check_onnx_parity,
+    export_model,
+    export_onnx,
+    load_inference_model,
+    load_state_dict_file,
+    quantize_dynamic_int8,
+)
+from src.modeling.models import ContractVulnerabilityClassifier
+
+SHAPES = ((1, 16), (3, 40), (4, 64))
+
+
+def test_onnx_export_matches_torch_and_drift_is_an_error(tiny_encoder_dir, tmp_path):
+    pytest.importorskip("onnxruntime")
+    torch.manual_seed(0)
+    model = ContractVulnerabilityClassifier(tiny_encoder_dir, num_labels=3, pretrained=False).eval()
+    onnx_path = export_onnx(model, str(tmp_path / "model.pt"))
+
+    assert check_onnx_parity(model, onnx_path, shapes=SHAPES, atol=1e-4) <= 1e-4
+
+    # Экспортированный граф больше не совпадает с моделью: ошибка и под python -O
+    with torch.no_grad():
+        model.classifier.bias += 1.0
+    with pytest.raises(RuntimeError, match="ONNX logits differ"):
+        check_onnx_parity(model, onnx_path, shapes=SHAPES, atol=1e-4)
+
+
+@pytest.mark.parametrize("variant", ["fp32", "int8"])
+def test_exported_variant_round_trips_through_load_inference_model(tiny_encoder_dir, tmp_path, variant):
+    torch.manual_seed(0)
+    model = ContractVulnerabilityClassifier(tiny_encoder_dir, num_labels=3, pretrained=False).eval()
+    model_path = str(tmp_path / "model.pt")
+    export_model(model, model_path, "fp32")
+    path = export_model(model, model_path, variant)
+
+    # Тот же weights_only-загрузчик, что и в сервисе: int8-чекпоинт состоит из квантованных тензоров
+    state_dict = load_state_dict_file(path, mmap=variant != "int8")
+    assert state_dict.keys() == torch.load(path, map_location="cpu", weights_only=False).keys()
+
+    loaded = load_inference_model(model_path, tiny_encoder_dir, num_labels=3, variant=variant)
+    reference = quantize_dynamic_int8(model) if variant == "int8" else model
+    input_ids = torch.randint(5, 500, (3, 24))
+    attention_mask = torch.ones_like(input_ids)
+    attention_mask[1, 12:] = 0
+    with torch.no_grad():
+        torch.testing.assert_close(loaded(input_ids, attention_mask), reference(input_ids, attention_mask))
+        embeddings = loaded.encode_chunks(input_ids, attention_mask)
+        torch.testing.assert_close(loaded.classify_embeddings(embeddings), reference(input_ids, attention_mask))
@@ -0,0 +1,103 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from config import main_config
+from src.data_processing.loader import DatasetWriter, dataset_num_rows, iter_dataset, load_dataset
+
+FORMATS = [".csv", ".parquet", ".feather"]
+NUM_ROWS = 23
+
+
+def _frame(start: int = 0, stop: int = NUM_ROWS) -> pd.DataFrame:
+    return pd.DataFrame({
+        "row": range(start, stop),
+        "sourcecode": [f"contract C{i} {{ }}" for i in range(start, stop)],
+        "label": [i % 3 for i in range(start, stop)],
+    })
+
+
+@pytest.fixture
+def written(tmp_path, monkeypatch, request):
+    """Датасет, записанный DatasetWriter батчами разного размера; в Parquet - row group'ы по 4 строки."""
+    monkeypatch.setattr(main_config, "PARQUET_ROW_GROUP_SIZE", 4)
+    filename = f"data{request.param}"
+    writer = DatasetWriter(filename, tmp_path)
+    for start, stop in [(0, 7), (7, 8), (8, 20), (20, NUM_ROWS)]:
+        writer.write(_frame(start, stop))
+        assert not (tmp_path / filename).exists()  # До close() итогового файла нет
+    assert writer.close() == tmp_path / filename
+    assert writer.num_rows == NUM_ROWS
+    assert [path.name for path in tmp_path.iterdir()] == [filename]  # Временный файл переименован
+    return filename, tmp_path
+
+
+@pytest.mark.parametrize("written", FORMATS, indirect=True)
+def test_writer_round_trip(written):
+    filename, data_dir = written
+    pd.testing.assert_frame_equal(load_dataset(filename, data_dir, pyarrow_strings=False), _frame())
+    assert dataset_num_rows(filename, data_dir) == NUM_ROWS
+
+
+def test_parquet_writer_uses_configured_row_groups(tmp_path, monkeypatch):
+    monkeypatch.setattr(main_config, "PARQUET_ROW_GROUP_SIZE", 4)
+    writer = DatasetWriter("data.parquet", tmp_path)
+    writer.write(_frame(0, 10))
+    writer.close()
+    metadata = pq.ParquetFile(tmp_path / "data.parquet").metadata
+    assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [4, 4, 2]
+
+
+def test_abort_keeps_the_previous_file(tmp_path):
+    writer = DatasetWriter("data.parquet", tmp_path)
+    writer.write(_frame(0, 5))
+    writer.close()
+    interrupted = DatasetWriter("data.parquet", tmp_path)
+    interrupted.write(_frame(5, 9))
+    interrupted.abort()
+    assert [path.name for path in tmp_path.iterdir()] == ["data.parquet"]
+    pd.testing.assert_frame_equal(load_dataset("data.parquet", tmp_path, pyarrow_strings=False), _frame(0, 5))
+
+
+@pytest.mark.parametrize("written", FORMATS, indirect=True)
+@pytest.mark.parametrize("batch_size", [1, 5, 8, NUM_ROWS, 100])
+def test_iter_dataset_yields_full_batches_in_file_order(written, batch_size):
+    filename, data_dir = written
+    frames = list(iter_dataset(filename, data_dir, batch_size=batch_size, pyarrow_strings=False))
+    # Все батчи полные, кроме последнего - независимо от границ row group'ов
+    assert [len(df) for df in frames[:-1]] == [batch_size] * (len(frames) - 1)
+    assert 0 < len(frames[-1]) <= batch_size
+    pd.testing.assert_frame_equal(pd.concat(frames, ignore_index=True), _frame())
+
+
+@pytest.mark.parametrize("written", FORMATS, indirect=True)
+@pytest.mark.parametrize("skip_rows", [0, 3, 4, 9, 16, NUM_ROWS - 1, NUM_ROWS])
+def test_iter_dataset_resumes_after_skip_rows(written, skip_rows):
+    filename, data_dir = written
+    frames = list(iter_dataset(filename, data_dir, columns_to_load=["row", "sourcecode"], batch_size=5,
+                               skip_rows=skip_rows, pyarrow_strings=False))
+    assert sum(len(df) for df in frames) == NUM_ROWS - skip_rows
+    if skip_rows < NUM_ROWS:
+        expected = _frame()[["row", "sourcecode"]].iloc[skip_rows:].reset_index(drop=True)
+        pd.testing.assert_frame_equal(pd.concat(frames, ignore_index=True), expected)
+
+
+@pytest.mark.parametrize("written", FORMATS, indirect=True)
+def test_iter_dataset_filters_match_load_dataset(written):
+    filename, data_dir = written
+    filters = [("label", "!=", 1), ("row", ">=", 5)]
+    streamed = pd.concat(iter_dataset(filename, data_dir, batch_size=4, filters=filters, pyarrow_strings=False),
+                         ignore_index=True)
+    frame = _frame()
+    expected = frame[(frame["label"] != 1) & (frame["row"] >= 5)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(streamed, expected)
+    pd.testing.assert_frame_equal(load_dataset(filename, data_dir, filters=filters, pyarrow_strings=False), expected)
+
+
+@pytest.mark.parametrize("written", [".parquet"], indirect=True)
+def test_iter_dataset_rejects_skip_rows_with_filters_and_bad_batch_size(written):
+    filename, data_dir = written
+    with pytest.raises(ValueError):
+        next(iter_dataset(filename, data_dir, skip_rows=2, filters=[("label", "==", 0)]))
+    with pytest.raises(ValueError):
+        next(iter_dataset(filename, data_dir, batch_size=0))
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+import torch
+from sklearn.metrics import f1_score
+
+from src.modeling.metrics import StreamingMultiLabelMetrics
+from src.modeling.trainer import calculate_metrics
+
+THRESHOLDS = (0.3, 0.5)
+NUM_BINS = 1000
+
+
+def _data(num_samples: int = 203, num_labels: int = 5, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    labels = (rng.random((num_samples, num_labels)) < [0.5, 0.2, 0.05, 0.7, 0.0]).astype(np.float32)
+    # Вероятности немного коррелируют с метками, чтобы метрики не были тривиальными
+    probs = np.clip(rng.random((num_samples, num_labels)) * 0.7 + labels * 0.25, 0.0, 1.0).astype(np.float32)
+    return probs, labels
+
+
+def _streamed(probs: np.ndarray, labels: np.ndarray, batch_size: int) -> StreamingMultiLabelMetrics:
+    metrics = StreamingMultiLabelMetrics(probs.shape[1], torch.device("cpu"), thresholds=THRESHOLDS, num_bins=NUM_BINS)
+    for start in range(0, len(probs), batch_size):
+        metrics.update(torch.from_numpy(probs[start:start + batch_size]), torch.from_numpy(labels[start:start + batch_size]))
+    return metrics
+
+
+@pytest.mark.parametrize("batch_size", [1, 17, 64, 1000])
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+def test_streaming_metrics_match_calculate_metrics(batch_size, threshold):
+    probs, labels = _data()
+    streamed = _streamed(probs, labels, batch_size).compute(threshold)
+    expected = calculate_metrics(probs, labels, threshold=threshold)
+
+    assert set(streamed) == set(expected)
+    for key in expected:
+        if key == "roc_auc_macro":
+            # Гистограмма ROC AUC: погрешность порядка 1 / num_bins
+            assert streamed[key] == pytest.approx(expected[key], abs=5.0 / NUM_BINS)
+        else:
+            assert streamed[key] == pytest.approx(expected[key], abs=1e-12), key
+
+
+def test_roc_auc_is_exact_when_scores_fall_into_distinct_bins():
+    rng = np.random.default_rng(1)
+    num_samples = 150
+    labels = (rng.random((num_samples, 3)) < 0.4).astype(np.float32)
+    # Центры различных корзин: ни одной пары в одной корзине, гистограмма не теряет порядок
+    bins = np.stack([rng.choice(NUM_BINS, num_samples, replace=False) for _ in range(3)], axis=1)
+    probs = ((bins + 0.5) / NUM_BINS).astype(np.float32)
+    streamed = _streamed(probs, labels, 32).compute(0.5)
+    assert streamed["roc_auc_macro"] == pytest.approx(calculate_metrics(probs, labels)["roc_auc_macro"], abs=1e-9)
+
+
+def test_f1_per_label_matches_sklearn():
+    probs, labels = _data(seed=2)
+    streamed = _streamed(probs, labels, 50)
+    for threshold in THRESHOLDS:
+        expected = f1_score(labels, (probs > threshold).astype(int), average=None, zero_division=0)
+        np.testing.assert_allclose(streamed.f1_per_label(threshold), expected, atol=1e-12)
+
+
+def test_empty_accumulator_reports_zeros():
+    metrics = StreamingMultiLabelMetrics(3, torch.device("cpu"), thresholds=THRESHOLDS, num_bins=NUM_BINS)
+    assert all(value == 0.0 for value in metrics.compute(0.5).values())
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data_processing.preprocessing import clean_code_column, clean_solidity_code, hash_split_mask, split_keys
+
+# (исходник, ожидаемый результат): строки не трогаем, комментарий между токенами -> пробел
+CLEANING_CASES = [
+    ('string url = "https://example.com/a//b"; // site', 'string url = "https://example.com/a//b";'),
+    ('s = "say \\"hi\\" // not a comment"; x;', 's = "say \\"hi\\" // not a comment"; x;'),
+    ("p = '/* kept */'; /* dropped */ q;", "p = '/* kept */'; q;"),
+    ("q = 'it\\'s // fine'; // dropped", "q = 'it\\'s // fine';"),
+    ('e = "\\\\"; // escaped backslash ends the literal', 'e = "\\\\";'),
+    ("a /* // inside a block comment */ b", "a b"),
+    ("a // line comment with /* inside\nb", "a b"),
+    ("a/*x*/b", "a b"),
+    ("/// @notice NatSpec\n/** @dev block NatSpec */ function f() {}", "function f() {}"),
+    ("x = 10 / 2 / 5; y = a/b;", "x = 10 / 2 / 5; y = a/b;"),
+    ("uint x = 1; /* unterminated\n comment", "uint x = 1;"),
+    ("a\r\n\n\t  b", "a b"),
+    ("", ""),
+    (None, ""),
+]
+
+
+@pytest.mark.parametrize("source,expected", CLEANING_CASES)
+def test_clean_solidity_code(source, expected):
+    assert clean_solidity_code(source) == expected
+
+
+@pytest.mark.parametrize("n_jobs,chunk_size", [(1, 1000), (2, 4)])
+def test_clean_code_column_keeps_order_and_index(n_jobs, chunk_size):
+    sources = pd.Series([case[0] for case in CLEANING_CASES] * 3, index=range(100, 100 + 3 * len(CLEANING_CASES)))
+    cleaned = clean_code_column(sources, n_jobs=n_jobs, chunk_size=chunk_size)
+    assert cleaned.tolist() == [case[1] for case in CLEANING_CASES] * 3
+    assert cleaned.index.equals(sources.index)
+
+
+def test_clean_code_column_rejects_empty_chunks():
+    with pytest.raises(ValueError):
+        clean_code_column(pd.Series(["a"]), chunk_size=0)
+
+
+def test_rows_without_address_are_split_by_row_index():
+    addresses = pd.Series([None] * 1000, dtype=object)
+    keys = split_keys(addresses, row_start=5000)
+    assert keys.iloc[0] == "row:5000" and keys.nunique() == 1000
+    is_test = hash_split_mask(keys, test_size=0.2, seed=42)
+    assert 0.1 < is_test.mean() < 0.3  # Не все строки без адреса в одной части
+
+    # Адреса сохраняются; ключ не зависит от границ батчей
+    mixed = pd.Series(["0xabc", None, "0xabc", None])
+    full = hash_split_mask(split_keys(mixed), seed=42)
+    batched = np.concatenate([hash_split_mask(split_keys(mixed[:2], 0), seed=42),
+                              hash_split_mask(split_keys(mixed[2:], 2), seed=42)])
+    assert split_keys(mixed).tolist() == ["0xabc", "row:1", "0xabc", "row:3"]
+    assert full.tolist() == batched.tolist() and full[0] == full[2]
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+import torch
+from fastapi.testclient import TestClient
+
+from config import main_config
+from src.api import fastapi_service as service
+from src.api.readiness import ModelLoadStatus
+from tests.helpers import SOLIDITY_SAMPLES
+
+INFERENCE_GLOBALS = ["backend", "tokenizer", "embedding_cache", "batcher", "result_cache", "_model_id",
+                     "worker_pool", "_pool_predict_fn"]
+
+
+@pytest.fixture
+def tiny_service(monkeypatch, tiny_encoder_dir, tiny_checkpoint):
+    """Сервис, который в lifespan загружает крошечный чекпоинт; глобальное состояние откатывается после теста."""
+    for name in INFERENCE_GLOBALS:
+        monkeypatch.setattr(service, name, None)
+    monkeypatch.setattr(service, "load_status", ModelLoadStatus())
+    monkeypatch.setattr(service, "device", torch.device("cpu"))
+    monkeypatch.setattr(service, "MODEL_PATH", tiny_checkpoint)
+    monkeypatch.setattr(service, "MODEL_BASE_NAME", tiny_encoder_dir)
+    monkeypatch.setattr(service, "MODEL_NUM_HIDDEN_LAYERS", None)
+    monkeypatch.setattr(service, "TOKENIZER_NAME", tiny_encoder_dir)
+    monkeypatch.setattr(main_config, "INFERENCE_BACKEND", "torch")
+    monkeypatch.setattr(main_config, "INFERENCE_MODEL_VARIANT", "fp32")
+    monkeypatch.setattr(main_config, "INFERENCE_WORKER_MODE", "thread")
+    monkeypatch.setattr(main_config, "RESULT_CACHE_ENABLED", False)
+    monkeypatch.setattr(main_config, "EMBEDDING_CACHE_ENABLED", False)
+    return monkeypatch
+
+
+def _wait_until_ready(client: TestClient, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get("/api/health/ready")
+        if response.status_code == 200 or time.monotonic() > deadline:
+            return response
+        time.sleep(0.05)
+
+
+def test_not_ready_before_the_lifespan_runs(tiny_service):
+    response = TestClient(service.app).get("/api/health/ready")
+    assert response.status_code == 503 and response.json()["state"] == "pending"
+    # Пока модель не загружена, анализ тоже отвечает 503, а не падает
+    assert TestClient(service.app).post("/api/analyze", json={"code": SOLIDITY_SAMPLES[0]}).status_code == 503
+
+
+def test_background_load_answers_503_until_the_model_is_ready(tiny_service):
+    release = threading.Event()
+    create_backend = service.create_backend
+
+    def slow_create_backend(*args, **kwargs):
+        assert release.wait(60)
+        return create_backend(*args, **kwargs)
+
+    tiny_service.setattr(main_config, "INFERENCE_LOAD_IN_BACKGROUND", True)
+    tiny_service.setattr(service, "create_backend", slow_create_backend)
+    try:
+        with TestClient(service.app) as client:
+            # Соединения принимаются сразу: liveness - 200, readiness и анализ - 503 со стадией загрузки
+            assert client.get("/api/health/live").status_code == 200
+            response = client.get("/api/health/ready")
+            assert response.status_code == 503 and response.json()["state"] == "loading"
+            assert client.post("/api/analyze", json={"code": SOLIDITY_SAMPLES[0]}).status_code == 503
+
+            release.set()
+            response = _wait_until_ready(client)
+            assert response.status_code == 200
+            status = response.json()
+            assert status["state"] == "ready" and status["error"] is None
+            assert set(status["stages_s"]) == {"model", "tokenizer", "workers"}
+            analyzed = client.post("/api/analyze", json={"code": SOLIDITY_SAMPLES[0]})
+            assert analyzed.status_code == 200 and "vulnerabilities" in analyzed.json()
+    finally:
+        release.set()
+
+
+def test_foreground_load_is_ready_when_the_lifespan_starts(tiny_service):
+    tiny_service.setattr(main_config, "INFERENCE_LOAD_IN_BACKGROUND", False)
+    with TestClient(service.app) as client:
+        assert client.get("/api/health/ready").status_code == 200
+
+
+def test_failed_load_reports_the_error(tiny_service, tmp_path):
+    tiny_service.setattr(main_config, "INFERENCE_LOAD_IN_BACKGROUND", False)
+    tiny_service.setattr(service, "MODEL_PATH", str(tmp_path / "missing.pt"))
+    with TestClient(service.app) as client:
+        response = client.get("/api/health/ready")
+        assert response.status_code == 503
+        status = response.json()
+        assert status["state"] == "failed" and "missing.pt" in status["error"]
+        assert client.get("/api/health/live").status_code == 200
+        # Загрузка не идет и уже не завершится: 500, а не "повторите позже"
+        assert client.post("/api/analyze", json={"code": SOLIDITY_SAMPLES[0]}).status_code == 500
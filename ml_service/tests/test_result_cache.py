@@ -0,0 +1,44 @@
+import numpy as np
+
+from src.api import result_cache
+from src.api.result_cache import ResultCache, early_exit_variant, make_cache_key
+
+
+def test_cache_key_separates_early_exit_settings():
+    code = "contract A { function f() public {} }"
+    full = make_cache_key(code, "model")
+    max_half = make_cache_key(code, "model", result_variant=early_exit_variant("max", 3, 0.5))
+    keys = {
+        full,
+        max_half,
+        make_cache_key(code, "model", result_variant=early_exit_variant("mean", 3, 0.5)),
+        make_cache_key(code, "model", result_variant=early_exit_variant("max", 3, 0.7)),
+        make_cache_key(code, "model", result_variant=early_exit_variant("topk_mean", 2, 0.5)),
+    }
+    assert len(keys) == 5
+    assert make_cache_key(code, "model", result_variant=early_exit_variant("max", 3, 0.5)) == max_half
+
+
+def test_cache_key_covers_the_exact_source():
+    # Пробелы и переводы строк меняют токены BPE: такие входы не должны делить результат
+    code = "contract A { function f() public {} }"
+    variants = [code, code + "\n", code + "  ", code.replace(" ", "\t", 1), code.replace("\n", "\r\n") + "\r\n"]
+    assert len({make_cache_key(variant, "model") for variant in variants}) == len(variants)
+
+
+def test_disk_hit_keeps_the_stored_expiry(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: clock[0])
+    cache = ResultCache(max_bytes=2**20, ttl_seconds=100, sqlite_path=str(tmp_path / "results.sqlite3"))
+    value = np.ones((2, 3), dtype=np.float32)
+    cache.put("key", value)  # Истекает в 1100
+
+    clock[0] = 1050.0
+    cache._entries.clear()  # Как после рестарта: запись есть только на диске
+    cache._bytes = 0
+    assert np.array_equal(cache.get("key"), value)
+    assert cache.disk_hits == 1
+
+    clock[0] = 1101.0  # Повышенная в память запись истекает вместе с дисковой, а не в 1150
+    assert cache.get("key") is None
+    assert cache.expirations >= 1
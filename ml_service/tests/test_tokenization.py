@@ -0,0 +1,157 @@
+import random
+
+import pytest
+import torch
+
+from src.feature_engineering.tokenization import (
+    _tokenize_and_chunk_code_reencode,
+    chunk_token_ids,
+    get_tokenizer,
+    tokenize_and_chunk_batch,
+    tokenize_and_chunk_code,
+)
+from tests.helpers import SOLIDITY_SAMPLES
+
+CLS, SEP, PAD = 0, 2, 1
+
+
+def _check_chunks(num_tokens: int, chunk_size: int, overlap: int) -> None:
+    token_ids = list(range(10, 10 + num_tokens))
+    input_ids, attention_mask = chunk_token_ids(token_ids, CLS, SEP, PAD, chunk_size=chunk_size, overlap=overlap)
+    body, stride = chunk_size - 2, chunk_size - overlap
+    assert input_ids.shape[1] == chunk_size and attention_mask.shape == input_ids.shape
+    if num_tokens == 0:
+        assert input_ids.shape[0] == 0
+        return
+
+    covered = 0
+    for row, (ids, mask) in enumerate(zip(input_ids, attention_mask)):
+        length = int(mask.sum()) - 2
+        assert 0 < length <= body
+        assert mask[:length + 2].all() and not mask[length + 2:].any()
+        assert ids[0] == CLS and ids[length + 1] == SEP and (ids[length + 2:] == PAD).all()
+        # Окно row начинается с токена row * stride исходного потока
+        assert ids[1:length + 1].tolist() == token_ids[row * stride:row * stride + length]
+        assert row * stride <= covered  # Без разрывов между окнами
+        covered = row * stride + length
+    assert covered == num_tokens
+    # Последнее окно нужно: без него контент не покрыт
+    assert (input_ids.shape[0] - 1) * stride < num_tokens
+
+
+@pytest.mark.parametrize("chunk_size,overlap", [(16, 2), (16, 3), (16, 8), (16, 14), (512, 2), (512, 64), (512, 510)])
+def test_chunk_geometry_edges(chunk_size, overlap):
+    body, stride = chunk_size - 2, chunk_size - overlap
+    sizes = {0, 1, body - 1, body, body + 1, body + stride - 1, body + stride, body + stride + 1,
+             body + 3 * stride, 4094}
+    for num_tokens in sorted(size for size in sizes if size >= 0):
+        _check_chunks(num_tokens, chunk_size, overlap)
+
+
+@pytest.mark.parametrize("overlap", [-1, 0, 1, 511, 512, 600])
+def test_invalid_overlap_is_rejected(overlap):
+    with pytest.raises(ValueError):
+        chunk_token_ids(list(range(600)), CLS, SEP, PAD, chunk_size=512, overlap=overlap)
+
+
+def test_single_window_wraps_content():
+    input_ids, attention_mask = chunk_token_ids([7, 8, 9], CLS, SEP, PAD, chunk_size=8, overlap=2)
+    assert input_ids.tolist() == [[CLS, 7, 8, 9, SEP, PAD, PAD, PAD]]
+    assert attention_mask.tolist() == [[1, 1, 1, 1, 1, 0, 0, 0]]
+    assert input_ids.dtype == torch.long
+
+
+# --- сравнение с устаревшим чанкером (decode -> re-encode) на крошечном токенизаторе ---
+
+CHUNK_SIZE, MAX_TOTAL = 16, 96
+
+
+@pytest.fixture(scope="module")
+def tokenizer(tiny_encoder_dir):
+    return get_tokenizer(tiny_encoder_dir)
+
+
+def _content(chunk, tokenizer):
+    """Токены чанка под маской внимания без <s>/</s>."""
+    ids = chunk['input_ids'][chunk['attention_mask'].bool()].tolist()
+    return [t for t in ids if t not in (tokenizer.cls_token_id, tokenizer.sep_token_id)]
+
+
+def _source_ids(code, tokenizer, max_total_tokens=MAX_TOTAL):
+    return tokenizer(code, add_special_tokens=False, truncation=True, max_length=max_total_tokens - 2)['input_ids']
+
+
+def _aligned_code(tokenizer, num_tokens):
+    """
+    Код из слов контрактов, каждое из которых (с ведущим пробелом) - ровно один токен.
+    Декодирование любого окна такого потока и повторная токенизация дают те же ID,
+    так что сравнение с устаревшим чанкером не зависит от разрезов посреди слова.
+    """
+    words = sorted({
+        word for sample in SOLIDITY_SAMPLES for word in sample.split()
+        if word.isalnum() and len(tokenizer(" " + word, add_special_tokens=False)['input_ids']) == 1
+    })
+    assert len(words) >= 4
+    rng = random.Random(num_tokens)
+    return "".join(" " + rng.choice(words) for _ in range(num_tokens))
+
+
+@pytest.mark.parametrize("overlap", [2, 5, CHUNK_SIZE - 2])
+@pytest.mark.parametrize("num_tokens", [1, CHUNK_SIZE - 3, CHUNK_SIZE - 2, CHUNK_SIZE - 1, 40, MAX_TOTAL - 2, MAX_TOTAL + 10])
+def test_id_chunker_matches_legacy_chunker_up_to_the_documented_shift(tokenizer, overlap, num_tokens):
+    code = _aligned_code(tokenizer, num_tokens)
+    source = _source_ids(code, tokenizer)
+    assert len(source) == min(num_tokens, MAX_TOTAL - 2)  # MAX_TOTAL - 2 токена - ровно max_total_tokens с <s>/</s>
+
+    new = tokenize_and_chunk_code(code, tokenizer, MAX_TOTAL, CHUNK_SIZE, overlap)
+    legacy = _tokenize_and_chunk_code_reencode(code, tokenizer, MAX_TOTAL, CHUNK_SIZE, overlap)
+    body, stride = CHUNK_SIZE - 2, CHUNK_SIZE - overlap
+    assert len(new) == len(legacy)
+
+    if len(source) <= body:
+        # Один чанк: устаревший путь декодирует вместе со спецтокенами и может потерять хвост
+        assert len(new) == 1 and _content(new[0], tokenizer) == source
+        legacy_content = _content(legacy[0], tokenizer)
+        assert legacy_content == source[:len(legacy_content)] and len(legacy_content) >= len(source) - 2
+        return
+
+    for k, (new_chunk, legacy_chunk) in enumerate(zip(new, legacy)):
+        assert _content(new_chunk, tokenizer) == source[k * stride:k * stride + body]
+        # Устаревшие окна режутся из потока с <s>: начиная со второго, на токен левее
+        legacy_start = 0 if k == 0 else k * stride - 1
+        assert _content(legacy_chunk, tokenizer) == source[legacy_start:legacy_start + body]
+
+
+@pytest.mark.parametrize("code", ["", "   ", "\n\t\n"])
+def test_empty_input_gives_no_chunks_in_both_chunkers(tokenizer, code):
+    assert tokenize_and_chunk_code(code, tokenizer, MAX_TOTAL, CHUNK_SIZE, 4) == []
+    assert _tokenize_and_chunk_code_reencode(code, tokenizer, MAX_TOTAL, CHUNK_SIZE, 4) == []
+
+
+@pytest.mark.parametrize("overlap", [2, 6, CHUNK_SIZE - 2])
+def test_real_contracts_reproduce_the_source_stream_with_the_legacy_chunk_count(tokenizer, overlap):
+    contracts = SOLIDITY_SAMPLES + ["\n".join(SOLIDITY_SAMPLES) * 2]
+    body, stride = CHUNK_SIZE - 2, CHUNK_SIZE - overlap
+    for code in contracts:
+        source = _source_ids(code, tokenizer)
+        new = tokenize_and_chunk_code(code, tokenizer, MAX_TOTAL, CHUNK_SIZE, overlap)
+        legacy = _tokenize_and_chunk_code_reencode(code, tokenizer, MAX_TOTAL, CHUNK_SIZE, overlap)
+        assert len(new) == len(legacy) > 1
+        for k, chunk in enumerate(new):
+            assert _content(chunk, tokenizer) == source[k * stride:k * stride + body]
+            assert chunk['input_ids'].shape == (CHUNK_SIZE,)
+        # Первое окно совпадает с устаревшим с точностью до ретокенизации последнего (разрезанного) слова
+        legacy_first = _content(legacy[0], tokenizer)
+        assert legacy_first[:body // 2] == source[:body // 2]
+
+
+def test_batch_chunker_matches_single_contract_chunker(tokenizer):
+    codes = ["", SOLIDITY_SAMPLES[0], "  ", _aligned_code(tokenizer, MAX_TOTAL + 10), SOLIDITY_SAMPLES[2]]
+    batch = tokenize_and_chunk_batch(codes, tokenizer, MAX_TOTAL, CHUNK_SIZE, 4)
+    for i, code in enumerate(codes):
+        single = tokenize_and_chunk_code(code, tokenizer, MAX_TOTAL, CHUNK_SIZE, 4)
+        rows = slice(int(batch['offsets'][i]), int(batch['offsets'][i + 1]))
+        assert batch['input_ids'][rows].shape[0] == len(single)
+        if single:
+            assert torch.equal(batch['input_ids'][rows], torch.stack([c['input_ids'] for c in single]))
+            assert torch.equal(batch['attention_mask'][rows], torch.stack([c['attention_mask'] for c in single]))
@@ -0,0 +1,164 @@
+import time
+
+import pytest
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Dataset
+
+from config import main_config
+from src.modeling.checkpointing import latest_checkpoint, load_checkpoint
+from src.modeling.models import ContractVulnerabilityClassifier
+from src.modeling.trainer import autocast_context, train_epoch, train_model
+
+NUM_LABELS = 3
+CHUNK_SIZE = 16
+
+
+class _Interrupted(Exception):
+    pass
+
+
+class ChunkItems(Dataset):
+    """Готовые чанки; с `fail_after` чтение падает после стольких элементов - как прерванный запуск."""
+    def __init__(self, num_items: int, seed: int, fail_after: int = None):
+        generator = torch.Generator().manual_seed(seed)
+        self.items = [{
+            "input_ids": torch.randint(5, 500, (CHUNK_SIZE,), generator=generator),
+            "attention_mask": torch.ones(CHUNK_SIZE, dtype=torch.long),
+            "labels": torch.randint(0, 2, (NUM_LABELS,), generator=generator).float(),
+        } for _ in range(num_items)]
+        self.fail_after = fail_after
+        self.fetched = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if self.fail_after is not None and self.fetched >= self.fail_after:
+            raise _Interrupted()
+        self.fetched += 1
+        return self.items[index]
+
+
+@pytest.fixture
+def mlflow_tmp(tmp_path, monkeypatch):
+    monkeypatch.setattr(main_config, "MLFLOW_TRACKING_URI", f"sqlite:///{tmp_path / 'mlflow.db'}")
+
+
+def _new_model(config_dir: str) -> ContractVulnerabilityClassifier:
+    torch.manual_seed(0)
+    return ContractVulnerabilityClassifier(config_dir, num_labels=NUM_LABELS, pretrained=False)
+
+
+def _train(model, checkpoint_dir, save_path, fail_after=None, resume_from=None, seed=1, **kwargs):
+    # Перемешивание и dropout зависят от глобального RNG
+    torch.manual_seed(seed)
+    train_loader = DataLoader(ChunkItems(12, seed=2, fail_after=fail_after), batch_size=2, shuffle=True)
+    val_loader = DataLoader(ChunkItems(4, seed=3), batch_size=2)
+    params = dict(num_epochs=2, learning_rate=1e-3, grad_accum_steps=2, mlflow_experiment_name="test",
+                  model_save_path=str(save_path), checkpoint_dir=str(checkpoint_dir), checkpoint_every_n_steps=1,
+                  keep_last_checkpoints=20, resume_from=resume_from)
+    params.update(kwargs)
+    return train_model(model, train_loader, val_loader, **params)
+
+
+def _wait_for_checkpoint(directory, global_step: int, timeout: float = 60.0):
+    """Прерванный запуск не закрыл писателя: ждем, пока фоновый поток допишет нужный чекпоинт."""
+    deadline = time.monotonic() + timeout
+    path = directory / f"checkpoint_{global_step:09d}.pt"
+    while not path.exists():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{path} was not written")
+        time.sleep(0.05)
+    return path
+
+
+def test_interrupted_run_resumes_to_the_same_weights(tiny_encoder_dir, tmp_path, mlflow_tmp):
+    reference = _train(_new_model(tiny_encoder_dir), tmp_path / "reference", tmp_path / "reference.pt")
+
+    # 6 батчей по 2 на эпоху, шаг оптимизатора раз в 2 батча. Вторая эпоха падает на чтении батча 3:
+    # батч 2 уже прошел forward/backward, а последний чекпоинт - после батча 1 (шаг 4)
+    interrupted_dir = tmp_path / "interrupted"
+    with pytest.raises(_Interrupted):
+        _train(_new_model(tiny_encoder_dir), interrupted_dir, tmp_path / "interrupted.pt", fail_after=12 + 6)
+    checkpoint_path = _wait_for_checkpoint(interrupted_dir, global_step=4)
+    state = load_checkpoint(str(checkpoint_path))
+    assert (state["epoch"], state["batches_done"], state["global_step"]) == (1, 2, 4)
+    assert latest_checkpoint(interrupted_dir) == checkpoint_path
+
+    # Другой стартовый RNG и другая инициализация: все должно прийти из чекпоинта
+    torch.manual_seed(123)
+    resumed_model = ContractVulnerabilityClassifier(tiny_encoder_dir, num_labels=NUM_LABELS, pretrained=False)
+    resumed = _train(resumed_model, interrupted_dir, tmp_path / "resumed.pt", resume_from="latest", seed=123)
+
+    initial = _new_model(tiny_encoder_dir)
+    assert not all(torch.equal(a, b) for a, b in zip(reference.parameters(), initial.parameters()))
+    for (name, expected), actual in zip(reference.state_dict().items(), resumed.state_dict().values()):
+        torch.testing.assert_close(actual, expected, msg=lambda message: f"{name}: {message}")
+
+
+class BagOfTokens(nn.Module):
+    """Модель без dropout: результат обучения зависит только от данных и шагов оптимизатора."""
+    def __init__(self, num_labels: int = NUM_LABELS):
+        super().__init__()
+        torch.manual_seed(0)
+        self.num_labels = num_labels
+        self.embedding = nn.Embedding(500, 8)
+        self.classifier = nn.Linear(8, num_labels)
+
+    def forward(self, input_ids, attention_mask):
+        mask = attention_mask.unsqueeze(-1).to(self.embedding.weight.dtype)
+        pooled = (self.embedding(input_ids) * mask).sum(dim=1) / mask.sum(dim=1)
+        return self.classifier(pooled)
+
+
+def _train_epoch(model, batch_size: int, grad_accum_steps: int, num_items: int = 8, precision: str = "fp32"):
+    steps = []
+    loss, metrics = train_epoch(model, DataLoader(ChunkItems(num_items, seed=4), batch_size=batch_size),
+                                torch.optim.SGD(model.parameters(), lr=0.5), nn.BCEWithLogitsLoss(),
+                                torch.device("cpu"), epoch_num=0, num_epochs=1, precision=precision,
+                                grad_accum_steps=grad_accum_steps, on_optimizer_step=steps.append)
+    return loss, metrics, steps
+
+
+def test_autocast_context_per_precision():
+    cpu = torch.device("cpu")
+    a, b = torch.randn(4, 4), torch.randn(4, 4)
+    with autocast_context(cpu, "fp32"):
+        assert (a @ b).dtype == torch.float32
+    with autocast_context(cpu, "bf16"):
+        assert (a @ b).dtype == torch.bfloat16
+    with pytest.raises(ValueError):
+        autocast_context(cpu, "fp16")  # fp16 - только CUDA с GradScaler
+    with pytest.raises(ValueError):
+        autocast_context(cpu, "int8")
+
+
+def test_accumulated_micro_batches_equal_one_large_batch():
+    accumulated, large = BagOfTokens(), BagOfTokens()
+    _, _, accumulated_steps = _train_epoch(accumulated, batch_size=2, grad_accum_steps=2)
+    _, _, large_steps = _train_epoch(large, batch_size=4, grad_accum_steps=1)
+    # Loss микро-батча делится на grad_accum_steps: сумма градиентов - градиент среднего по 4 примерам
+    assert accumulated_steps == [2, 4] and large_steps == [1, 2]
+    for expected, actual in zip(large.parameters(), accumulated.parameters()):
+        torch.testing.assert_close(actual, expected)
+
+
+def test_incomplete_last_accumulation_group_still_steps():
+    _, _, steps = _train_epoch(BagOfTokens(), batch_size=2, grad_accum_steps=2, num_items=6)
+    assert steps == [2, 3]
+
+
+def test_bf16_epoch_keeps_fp32_weights_and_matches_fp32_loosely():
+    fp32_model, bf16_model = BagOfTokens(), BagOfTokens()
+    fp32_loss, _, _ = _train_epoch(fp32_model, batch_size=2, grad_accum_steps=1)
+    bf16_loss, metrics, _ = _train_epoch(bf16_model, batch_size=2, grad_accum_steps=1, precision="bf16")
+    assert all(param.dtype == torch.float32 for param in bf16_model.parameters())
+    assert bf16_loss == pytest.approx(fp32_loss, rel=0.05) and "f1_micro" in metrics
+    for expected, actual in zip(fp32_model.parameters(), bf16_model.parameters()):
+        torch.testing.assert_close(actual, expected, rtol=0.05, atol=0.02)
+
+
+def test_fp16_training_on_cpu_is_rejected():
+    with pytest.raises(ValueError):
+        _train_epoch(BagOfTokens(), batch_size=2, grad_accum_steps=1, precision="fp16")
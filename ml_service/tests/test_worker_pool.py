@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import pytest
+import torch
+
+from config import main_config
+from src.api.worker_pool import InferenceWorkerPool, WorkerPoolSaturatedError, predict_code_probs_in_worker
+from tests.helpers import SOLIDITY_SAMPLES
+
+NUM_LABELS = len(main_config.VULNERABILITY_COUNT_COLUMNS)
+
+
+def _sleep_and_return_pid(seconds: float) -> int:
+    time.sleep(seconds)
+    return os.getpid()
+
+
+async def _run_while_busy(pool: InferenceWorkerPool):
+    """Занимает единственный слот пула и пробует поставить вторую задачу."""
+    busy = asyncio.create_task(pool.run(_sleep_and_return_pid, 1.0))
+    await asyncio.sleep(0.1)
+    with pytest.raises(WorkerPoolSaturatedError):
+        await pool.run(_sleep_and_return_pid, 0.0)
+    return await busy
+
+
+@pytest.fixture
+def process_pool(tiny_encoder_dir, tiny_checkpoint):
+    pool = InferenceWorkerPool(
+        num_workers=2, threads_per_worker=1, max_queue_size=0, mode="process",
+        process_initargs=(tiny_checkpoint, tiny_encoder_dir, NUM_LABELS, None, tiny_encoder_dir)
+    )
+    yield pool
+    pool.shutdown()
+
+
+def test_thread_mode_runs_tasks_and_leaves_torch_threads_alone():
+    threads_before = torch.get_num_threads()
+    pool = InferenceWorkerPool(num_workers=2, threads_per_worker=1, max_queue_size=0, mode="thread")
+    try:
+        assert pool.warmup() == []
+        assert asyncio.run(pool.run(_sleep_and_return_pid, 0.0)) == os.getpid()
+        assert torch.get_num_threads() == threads_before  # set_num_threads действует на весь процесс
+    finally:
+        pool.shutdown()
+
+
+def test_thread_mode_rejects_tasks_beyond_capacity():
+    pool = InferenceWorkerPool(num_workers=1, threads_per_worker=1, max_queue_size=0, mode="thread")
+    try:
+        asyncio.run(_run_while_busy(pool))
+        stats = pool.stats()
+        assert stats["rejected_total"] == 1 and stats["completed_total"] == 1 and stats["in_flight"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_process_mode_warmup_starts_every_worker(process_pool):
+    threads_before = torch.get_num_threads()
+    pids = process_pool.warmup(timeout=300)
+    assert len(set(pids)) == 2 and os.getpid() not in pids
+    assert torch.get_num_threads() == threads_before
+
+    probs = asyncio.run(process_pool.run(predict_code_probs_in_worker, SOLIDITY_SAMPLES[0]))
+    assert probs.ndim == 2 and probs.shape[1] == NUM_LABELS and probs.shape[0] >= 1
+    assert np.all((probs >= 0) & (probs <= 1))
+
+
+def test_process_mode_rejects_tasks_beyond_capacity(process_pool):
+    process_pool.warmup(timeout=300)
+
+    async def saturate():
+        # Оба процесса заняты, очереди нет: третья задача получает отказ
+        first = asyncio.create_task(process_pool.run(_sleep_and_return_pid, 1.0))
+        second = asyncio.create_task(process_pool.run(_sleep_and_return_pid, 1.0))
+        await asyncio.sleep(0.1)
+        with pytest.raises(WorkerPoolSaturatedError):
+            await process_pool.run(_sleep_and_return_pid, 0.0)
+        return await asyncio.gather(first, second)
+
+    assert len(set(asyncio.run(saturate()))) == 2
+    assert process_pool.stats()["rejected_total"] == 1